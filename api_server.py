@@ -0,0 +1,418 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import multiprocessing
+import os
+import time
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from src.czech_anonymization.core import (
+    ANONYMIZATION_METHODS, DEFAULT_RULES, DEFAULT_TIME_BUDGET, active_rules, detect_and_anonymize_pii,
+    get_pseudonymizer, load_rules, rules_from_config, set_active_rules
+)
+from src.czech_anonymization.profiling import PipelineProfiler, pipeline_profiler
+from src.czech_anonymization.rules import validate_rules
+from src.czech_anonymization.vault import DEFAULT_TTL as DEFAULT_VAULT_TTL, ReidentificationVault, result_pairs
+
+# Requests up to this size are collected into micro-batches, larger ones go to the pool alone
+MICRO_BATCH_MAX_CHARS = 20000
+MICRO_BATCH_MAX_SIZE = 32
+MICRO_BATCH_MAX_DELAY = 0.002
+LATENCY_WINDOW = 10000
+# A new rule set is checked on this many generated documents in a separate process,
+# which is killed when the check takes longer than the timeout (a pattern that
+# backtracks exponentially would never finish)
+RULES_SAMPLE_SIZE = 200
+RULES_VALIDATION_TIMEOUT = 120
+
+class AnonymizeRequest(BaseModel):
+    text: str
+    pii_types: Optional[List[str]] = None
+    method: str = ANONYMIZATION_METHODS[0]
+    # With a vault, the replacements are recorded under this id for /deanonymize
+    session_id: Optional[str] = None
+
+class BatchAnonymizeRequest(BaseModel):
+    texts: List[str]
+    pii_types: Optional[List[str]] = None
+    method: str = ANONYMIZATION_METHODS[0]
+
+class DeanonymizeRequest(BaseModel):
+    session_id: str
+    text: str
+
+class RulesRequest(BaseModel):
+    version: str
+    patterns: Dict[str, str]
+    prefilters: Optional[Dict[str, dict]] = None
+    priorities: Optional[Dict[str, int]] = None
+    recognizers: Optional[Dict[str, str]] = None
+
+# Settings of the current worker process, set once by the pool initializer
+_worker_settings = {'time_budget': DEFAULT_TIME_BUDGET}
+
+def _init_worker(profile, time_budget, rules_config=None):
+    pipeline_profiler.enabled = profile
+    _worker_settings['time_budget'] = time_budget
+    if rules_config is not None:
+        set_active_rules(rules_from_config(rules_config))
+    # Compiled before the pool takes requests
+    active_rules().engine(list(active_rules().patterns))
+
+def _worker_rules_version():
+    return active_rules().version
+
+def _anonymize_texts(texts, selected_pii_types, anonymization_method, with_pairs=False):
+    results = []
+    for text in texts:
+        result = detect_and_anonymize_pii(text, selected_pii_types, anonymization_method,
+                                          time_budget=_worker_settings['time_budget'])
+        results.append({'anonymized_text': result['anonymized_text'], 'entities': result['entities'].to_dicts(),
+                        'degraded': result['degraded'], 'rules_version': result['rules_version']})
+        if with_pairs:
+            # Taken out by the endpoint into the vault, never returned
+            results[-1]['pairs'] = result_pairs(result)
+    # Workers hand the profile collected since the previous call over with the results
+    return results, pipeline_profiler.drain() if pipeline_profiler.enabled else None
+
+class ServiceStats:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.started = time.time()
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.requests = collections.Counter()
+        self.documents = 0
+        self.degraded = 0
+        self.characters = 0
+        self.entities = collections.Counter()
+        self.batch_sizes = collections.Counter()
+        self.profiler = PipelineProfiler()
+
+    def record_request(self, endpoint, seconds):
+        self.latencies[endpoint].append(seconds)
+        self.requests[endpoint] += 1
+
+    def record(self, endpoint, seconds, results, characters):
+        self.record_request(endpoint, seconds)
+        self.documents += len(results)
+        self.degraded += sum(result['degraded'] for result in results)
+        self.characters += characters
+        for result in results:
+            self.entities.update(entity['type'] for entity in result['entities'])
+
+    def record_profile(self, profile):
+        if profile:
+            self.profiler.merge(profile)
+
+    @staticmethod
+    def percentiles(samples):
+        ordered = sorted(samples)
+        if not ordered:
+            return {}
+        # Nearest-rank percentiles over the most recent requests, in milliseconds
+        return {
+            name: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+            for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('p99.9', 0.999))
+        }
+
+    def snapshot(self):
+        return {
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'requests': dict(self.requests),
+            'documents': self.documents,
+            'degraded_documents': self.degraded,
+            'characters': self.characters,
+            'entities': dict(self.entities),
+            'latency_ms': {endpoint: self.percentiles(samples) for endpoint, samples in self.latencies.items()},
+            'micro_batch_sizes': dict(sorted(self.batch_sizes.items())),
+            'profile': self.profiler.snapshot()
+        }
+
+    def prometheus_text(self):
+        lines = [
+            '# HELP anonymizer_requests_total Requests per endpoint.',
+            '# TYPE anonymizer_requests_total counter'
+        ]
+        lines += [f'anonymizer_requests_total{{endpoint="{endpoint}"}} {count}'
+                  for endpoint, count in sorted(self.requests.items())]
+        lines += [
+            '# HELP anonymizer_documents_total Anonymized documents.',
+            '# TYPE anonymizer_documents_total counter',
+            f'anonymizer_documents_total {self.documents}',
+            '# HELP anonymizer_degraded_documents_total Documents finished in the coarse mode after the time budget.',
+            '# TYPE anonymizer_degraded_documents_total counter',
+            f'anonymizer_degraded_documents_total {self.degraded}',
+            '# HELP anonymizer_characters_total Characters of anonymized documents.',
+            '# TYPE anonymizer_characters_total counter',
+            f'anonymizer_characters_total {self.characters}'
+        ]
+        return '\n'.join(lines) + '\n' + self.profiler.prometheus_text()
+
+class MicroBatcher:
+    # Small concurrent requests are queued and sent to the worker pool together, which
+    # amortizes the inter-process round trip; the event loop itself never scans text.
+    # Only max_pending batches run at once, so under load the queue grows and the next
+    # batch picks up more requests instead of piling tasks up inside the pool.
+    def __init__(self, executor, stats, max_pending, max_size=MICRO_BATCH_MAX_SIZE,
+                 max_delay=MICRO_BATCH_MAX_DELAY):
+        self.executor = executor
+        self.stats = stats
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.slots = asyncio.Semaphore(max_pending)
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+
+    async def submit(self, text, selected_pii_types, anonymization_method, with_pairs=False):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(((tuple(selected_pii_types), anonymization_method, with_pairs), text, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.slots.acquire()
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.stats.batch_sizes[len(batch)] += 1
+            asyncio.ensure_future(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        try:
+            groups = collections.defaultdict(list)
+            for key, text, future in batch:
+                groups[key].append((text, future))
+            loop = asyncio.get_running_loop()
+            for (selected_pii_types, anonymization_method, with_pairs), items in groups.items():
+                try:
+                    results, profile = await loop.run_in_executor(
+                        self.executor, _anonymize_texts,
+                        [text for text, _ in items], list(selected_pii_types), anonymization_method, with_pairs
+                    )
+                except Exception as error:
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(error)
+                    continue
+                self.stats.record_profile(profile)
+                for (_, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self.slots.release()
+
+def _validate(pii_types, method):
+    patterns = active_rules().patterns
+    selected_pii_types = pii_types if pii_types is not None else list(patterns)
+    unknown = [t for t in selected_pii_types if t not in patterns]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Neznámé typy PII: {', '.join(unknown)}")
+    if method not in ANONYMIZATION_METHODS:
+        raise HTTPException(status_code=422, detail=f"Neznámá metoda anonymizace: {method}")
+    return selected_pii_types
+
+def _vault(state):
+    if state.get('vault') is None:
+        raise HTTPException(status_code=404, detail="Trezor pro zpětné doplnění údajů není zapnut (--vault)")
+    return state['vault']
+
+def _check_rules(config, baseline_config, sample_size):
+    # Runs in a separate process, see RULES_VALIDATION_TIMEOUT
+    from src.czech_anonymization.corpus import generate_corpus
+
+    texts = [document['text'] for document in generate_corpus(sample_size)]
+    return validate_rules(rules_from_config(config), texts, rules_from_config(baseline_config))
+
+def _run_rules_check(config, baseline_config, sample_size, timeout):
+    # Spawned, since a process forked from the server's threads can inherit a held lock
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        try:
+            return pool.apply_async(_check_rules, (config, baseline_config, sample_size)).get(timeout)
+        except multiprocessing.TimeoutError:
+            raise ValueError(f"Kontrola pravidel nedoběhla do {timeout} s") from None
+
+def _worker_pool(workers, profile, time_budget, rules):
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker,
+        initargs=(profile, time_budget, rules.to_config() if rules is not DEFAULT_RULES else None)
+    )
+
+def create_api(workers=None, profile=None, time_budget=DEFAULT_TIME_BUDGET, vault_path=None,
+               vault_ttl=DEFAULT_VAULT_TTL, rules_path=None):
+    workers = workers or os.cpu_count() or 1
+    # Per-pattern profiling in the workers, by default as set by ANONYMIZER_PROFILE
+    profile = pipeline_profiler.enabled if profile is None else profile
+    state = {}
+    if rules_path:
+        set_active_rules(load_rules(rules_path))
+
+    @contextlib.asynccontextmanager
+    async def lifespan(api):
+        stats = ServiceStats()
+        executor = _worker_pool(workers, profile, time_budget, active_rules())
+        batcher = MicroBatcher(executor, stats, max_pending=workers * 2)
+        batcher.start()
+        vault = ReidentificationVault(vault_path, ttl=vault_ttl) if vault_path else None
+        state.update(stats=stats, executor=executor, batcher=batcher, vault=vault, rules_lock=asyncio.Lock())
+        try:
+            yield
+        finally:
+            await batcher.stop()
+            state['executor'].shutdown(wait=False, cancel_futures=True)
+            if vault is not None:
+                vault.close()
+
+    api = FastAPI(title="Český PII Anonymizátor", lifespan=lifespan)
+
+    @api.post("/anonymize")
+    async def anonymize(request: AnonymizeRequest):
+        started = time.perf_counter()
+        selected_pii_types = _validate(request.pii_types, request.method)
+        with_pairs = request.session_id is not None
+        vault = _vault(state) if with_pairs else None
+        if len(request.text) <= MICRO_BATCH_MAX_CHARS:
+            result = await state['batcher'].submit(request.text, selected_pii_types, request.method, with_pairs)
+        else:
+            results, profile = await asyncio.get_running_loop().run_in_executor(
+                state['executor'], _anonymize_texts, [request.text], selected_pii_types, request.method, with_pairs
+            )
+            state['stats'].record_profile(profile)
+            result = results[0]
+        if vault is not None:
+            # The vault reads and writes SQLite, which must not block the event loop
+            await asyncio.get_running_loop().run_in_executor(None, vault.record, request.session_id,
+                                                             result.pop('pairs'))
+        state['stats'].record('/anonymize', time.perf_counter() - started, [result], len(request.text))
+        return result
+
+    @api.post("/deanonymize")
+    async def deanonymize(request: DeanonymizeRequest):
+        started = time.perf_counter()
+        text, restored = await asyncio.get_running_loop().run_in_executor(
+            None, _vault(state).restore, request.session_id, request.text)
+        state['stats'].record_request('/deanonymize', time.perf_counter() - started)
+        return {'text': text, 'restored': restored}
+
+    @api.post("/batch-anonymize")
+    async def batch_anonymize(request: BatchAnonymizeRequest):
+        started = time.perf_counter()
+        selected_pii_types = _validate(request.pii_types, request.method)
+        loop = asyncio.get_running_loop()
+        # Spread the documents over all workers in contiguous slices to keep the order
+        size = max(1, -(-len(request.texts) // workers))
+        parts = await asyncio.gather(*[
+            loop.run_in_executor(state['executor'], _anonymize_texts,
+                                 request.texts[i:i + size], selected_pii_types, request.method)
+            for i in range(0, len(request.texts), size)
+        ])
+        results = []
+        for part, profile in parts:
+            results.extend(part)
+            state['stats'].record_profile(profile)
+        state['stats'].record('/batch-anonymize', time.perf_counter() - started, results,
+                              sum(len(text) for text in request.texts))
+        return {'results': results}
+
+    @api.put("/update-rules")
+    async def update_rules(request: Optional[RulesRequest] = None):
+        # Without a body the rule file given by --rules is read again. The new rule set is
+        # checked and compiled in a new worker pool while the old one keeps serving; then
+        # the pools are swapped and the old one finishes the tasks it already has.
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        async with state['rules_lock']:
+            try:
+                if request is not None:
+                    rules = rules_from_config({'version': request.version, 'patterns': request.patterns,
+                                               'prefilters': request.prefilters, 'priorities': request.priorities,
+                                               'recognizers': request.recognizers})
+                elif rules_path:
+                    rules = load_rules(rules_path)
+                else:
+                    raise ValueError("Chybí sada pravidel v těle požadavku i soubor --rules")
+                current = active_rules()
+                if rules.digest == current.digest:
+                    return {'version': rules.version, 'changed': False}
+                report = await loop.run_in_executor(None, _run_rules_check, rules.to_config(), current.to_config(),
+                                                    RULES_SAMPLE_SIZE, RULES_VALIDATION_TIMEOUT)
+            except (OSError, ValueError) as error:
+                raise HTTPException(status_code=422, detail=f"Pravidla nelze použít: {error}")
+            executor = _worker_pool(workers, profile, time_budget, rules)
+            try:
+                await asyncio.gather(*[loop.run_in_executor(executor, _worker_rules_version) for _ in range(workers)])
+            except Exception as error:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise HTTPException(status_code=500, detail=f"Pracovní procesy s novými pravidly nelze spustit: {error}")
+            previous = state['executor']
+            set_active_rules(rules)
+            state['executor'] = state['batcher'].executor = executor
+            previous.shutdown(wait=False)
+        state['stats'].record_request('/update-rules', time.perf_counter() - started)
+        return dict(report, previous_version=current.version, changed=True)
+
+    @api.get("/rules")
+    async def get_rules():
+        return dict(active_rules().to_config(), digest=active_rules().digest)
+
+    @api.get("/get-stats")
+    async def get_stats():
+        return dict(state['stats'].snapshot(), rules_version=active_rules().version)
+
+    @api.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return state['stats'].prometheus_text()
+
+    return api
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lokální HTTP služba pro anonymizaci PII.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Počet pracovních procesů")
+    parser.add_argument('--profile', action='store_true', help="Měřit čas jednotlivých vzorů (endpoint /metrics)")
+    parser.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET,
+                        help="Časový limit na dokument v sekundách, po něm se maskují jen číslice")
+    parser.add_argument('--vault', help="SQLite soubor trezoru pro zpětné doplnění údajů (/deanonymize)")
+    parser.add_argument('--vault-ttl', type=float, default=DEFAULT_VAULT_TTL,
+                        help="Platnost relace v trezoru v sekundách od posledního záznamu")
+    parser.add_argument('--rules', metavar='SOUBOR',
+                        help="Sada pravidel JSON místo vestavěných vzorů; PUT /update-rules ji načte znovu")
+    args = parser.parse_args(argv)
+
+    try:
+        get_pseudonymizer()
+    except ValueError as error:
+        parser.error(str(error))
+    try:
+        api = create_api(args.workers, args.profile or None, args.time_budget, args.vault, args.vault_ttl,
+                         args.rules)
+    except (OSError, ValueError) as error:
+        parser.error(f"Pravidla {args.rules} nelze načíst: {error}")
+
+    import uvicorn
+    uvicorn.run(api, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,30 @@
-import os
-import sys
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-print("Python version:", sys.version)
-print("Python path:", sys.path)
-import site
-print("Site packages:", site.getsitepackages())
-
 import streamlit as st
 # Odstraňte nebo zakomentujte tento řádek
 # from streamlit_option_menu import option_menu
-import re
-from faker import Faker
 import json
+import time
 import pandas as pd
 
+from src.czech_anonymization.core import (ANONYMIZATION_METHODS, PII_PATTERNS, detect_and_anonymize_pii,
+                                         reanonymize_pii)
+from src.czech_anonymization.file_jobs import FileJob
+from src.czech_anonymization.profiling import PipelineProfiler, pipeline_profiler
+
 # Odstraňte nebo zakomentujte tyto řádky
 # from src.czech_anonymization.analyzers import custom_recognizers
 # from src.czech_anonymization.processors import document_processors
 
-# Initialize Faker for Czech
-fake = Faker('cs_CZ')
-
-# Enhanced PII patterns (simplified for brevity)
-PII_PATTERNS = {
-    'JMÉNO': r'\b(?:(?:Ing\.|Mgr\.|JUDr\.|MUDr\.|PhDr\.|RNDr\.|doc\.|prof\.|Dr\.) )?[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]+(?:[ -][A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]+)*(?:(,? (?:CSc\.|DrSc\.|Ph\.D\.))?)\b',
-    'RODNÉ_ČÍSLO': r'\b\d{6}/\d{3,4}\b',
-    'DATUM_NAROZENÍ': r'\b(?:\d{1,2}\.? )?(?:\d{1,2}\.? )?(?:\d{4}|(?:led(?:na|en)|únor(?:a)?|břez(?:na|en)|dub(?:na|en)|květ(?:na|en)|červ(?:na|en)(?:ec)?|srp(?:na|en)|září|říj(?:na|en)|listopa(?:du|d)|prosine(?:c|e)) ?\d{4})\b',
-    'TELEFON': r'\b(?:\+420 ?)?(?:(?:\d{3} ?){3}|\d{9})\b',
-    'EMAIL': r'\b[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\b',
-    'ADRESA': r'\b[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]+(?:[ -][A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]+)* \d+(?:/\d+[a-zA-Z]?)?,?\s*\d{3} ?\d{2} [A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]+(?:[ -][A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]+)*\b',
-    'ČÍSLO_OP': r'\b(?:\d{9}|\d{6} ?\d{3})\b',
-    'ČÍSLO_PASU': r'\b[A-Z]{2}\d{7}\b',
-    'BANKOVNÍ_ÚČET': r'\b\d{1,6}-?\d{2,10}/\d{4}\b',
-    'IČO': r'\b\d{8}\b',
-    'DIČ': r'\bCZ\d{8,10}\b',
-    'DATOVÁ_SCHRÁNKA': r'\b[a-zA-Z0-9]{7}\b'
-}
-
-def detect_and_anonymize_pii(text, selected_pii_types, anonymization_method):
-    entities = []
-    anonymized_text = text
-
-    for entity_type, pattern in PII_PATTERNS.items():
-        if entity_type in selected_pii_types:
-            for match in re.finditer(pattern, text):
-                entities.append({
-                    'start': match.start(),
-                    'end': match.end(),
-                    'text': match.group(),
-                    'type': entity_type
-                })
-
-    # Sort entities in reverse order to avoid index issues when replacing
-    entities.sort(key=lambda x: x['start'], reverse=True)
-
-    for entity in entities:
-        anonymized_value = anonymize_entity(entity, anonymization_method)
-        anonymized_text = anonymized_text[:entity['start']] + anonymized_value + anonymized_text[entity['end']:]
-
-    return {'original_text': text, 'anonymized_text': anonymized_text, 'entities': entities}
-
-def anonymize_entity(entity, method):
-    if method == 'Nahradit X':
-        return 'X' * len(entity['text'])
-    elif method == 'Nahradit [TYP_ÚDAJE]':
-        return f"[{entity['type']}]"
-    elif method == 'Použít falešná data':
-        if entity['type'] == 'JMÉNO':
-            return fake.name()
-        elif entity['type'] == 'RODNÉ_ČÍSLO':
-            return fake.ssn()
-        elif entity['type'] == 'DATUM_NAROZENÍ':
-            return fake.date(pattern='%d.%m.%Y')
-        elif entity['type'] == 'TELEFON':
-            return fake.phone_number()
-        elif entity['type'] == 'EMAIL':
-            return fake.email()
-        elif entity['type'] == 'ADRESA':
-            return fake.address()
-        else:
-            return fake.word()
-    return entity['text']
+# Streamlit executes this script again on every widget interaction. The engines, Faker
+# instances and the pseudonymizer are cached inside the core module, which is imported
+# once per process. Results of the UI are cached by a hash of (text, selected types,
+# method), so a rerun caused by any other widget does not scan a large document again.
+RESULT_CACHE_ENTRIES = 32
+# A file being processed in the background is polled this often
+FILE_JOB_POLL_SECONDS = 0.5
+
+@st.cache_data(show_spinner=False, max_entries=RESULT_CACHE_ENTRIES)
+def cached_detect_and_anonymize_pii(text, selected_pii_types, anonymization_method):
+    return detect_and_anonymize_pii(text, selected_pii_types, anonymization_method)
 
 def main():
     st.set_page_config(page_title="Český PII Anotátor a Anonymizátor", layout="wide")
@@ -108,7 +52,8 @@ def main():
 def show_main_app():
     st.title("Pokročilý Český PII Anotátor a Anonymizátor")
 
-    text_input = st.text_area("Zadejte český text k analýze:", height=200)
+    input_mode = st.radio("Vstup:", ("Vložit text", "Nahrát soubor"), horizontal=True)
+    text_input = st.text_area("Zadejte český text k analýze:", height=200) if input_mode == "Vložit text" else None
 
     selected_pii_types = st.multiselect(
         "Vyberte typy PII k detekci:",
@@ -118,57 +63,173 @@ def show_main_app():
 
     anonymization_method = st.selectbox(
         "Vyberte metodu anonymizace:",
-        ["Nahradit X", "Nahradit [TYP_ÚDAJE]", "Použít falešná data"]
+        ANONYMIZATION_METHODS
     )
 
+    if input_mode == "Nahrát soubor":
+        show_file_mode(selected_pii_types, anonymization_method)
+        return
+
+    profile_run = st.checkbox("Měřit čas jednotlivých vzorů")
+
     if st.button("Analyzovat a Anonymizovat"):
         if not text_input:
             st.error("Prosím, zadejte nějaký text k analýze.")
         elif not selected_pii_types:
             st.error("Prosím, vyberte alespoň jeden typ PII k detekci.")
         else:
-            result = detect_and_anonymize_pii(text_input, selected_pii_types, anonymization_method)
-            
-            st.subheader("Výsledky anonymizace")
-            st.write(f"Anonymizace proběhla úspěšně, bylo detekováno a anonymizováno {len(result['entities'])} osobních údajů.")
-
-            col1, col2 = st.columns(2)
-            with col1:
-                st.subheader("Původní text")
-                st.text_area("", result['original_text'], height=300)
-            with col2:
-                st.subheader("Anonymizovaný text")
-                st.text_area("", result['anonymized_text'], height=300)
-
-            st.subheader("Detekované PII:")
-            pii_summary = {}
-            for entity in result['entities']:
-                if entity['type'] not in pii_summary:
-                    pii_summary[entity['type']] = 1
-                else:
-                    pii_summary[entity['type']] += 1
-
-            summary_data = [{"Typ PII": k, "Počet instancí": v, "Úspěšnost": "✅"} for k, v in pii_summary.items()]
+            profile = None
+            settings = (tuple(selected_pii_types), anonymization_method)
+            previous = st.session_state.get('anonymization_result')
+            if profile_run:
+                # A profiled run must really scan, so it bypasses the result cache
+                with pipeline_profiler.capture() as profile:
+                    result = detect_and_anonymize_pii(text_input, selected_pii_types, anonymization_method)
+            elif previous is not None and st.session_state.get('anonymization_settings') == settings:
+                # An edit of the last analyzed text only rescans the changed parts
+                result = reanonymize_pii(previous, text_input, selected_pii_types, anonymization_method)
+            else:
+                result = cached_detect_and_anonymize_pii(text_input, *settings)
+            # Kept in the session so the buttons below, which rerun the script, still see it
+            st.session_state['anonymization_result'] = result
+            st.session_state['anonymization_settings'] = settings
+            st.session_state['anonymization_profile'] = profile
+
+    if 'anonymization_result' in st.session_state:
+        show_result(st.session_state['anonymization_result'], st.session_state.get('anonymization_profile'))
+
+def show_result(result, profile=None):
+    st.subheader("Výsledky anonymizace")
+    st.write(f"Anonymizace proběhla úspěšně, bylo detekováno a anonymizováno {len(result['entities'])} osobních údajů.")
+    if result['degraded']:
+        st.warning("Detekce nestihla časový limit, ve zbytku textu byly maskovány pouze číslice.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Původní text")
+        st.text_area("", result['original_text'], height=300)
+    with col2:
+        st.subheader("Anonymizovaný text")
+        st.text_area("", result['anonymized_text'], height=300)
+
+    st.subheader("Detekované PII:")
+    pii_summary = result['entities'].counts()
+
+    summary_data = [{"Typ PII": k, "Počet instancí": v, "Úspěšnost": "✅"} for k, v in pii_summary.items()]
+    if profile is not None:
+        summary_col, profile_col = st.columns(2)
+        with summary_col:
             st.table(pd.DataFrame(summary_data))
-
-            if st.button("Stáhnout zprávu"):
-                report = {
-                    "original_text": result['original_text'],
-                    "anonymized_text": result['anonymized_text'],
-                    "pii_summary": pii_summary
-                }
-                st.download_button(
-                    label="Stáhnout JSON zprávu",
-                    data=json.dumps(report, ensure_ascii=False, indent=2),
-                    file_name="anonymization_report.json",
-                    mime="application/json"
-                )
-
-            st.subheader("Zpětná vazba")
-            feedback = st.radio("Jste spokojeni s výsledkem anonymizace?", ("Ano", "Ne"))
-            comments = st.text_area("Další komentáře:")
-            if st.button("Odeslat zpětnou vazbu"):
-                st.success("Děkujeme za vaši zpětnou vazbu!")
+        with profile_col:
+            show_profile(profile)
+    else:
+        st.table(pd.DataFrame(summary_data))
+
+    if st.button("Stáhnout zprávu"):
+        report = {
+            "original_text": result['original_text'],
+            "anonymized_text": result['anonymized_text'],
+            "pii_summary": pii_summary,
+            "entities": result['entities'].to_dicts()
+        }
+        st.download_button(
+            label="Stáhnout JSON zprávu",
+            data=json.dumps(report, ensure_ascii=False, indent=2),
+            file_name="anonymization_report.json",
+            mime="application/json"
+        )
+
+    st.subheader("Zpětná vazba")
+    feedback = st.radio("Jste spokojeni s výsledkem anonymizace?", ("Ano", "Ne"))
+    comments = st.text_area("Další komentáře:")
+    if st.button("Odeslat zpětnou vazbu"):
+        st.success("Děkujeme za vaši zpětnou vazbu!")
+
+def show_file_mode(selected_pii_types, anonymization_method):
+    # Large files are processed in a background thread and kept on disk, the page only
+    # shows the progress and then one page of the text and of the entities at a time
+    uploaded = st.file_uploader("Nahrajte textový soubor v kódování UTF-8:",
+                                type=["txt", "csv", "jsonl", "json", "md", "log"])
+    if st.button("Anonymizovat soubor"):
+        if uploaded is None:
+            st.error("Prosím, nahrajte soubor k analýze.")
+        elif not selected_pii_types:
+            st.error("Prosím, vyberte alespoň jeden typ PII k detekci.")
+        else:
+            previous = st.session_state.get('file_job')
+            if previous is not None:
+                previous.cleanup()
+            uploaded.seek(0)
+            st.session_state['file_job'] = FileJob(uploaded, uploaded.name, selected_pii_types, anonymization_method)
+
+    job = st.session_state.get('file_job')
+    if job is not None:
+        show_file_job(job)
+
+def show_file_job(job):
+    st.subheader(f"Soubor {job.name} ({job.size / 2**20:.1f} MB)")
+    if job.status == 'running':
+        st.progress(job.progress(),
+                    text=f"Zpracováno {job.progress():.0%}, zatím nalezeno {job.entities} osobních údajů")
+        if st.button("Zrušit zpracování"):
+            job.cancel()
+            st.experimental_rerun()
+        time.sleep(FILE_JOB_POLL_SECONDS)
+        st.experimental_rerun()
+    if job.status == 'cancelled':
+        st.warning("Zpracování bylo zrušeno.")
+        return
+    if job.status == 'failed':
+        st.error(f"Zpracování selhalo: {job.error}")
+        return
+
+    st.write(f"Anonymizace proběhla úspěšně za {job.elapsed:.1f} s, bylo detekováno a anonymizováno "
+             f"{job.entities} osobních údajů.")
+    st.table(pd.DataFrame([{"Typ PII": k, "Počet instancí": v, "Úspěšnost": "✅"} for k, v in job.counts.items()]))
+
+    anonymized_tab, original_tab, entities_tab = st.tabs(["Anonymizovaný text", "Původní text", "Detekované PII"])
+    views = ((anonymized_tab, True, "Anonymizovaný text"), (original_tab, False, "Původní text"))
+    for tab, anonymized, label in views:
+        with tab:
+            pages = job.text_page_count(anonymized)
+            page = st.number_input(f"Strana (z {pages})", min_value=1, max_value=pages, value=1,
+                                   key=f"file_page_{anonymized}")
+            st.text_area(f"{label}, strana {page}", job.read_text_page(page - 1, anonymized), height=400,
+                         label_visibility="collapsed")
+    with entities_tab:
+        pages = job.entity_page_count()
+        page = st.number_input(f"Strana (z {pages})", min_value=1, max_value=pages, value=1, key="file_entity_page")
+        st.caption("Pozice jsou v bajtech souboru.")
+        st.dataframe(pd.DataFrame(job.read_entity_page(page - 1)), use_container_width=True)
+
+    # The files are read from disk only when a download is requested
+    if st.button("Připravit soubory ke stažení"):
+        col1, col2 = st.columns(2)
+        with col1, open(job.output_path, 'rb') as handle:
+            st.download_button("Stáhnout anonymizovaný soubor", handle, file_name=f"anonymizovany_{job.name}",
+                               mime="text/plain")
+        with col2, open(job.write_report(), 'rb') as handle:
+            st.download_button("Stáhnout JSON zprávu", handle, file_name="anonymization_report.json",
+                               mime="application/json")
+
+def show_profile(profile):
+    st.subheader("Profil zpracování")
+    rows = [
+        {"Fáze": f"Detekce {entity_type}", "Čas (ms)": round(counts['seconds'] * 1000, 3),
+         "Shody": counts['matches'], "Prohledáno znaků": counts['characters']}
+        for entity_type, counts in sorted(profile['detection'].items(), key=lambda item: -item[1]['seconds'])
+    ]
+    for counts in profile['resolution'].values():
+        rows.append({"Fáze": "Řešení překryvů", "Čas (ms)": round(counts['seconds'] * 1000, 3),
+                     "Shody": counts['entities'], "Prohledáno znaků": None})
+    for method, counts in profile['anonymization'].items():
+        rows.append({"Fáze": f"Anonymizace ({method})", "Čas (ms)": round(counts['seconds'] * 1000, 3),
+                     "Shody": counts['entities'], "Prohledáno znaků": None})
+    st.table(pd.DataFrame(rows))
+    with st.expander("Metriky ve formátu Prometheus"):
+        profiler = PipelineProfiler()
+        profiler.merge(profile)
+        st.code(profiler.prometheus_text())
 
 def show_about_project():
     st.title("O projektu")
@@ -288,6 +349,7 @@ def show_future_development():
        - `/batch-anonymize`: POST endpoint pro dávkové zpracování většího množství dokumentů
        - `/update-rules`: PUT endpoint pro aktualizaci pravidel anonymizace
        - `/get-stats`: GET endpoint pro získání statistik o zpracovaných datech
+       - `/deanonymize`: POST endpoint, který do odpovědi modelu vrátí skutečné údaje místo pseudonymů dané relace
 
     2. **API Dokumentace**:
        - Využití Swagger UI pro interaktivní API dokumentaci
@@ -305,19 +367,27 @@ def show_future_development():
     from langchain.agents import initialize_agent
     from langchain.llms import OpenAI
 
-    # Definice našeho anonymizačního nástroje
+    # Definice našeho anonymizačního nástroje; pseudonymy se ukládají do trezoru relace
     anonymization_tool = Tool(
         name="Anonymization",
-        func=lambda x: requests.post("http://our-api.com/anonymize", json={"text": x}).json()["anonymized_text"],
+        func=lambda x: requests.post("http://our-api.com/anonymize", json={
+            "text": x, "method": "Použít falešná data", "session_id": session_id
+        }).json()["anonymized_text"],
         description="Useful for anonymizing text containing personal information"
     )
 
+    # Skutečné údaje se do odpovědi modelu vrátí až u nás
+    def deanonymize(answer):
+        return requests.post("http://our-api.com/deanonymize",
+                             json={"session_id": session_id, "text": answer}).json()["text"]
+
     # Inicializace agenta
     llm = OpenAI(temperature=0)
     agent = initialize_agent([anonymization_tool], llm, agent="zero-shot-react-description", verbose=True)
 
     # Použití agenta
-    agent.run("Anonymize this text and then summarize it: 'Jan Novák, born on 15.3.1985, lives at Hlavní 123, Prague.'")
+    answer = agent.run("Anonymize this text and then summarize it: 'Jan Novák, born on 15.3.1985, lives at Hlavní 123, Prague.'")
+    print(deanonymize(answer))
     ```
 
     ## AI a NLP modely pro detekci PII
@@ -0,0 +1,408 @@
+import argparse
+import collections
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import time
+
+from src.czech_anonymization.cascade import CascadeScheduler, load_recognizer, second_stage_share
+from src.czech_anonymization.core import (
+    ANONYMIZATION_METHODS, DEFAULT_TIME_BUDGET, active_rules, anonymize_dataframe, anonymize_file,
+    detect_and_anonymize_cached, detect_and_anonymize_pii, detect_column_types, get_pseudonymizer, load_rules,
+    rules_from_config, set_active_rules
+)
+from src.czech_anonymization.profiling import PipelineProfiler, pipeline_profiler
+from src.czech_anonymization.result_cache import DEFAULT_MAX_BYTES as DEFAULT_CACHE_BYTES, ResultCache, hit_rates
+
+# Settings of the current worker process, set once by the pool initializer
+_worker_settings = {}
+
+def _init_worker(selected_pii_types, anonymization_method, with_entities, profile=False,
+                 time_budget=DEFAULT_TIME_BUDGET, cache=None, rules_config=None, recognizer=None):
+    # cache: None, or {'path': SQLite file shared by the workers or None, 'max_bytes', 'paragraphs'}
+    # recognizer: None, or the spec of a second-stage recognizer, see load_recognizer
+    if rules_config is not None:
+        set_active_rules(rules_from_config(rules_config))
+    _worker_settings.update(
+        selected_pii_types=selected_pii_types,
+        anonymization_method=anonymization_method,
+        with_entities=with_entities,
+        time_budget=time_budget,
+        cache=ResultCache(cache['path'], max_bytes=cache['max_bytes']) if cache else None,
+        paragraphs=bool(cache and cache['paragraphs']),
+        cascade=CascadeScheduler(load_recognizer(recognizer), selected_pii_types, anonymization_method,
+                                 time_budget=time_budget) if recognizer else None
+    )
+    pipeline_profiler.enabled = profile
+
+def _anonymize_batch(texts):
+    results = []
+    cache = _worker_settings['cache']
+    cascade = _worker_settings['cascade']
+    # The cascade batches the second-stage sentences of the whole batch of documents
+    cascaded = cascade.run(texts) if cascade is not None else None
+    for index, text in enumerate(texts):
+        if cascaded is not None:
+            result = cascaded[index]
+        elif cache is not None:
+            result = detect_and_anonymize_cached(
+                text, _worker_settings['selected_pii_types'], _worker_settings['anonymization_method'], cache,
+                time_budget=_worker_settings['time_budget'], paragraphs=_worker_settings['paragraphs']
+            )
+        else:
+            result = detect_and_anonymize_pii(
+                text, _worker_settings['selected_pii_types'], _worker_settings['anonymization_method'],
+                time_budget=_worker_settings['time_budget']
+            )
+        entities = result['entities'].to_dicts() if _worker_settings['with_entities'] else None
+        results.append((result['anonymized_text'], entities, result['degraded']))
+    return (results, pipeline_profiler.drain() if pipeline_profiler.enabled else None,
+            cache.drain_counts() if cache is not None else None,
+            cascade.drain_counts() if cascade is not None else None)
+
+def detect_input_format(path):
+    if os.path.isdir(path):
+        return 'txt'
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if extension == '.csv':
+        return 'csv'
+    if extension == '.txt':
+        return 'file'
+    raise ValueError(f"Nelze určit formát vstupu: {path}")
+
+# Readers yield (record, text) pairs; writers put the anonymized text back into the record
+
+def read_jsonl(path, text_field):
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            if line.strip():
+                record = json.loads(line)
+                yield record, record.get(text_field) or ''
+
+def read_csv(path, text_field):
+    with open(path, encoding='utf-8', newline='') as handle:
+        for row in csv.DictReader(handle):
+            yield row, row.get(text_field) or ''
+
+def read_txt_dir(path, text_field):
+    for name in sorted(os.listdir(path)):
+        if name.endswith('.txt'):
+            with open(os.path.join(path, name), encoding='utf-8') as handle:
+                yield name, handle.read()
+
+class JsonlWriter:
+    def __init__(self, path, text_field):
+        self.handle = open(path, 'w', encoding='utf-8')
+        self.text_field = text_field
+
+    def write(self, record, anonymized_text, entities):
+        record = dict(record, **{self.text_field: anonymized_text})
+        if entities is not None:
+            record['pii_entities'] = entities
+        self.handle.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.handle.close()
+
+class CsvWriter:
+    def __init__(self, path, text_field):
+        self.handle = open(path, 'w', encoding='utf-8', newline='')
+        self.text_field = text_field
+        self.writer = None
+
+    def write(self, record, anonymized_text, entities):
+        row = dict(record, **{self.text_field: anonymized_text})
+        if entities is not None:
+            row['pii_entities'] = json.dumps(entities, ensure_ascii=False)
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.handle, fieldnames=list(row))
+            self.writer.writeheader()
+        self.writer.writerow(row)
+
+    def close(self):
+        self.handle.close()
+
+class TxtDirWriter:
+    def __init__(self, path, text_field):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def write(self, name, anonymized_text, entities):
+        with open(os.path.join(self.path, name), 'w', encoding='utf-8') as handle:
+            handle.write(anonymized_text)
+        if entities is not None:
+            with open(os.path.join(self.path, name[:-4] + '.entities.json'), 'w', encoding='utf-8') as handle:
+                json.dump(entities, handle, ensure_ascii=False)
+
+    def close(self):
+        pass
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv, 'txt': read_txt_dir}
+WRITERS = {'jsonl': JsonlWriter, 'csv': CsvWriter, 'txt': TxtDirWriter}
+
+def _batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class ProgressReporter:
+    def __init__(self, stream=sys.stderr, interval=2.0):
+        self.stream = stream
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.documents = 0
+        self.characters = 0
+        self.degraded = 0
+        self.cache_counts = collections.Counter()
+        self.cascade_counts = collections.Counter()
+
+    def update(self, documents, characters, degraded=0, cache_counts=None, cascade_counts=None):
+        self.documents += documents
+        self.characters += characters
+        self.degraded += degraded
+        if cache_counts:
+            self.cache_counts.update(cache_counts)
+        if cascade_counts:
+            self.cascade_counts.update(cascade_counts)
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self, final=False):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        label = "Hotovo" if final else "Zpracováno"
+        degraded = f", {self.degraded} dokumentů v nouzovém režimu" if self.degraded else ''
+        cached = ''
+        if self.cache_counts:
+            rates = hit_rates(self.cache_counts)
+            cached = (f", mezipaměť {rates['hit_rate']:.1%} zásahů ({rates['memory_hits']} z paměti, "
+                      f"{rates['disk_hits']} z disku, {rates['misses']} zpracováno)")
+        cascade = ''
+        if self.cascade_counts:
+            share = second_stage_share(self.cascade_counts)
+            cascade = (f", druhý stupeň {share['share']:.1%} textu ({share['second_stage_sentences']} vět "
+                       f"v {share['batches']} dávkách, {share['second_stage_seconds']:.1f} s)")
+        self.stream.write(
+            f"{label}: {self.documents} dokumentů, {self.characters / 1e6:.1f} M znaků, "
+            f"{self.documents / elapsed:.1f} dok/s, {self.characters / elapsed / 1e6:.2f} M znaků/s{degraded}{cached}{cascade}\n"
+        )
+        self.stream.flush()
+
+def run_batch(input_path, output_path, selected_pii_types, anonymization_method, input_format=None,
+              text_field='text', workers=None, batch_size=64, max_in_flight=None, with_entities=False,
+              progress=None, profiler=None, time_budget=DEFAULT_TIME_BUDGET, cache=None, rules=None,
+              recognizer=None):
+    input_format = input_format or detect_input_format(input_path)
+    workers = workers or os.cpu_count() or 1
+    # Bounded number of submitted batches keeps memory flat no matter how large the corpus is
+    max_in_flight = max_in_flight or workers * 4
+    progress = progress or ProgressReporter()
+
+    records = READERS[input_format](input_path, text_field)
+    writer = WRITERS[input_format](output_path, text_field)
+    pending = collections.deque()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(list(selected_pii_types), anonymization_method, with_entities, profiler is not None,
+                      time_budget, cache, rules.to_config() if rules is not None else None, recognizer)
+        ) as pool:
+            def drain_oldest():
+                # Results are written strictly in submission order, i.e. in input order
+                batch, future = pending.popleft()
+                results, profile, cache_counts, cascade_counts = future.result()
+                if profile:
+                    profiler.merge(profile)
+                for (record, text), (anonymized_text, entities, _) in zip(batch, results):
+                    writer.write(record, anonymized_text, entities)
+                progress.update(len(batch), sum(len(text) for _, text in batch),
+                                sum(degraded for _, _, degraded in results), cache_counts, cascade_counts)
+
+            for batch in _batched(records, batch_size):
+                if len(pending) >= max_in_flight:
+                    drain_oldest()
+                pending.append((batch, pool.submit(_anonymize_batch, [text for _, text in batch])))
+            while pending:
+                drain_oldest()
+    finally:
+        writer.close()
+    progress.report(final=True)
+    return progress.documents
+
+def run_file(input_path, output_path, selected_pii_types, anonymization_method, with_entities=False,
+             progress=None, profiler=None):
+    # One large UTF-8 text file, scanned memory-mapped in this process; entities are
+    # written with byte offsets to <output>.entities.jsonl
+    progress = progress or ProgressReporter()
+    entities_handle = open(output_path + '.entities.jsonl', 'w', encoding='utf-8') if with_entities else None
+
+    def write_entity(entity):
+        entities_handle.write(json.dumps(entity, ensure_ascii=False) + '\n')
+
+    if profiler is not None:
+        pipeline_profiler.enabled = True
+    try:
+        anonymize_file(input_path, output_path, selected_pii_types, anonymization_method,
+                       on_entity=write_entity if entities_handle else None)
+    finally:
+        if entities_handle:
+            entities_handle.close()
+        if profiler is not None:
+            profiler.merge(pipeline_profiler.drain())
+    progress.update(1, os.path.getsize(input_path))
+    progress.report(final=True)
+    return progress.documents
+
+TABLE_CHUNK_ROWS = 100000
+
+def parse_column_types(spec):
+    # "jmeno=JMÉNO,kontakt=TELEFON+EMAIL,poznamka": a column without types is searched for all of them
+    column_types = {}
+    for item in spec.split(','):
+        column, _, types = item.partition('=')
+        if column.strip():
+            column_types[column.strip()] = [t.strip() for t in types.split('+') if t.strip()] or None
+    return column_types
+
+def run_table(input_path, output_path, anonymization_method, column_types=None, chunk_rows=TABLE_CHUNK_ROWS,
+              progress=None, profiler=None):
+    # Anonymizes whole CSV columns chunk by chunk in this process; the columns are
+    # processed vectorized, so worker processes would only add serialization cost.
+    # Without column_types the mapping is detected from the first chunk.
+    import pandas as pd
+
+    progress = progress or ProgressReporter()
+    # Everything is read as text so leading zeros of numbers such as IČO are kept
+    chunks = pd.read_csv(input_path, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+    header = True
+    for chunk in chunks:
+        if column_types is None:
+            column_types = detect_column_types(chunk)
+        missing = [column for column in column_types if column not in chunk.columns]
+        if missing:
+            raise ValueError(f"Neznámé sloupce: {', '.join(missing)}")
+        if profiler is not None:
+            with pipeline_profiler.capture() as profile:
+                anonymized = anonymize_dataframe(chunk, anonymization_method, column_types)
+            profiler.merge(profile)
+        else:
+            anonymized = anonymize_dataframe(chunk, anonymization_method, column_types)
+        anonymized.to_csv(output_path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        progress.update(len(chunk), sum(chunk[column].str.len().sum() for column in column_types))
+    if header:
+        # Empty input still produces the header
+        pd.read_csv(input_path, dtype=str, nrows=0).to_csv(output_path, index=False)
+    progress.report(final=True)
+    return progress.documents
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Dávková anonymizace PII v korpusech JSONL, CSV nebo adresářích TXT souborů."
+    )
+    parser.add_argument('input', help="Vstupní soubor .jsonl/.csv/.txt nebo adresář s .txt soubory")
+    parser.add_argument('output', help="Výstupní soubor nebo adresář (stejný formát jako vstup)")
+    parser.add_argument('--format', choices=sorted(READERS) + ['file'],
+                        help="Formát vstupu (výchozí podle přípony; 'file' je jeden velký textový soubor)")
+    parser.add_argument('--text-field', default='text', help="Klíč JSONL nebo sloupec CSV s textem")
+    parser.add_argument('--types', help="Typy PII oddělené čárkou (výchozí všechny)")
+    parser.add_argument('--method', choices=ANONYMIZATION_METHODS, default=ANONYMIZATION_METHODS[0],
+                        help="Metoda anonymizace")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Počet pracovních procesů")
+    parser.add_argument('--batch-size', type=int, default=64, help="Počet dokumentů v jedné úloze")
+    parser.add_argument('--max-in-flight', type=int, help="Maximální počet rozpracovaných úloh")
+    parser.add_argument('--with-entities', action='store_true', help="Zapsat i detekované entity")
+    parser.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET,
+                        help="Časový limit na dokument v sekundách, po něm se maskují jen číslice")
+    parser.add_argument('--profile', nargs='?', const='-', metavar='SOUBOR',
+                        help="Změřit čas jednotlivých vzorů a fází a zapsat metriky Prometheus (výchozí stderr)")
+    parser.add_argument('--cache', nargs='?', const='-', metavar='SOUBOR',
+                        help="Nezpracovávat znovu stejné texty; se SOUBOREM sdílí výsledky všechny procesy a běhy")
+    parser.add_argument('--cache-size', type=float, default=DEFAULT_CACHE_BYTES / 2**20,
+                        help="Největší velikost souboru mezipaměti v MB")
+    parser.add_argument('--cache-paragraphs', action='store_true',
+                        help="Ukládat a vyhledávat každý odstavec zvlášť (citovaná historie, podpisy, šablony)")
+    parser.add_argument('--columns', help="Anonymizovat celé sloupce CSV: 'sloupec=TYP+TYP,sloupec' nebo 'auto'")
+    parser.add_argument('--rules', metavar='SOUBOR', help="Sada pravidel JSON místo vestavěných vzorů")
+    parser.add_argument('--recognizer', metavar='SPEC',
+                        help="Druhý stupeň detekce pro podezřelé věty: 'stub' nebo 'modul:třída'")
+    args = parser.parse_args(argv)
+
+    rules = None
+    if args.rules:
+        try:
+            rules = load_rules(args.rules)
+        except (OSError, ValueError) as error:
+            parser.error(f"Pravidla {args.rules} nelze načíst: {error}")
+        set_active_rules(rules)
+    patterns = active_rules().patterns
+    selected_pii_types = list(patterns)
+    if args.types:
+        selected_pii_types = [t.strip() for t in args.types.split(',') if t.strip()]
+        unknown = [t for t in selected_pii_types if t not in patterns]
+        if unknown:
+            parser.error(f"Neznámé typy PII: {', '.join(unknown)}")
+
+    if args.recognizer:
+        if args.cache or args.cache_paragraphs:
+            parser.error("--recognizer nelze kombinovat s mezipamětí")
+        try:
+            load_recognizer(args.recognizer)
+        except (ImportError, AttributeError, ValueError) as error:
+            parser.error(f"Rozpoznávač {args.recognizer} nelze načíst: {error}")
+    if args.method == ANONYMIZATION_METHODS[2]:
+        # A misconfigured pseudonym store is reported here instead of in every worker
+        try:
+            get_pseudonymizer()
+        except ValueError as error:
+            parser.error(str(error))
+    profiler = PipelineProfiler() if args.profile else None
+    cache = None
+    if args.cache or args.cache_paragraphs:
+        cache = {'path': None if args.cache in (None, '-') else args.cache,
+                 'max_bytes': int(args.cache_size * 2**20), 'paragraphs': args.cache_paragraphs}
+    if args.columns:
+        column_types = None if args.columns == 'auto' else parse_column_types(args.columns)
+        unknown = [t for types in (column_types or {}).values() for t in types or () if t not in patterns]
+        if unknown:
+            parser.error(f"Neznámé typy PII: {', '.join(unknown)}")
+        try:
+            run_table(args.input, args.output, args.method, column_types, profiler=profiler)
+        except ValueError as error:
+            parser.error(str(error))
+    else:
+        try:
+            input_format = args.format or detect_input_format(args.input)
+            if input_format == 'file':
+                run_file(args.input, args.output, selected_pii_types, args.method,
+                         with_entities=args.with_entities, profiler=profiler)
+            else:
+                run_batch(args.input, args.output, selected_pii_types, args.method, input_format=input_format,
+                          text_field=args.text_field, workers=args.workers, batch_size=args.batch_size,
+                          max_in_flight=args.max_in_flight, with_entities=args.with_entities, profiler=profiler,
+                          time_budget=args.time_budget, cache=cache, rules=rules,
+                          recognizer=args.recognizer)
+        except ValueError as error:
+            parser.error(str(error))
+
+    if profiler is not None:
+        if args.profile == '-':
+            sys.stderr.write(profiler.prometheus_text())
+        else:
+            with open(args.profile, 'w', encoding='utf-8') as handle:
+                handle.write(profiler.prometheus_text())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+from src.czech_anonymization.core import (
+    ANONYMIZATION_METHODS, PII_PATTERNS, PII_RECOGNIZERS, RECOGNIZER_LOADERS, configure_pseudonymization, detect_and_anonymize_pii,
+    get_detection_engine
+)
+from src.czech_anonymization.corpus import TEMPLATES, generate_corpus, read_corpus, write_corpus
+from src.czech_anonymization.rules import FUZZ_SIZES, fuzz_inputs, fuzz_scan
+
+# Allowed relative drop of throughput (and growth of memory) before it counts as a regression
+DEFAULT_TOLERANCE = 0.2
+# Allowed absolute drop of precision or recall
+ACCURACY_TOLERANCE = 0.005
+# Peak memory differences below this are allocator noise
+MEMORY_SLACK_MB = 1.0
+
+def _anonymize_all(texts, selected_pii_types, anonymization_method):
+    # Every run starts with an empty pseudonym cache so fake-data runs are comparable
+    configure_pseudonymization()
+    return [detect_and_anonymize_pii(text, selected_pii_types, anonymization_method) for text in texts]
+
+def _best_time(function, repeat):
+    # A single pass over a small corpus is too short to time reliably, so every sample
+    # repeats it for at least 0.2 s; the best sample is the least disturbed one
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+def measure_method(documents, selected_pii_types, anonymization_method, repeat):
+    texts = [document['text'] for document in documents]
+    megabytes = sum(len(text.encode('utf-8')) for text in texts) / 1e6
+    outputs = _anonymize_all(texts, selected_pii_types, anonymization_method)
+    seconds = _best_time(lambda: _anonymize_all(texts, selected_pii_types, anonymization_method), repeat)
+    configure_pseudonymization()
+    tracemalloc.start()
+    for text in texts:
+        detect_and_anonymize_pii(text, selected_pii_types, anonymization_method)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # Share of labeled values still present verbatim in the anonymized documents
+    labeled = leaked = 0
+    for document, output in zip(documents, outputs):
+        for entity in document['entities']:
+            if entity['type'] in selected_pii_types:
+                labeled += 1
+                leaked += entity['text'] in output['anonymized_text']
+    return {
+        'seconds': round(seconds, 4),
+        'documents_per_second': round(len(texts) / seconds, 1),
+        'megabytes_per_second': round(megabytes / seconds, 3),
+        'peak_memory_mb': round(peak / 1e6, 2),
+        'leak_rate': round(leaked / labeled, 4) if labeled else 0.0
+    }
+
+def measure_patterns(documents, selected_pii_types, repeat):
+    # Each type alone on the whole corpus, prefilters included
+    texts = [document['text'] for document in documents]
+    megabytes = sum(len(text.encode('utf-8')) for text in texts) / 1e6
+    results = {}
+    for entity_type in selected_pii_types:
+        engine = get_detection_engine([entity_type])
+        best = _best_time(lambda: [engine.scan(text) for text in texts], repeat)
+        results[entity_type] = {'seconds': round(best, 4), 'megabytes_per_second': round(megabytes / best, 3)}
+    return results
+
+def _accuracy_entry(true_positives, false_positives, false_negatives, exact):
+    detected = true_positives + false_positives
+    labeled = true_positives + false_negatives
+    return {
+        'true_positives': true_positives,
+        'false_positives': false_positives,
+        'false_negatives': false_negatives,
+        'precision': round(true_positives / detected, 4) if detected else 1.0,
+        'recall': round(true_positives / labeled, 4) if labeled else 1.0,
+        # Share of the found values whose span matches the label exactly
+        'exact': round(exact / true_positives, 4) if true_positives else 1.0
+    }
+
+def measure_accuracy(documents, selected_pii_types):
+    # A detection is a true positive when it overlaps a not yet matched label of the
+    # same type; the whitespace some patterns take after a value is ignored
+    counts = {t: [0, 0, 0, 0] for t in selected_pii_types}
+    for document in documents:
+        text = document['text']
+        labels = [e for e in document['entities'] if e['type'] in counts]
+        matched = set()
+        for entity in detect_and_anonymize_pii(text, selected_pii_types, ANONYMIZATION_METHODS[0])['entities']:
+            start, end = entity['start'], entity['start'] + len(entity['text'].rstrip())
+            for index, label in enumerate(labels):
+                if index not in matched and label['type'] == entity['type'] \
+                        and label['start'] < end and start < label['end']:
+                    matched.add(index)
+                    counts[entity['type']][0] += 1
+                    counts[entity['type']][3] += (label['start'], label['end']) == (start, end)
+                    break
+            else:
+                counts[entity['type']][1] += 1
+        for index, label in enumerate(labels):
+            if index not in matched:
+                counts[label['type']][2] += 1
+    results = {t: _accuracy_entry(*c) for t, c in counts.items()}
+    results['total'] = _accuracy_entry(*[sum(c[i] for c in counts.values()) for i in range(4)])
+    return results
+
+# Modules a worker that only detects and masks text must not import; each of them
+# costs tens to hundreds of milliseconds of cold start
+STARTUP_FORBIDDEN_MODULES = ('faker', 'numpy', 'pandas', 'streamlit')
+# Startup times below this difference are process scheduling noise
+STARTUP_SLACK_SECONDS = 0.02
+STARTUP_TEXT = "Jan Novák, nar. 15.3.1985, tel. +420 601 234 567, jan.novak@email.cz"
+# Run in a fresh interpreter: import of the core, first document (compiles the engine
+# and loads the gazetteer) and the heavy modules loaded on the way
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from src.czech_anonymization.core import ANONYMIZATION_METHODS, PII_PATTERNS, detect_and_anonymize_pii
+imported = time.perf_counter()
+detect_and_anonymize_pii(sys.argv[1], list(PII_PATTERNS), ANONYMIZATION_METHODS[0])
+finished = time.perf_counter()
+# VmHWM belongs to this process only; ru_maxrss would include the parent's peak on Linux
+peak_rss_mb = None
+try:
+    with open('/proc/self/status') as status:
+        peak_rss_mb = next(int(line.split()[1]) / 1024 for line in status if line.startswith('VmHWM:'))
+except (OSError, StopIteration):
+    pass
+json.dump({'import_seconds': imported - started, 'first_document_seconds': finished - imported,
+           'peak_rss_mb': peak_rss_mb, 'modules': [m for m in sys.argv[2:] if m in sys.modules]}, sys.stdout)
+"""
+
+def measure_startup(repeat=5):
+    # Cold start of a short-lived worker; every sample is a new process and the best
+    # sample of each metric is kept
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT, STARTUP_TEXT, *STARTUP_FORBIDDEN_MODULES],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        )
+        sample = json.loads(completed.stdout)
+        sample['process_seconds'] = time.perf_counter() - started
+        samples.append(sample)
+    rss = [sample['peak_rss_mb'] for sample in samples if sample['peak_rss_mb'] is not None]
+    return {
+        'process_seconds': round(min(sample['process_seconds'] for sample in samples), 4),
+        'import_seconds': round(min(sample['import_seconds'] for sample in samples), 4),
+        'first_document_seconds': round(min(sample['first_document_seconds'] for sample in samples), 4),
+        'peak_rss_mb': round(min(rss), 1) if rss else None,
+        'forbidden_modules': sorted({m for sample in samples for m in sample['modules']})
+    }
+
+def compare_startup(current, previous, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    if current['forbidden_modules']:
+        regressions.append(f"Start jádra načítá {', '.join(current['forbidden_modules'])}")
+    if not previous:
+        return regressions
+    for metric in ('process_seconds', 'import_seconds', 'first_document_seconds'):
+        if current[metric] > previous[metric] * (1 + tolerance) + STARTUP_SLACK_SECONDS:
+            regressions.append(f"Start: {metric} {current[metric]} s, základ {previous[metric]} s")
+    if current['peak_rss_mb'] and previous.get('peak_rss_mb') and \
+            current['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + tolerance) + MEMORY_SLACK_MB:
+        regressions.append(f"Start: paměť {current['peak_rss_mb']} MB, základ {previous['peak_rss_mb']} MB")
+    return regressions
+
+def run_benchmark(documents, selected_pii_types, methods=ANONYMIZATION_METHODS, repeat=5):
+    # Compiling the engines and loading the gazetteer is not part of any measurement
+    for document in documents[:10]:
+        detect_and_anonymize_pii(document['text'], selected_pii_types, ANONYMIZATION_METHODS[0])
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'corpus': {
+            'documents': len(documents),
+            'characters': sum(len(document['text']) for document in documents),
+            'entities': sum(len(document['entities']) for document in documents)
+        },
+        'pii_types': list(selected_pii_types),
+        'methods': {method: measure_method(documents, selected_pii_types, method, repeat) for method in methods},
+        'patterns': measure_patterns(documents, selected_pii_types, repeat),
+        'accuracy': measure_accuracy(documents, selected_pii_types),
+        'startup': measure_startup(repeat)
+    }
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # Returns a description of every metric that got worse than the baseline allows
+    regressions = []
+    if results['corpus'] != baseline.get('corpus'):
+        regressions.append("Korpus se liší od korpusu základního měření, výsledky nejsou srovnatelné")
+    for method, current in results['methods'].items():
+        previous = baseline.get('methods', {}).get(method)
+        if not previous:
+            continue
+        if current['megabytes_per_second'] < previous['megabytes_per_second'] * (1 - tolerance):
+            regressions.append(f"{method}: propustnost {current['megabytes_per_second']} MB/s, "
+                               f"základ {previous['megabytes_per_second']} MB/s")
+        if current['peak_memory_mb'] > previous['peak_memory_mb'] * (1 + tolerance) + MEMORY_SLACK_MB:
+            regressions.append(f"{method}: paměť {current['peak_memory_mb']} MB, základ {previous['peak_memory_mb']} MB")
+        if current['leak_rate'] > previous['leak_rate'] + ACCURACY_TOLERANCE:
+            regressions.append(f"{method}: únik {current['leak_rate']}, základ {previous['leak_rate']}")
+    for entity_type, current in results['patterns'].items():
+        previous = baseline.get('patterns', {}).get(entity_type)
+        if previous and current['megabytes_per_second'] < previous['megabytes_per_second'] * (1 - tolerance):
+            regressions.append(f"{entity_type}: propustnost vzoru {current['megabytes_per_second']} MB/s, "
+                               f"základ {previous['megabytes_per_second']} MB/s")
+    for entity_type, current in results['accuracy'].items():
+        previous = baseline.get('accuracy', {}).get(entity_type)
+        for metric in ('precision', 'recall'):
+            if previous and current[metric] < previous[metric] - ACCURACY_TOLERANCE:
+                regressions.append(f"{entity_type}: {metric} {current[metric]}, základ {previous[metric]}")
+    regressions += compare_startup(results['startup'], baseline.get('startup'), tolerance)
+    return regressions
+
+def _fuzz_targets():
+    targets = {t: re.compile(p).finditer for t, p in PII_PATTERNS.items()}
+    for entity_type, name in PII_RECOGNIZERS.items():
+        targets[f'{entity_type} (slovník)'] = RECOGNIZER_LOADERS[name]().scan
+    targets['všechny typy'] = get_detection_engine(list(PII_PATTERNS)).scan
+    return targets
+
+def fuzz_patterns(sizes=FUZZ_SIZES, seed=0, repeat=3):
+    # Times every pattern, recognizer and the combined engine on growing adversarial
+    # inputs, see rules.fuzz_scan
+    inputs = fuzz_inputs(sizes, seed)
+    return {target: fuzz_scan(scan, inputs, sizes, repeat) for target, scan in _fuzz_targets().items()}
+
+def print_fuzz_summary(results, stream=None):
+    stream = stream or sys.stdout
+    stream.write("Cíl                       nejhorší vstup         sklon   čas (s)\n")
+    for target, families in results.items():
+        family, worst = max(families.items(), key=lambda item: item[1]['slope'])
+        flag = "  SUPERLINEÁRNÍ" if any(r['superlinear'] for r in families.values()) else ''
+        stream.write(f"{target:<25} {family:<20} {worst['slope']:>7.2f} {worst['seconds']:>9.4f}{flag}\n")
+
+def print_startup_summary(startup, stream=None):
+    stream = stream or sys.stdout
+    rss = f"{startup['peak_rss_mb']:.1f} MB" if startup['peak_rss_mb'] is not None else "neměřeno"
+    stream.write(f"Start procesu {startup['process_seconds']:.3f} s, import jádra {startup['import_seconds']:.3f} s, "
+                 f"první dokument {startup['first_document_seconds']:.3f} s, paměť {rss}\n")
+    if startup['forbidden_modules']:
+        stream.write(f"Načtené těžké moduly: {', '.join(startup['forbidden_modules'])}\n")
+
+def print_summary(results, stream=None):
+    stream = stream or sys.stdout
+    corpus = results['corpus']
+    stream.write(f"Korpus: {corpus['documents']} dokumentů, {corpus['characters']} znaků, "
+                 f"{corpus['entities']} označených údajů\n\n")
+    for method, result in results['methods'].items():
+        stream.write(f"{method:<24} {result['documents_per_second']:>10.1f} dok/s "
+                     f"{result['megabytes_per_second']:>8.3f} MB/s {result['peak_memory_mb']:>8.2f} MB "
+                     f"únik {result['leak_rate']:.4f}\n")
+    stream.write("\nTyp                      MB/s  přesnost  úplnost  přesné hranice\n")
+    for entity_type, accuracy in results['accuracy'].items():
+        pattern = results['patterns'].get(entity_type)
+        speed = f"{pattern['megabytes_per_second']:>8.3f}" if pattern else ' ' * 8
+        stream.write(f"{entity_type:<18} {speed} {accuracy['precision']:>9.4f} {accuracy['recall']:>8.4f} "
+                     f"{accuracy['exact']:>15.4f}\n")
+    stream.write("\n")
+    print_startup_summary(results['startup'], stream)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Měření rychlosti a přesnosti anonymizace na syntetickém označeném korpusu."
+    )
+    parser.add_argument('--documents', type=int, default=1000, help="Počet generovaných dokumentů")
+    parser.add_argument('--seed', type=int, default=0, help="Semínko generátoru korpusu")
+    parser.add_argument('--kinds', help=f"Druhy dokumentů oddělené čárkou ({', '.join(TEMPLATES)})")
+    parser.add_argument('--corpus', help="Načíst korpus ze souboru JSONL místo generování")
+    parser.add_argument('--save-corpus', help="Uložit vygenerovaný korpus do souboru JSONL")
+    parser.add_argument('--types', help="Typy PII oddělené čárkou (výchozí všechny)")
+    parser.add_argument('--methods', help="Metody anonymizace oddělené čárkou (výchozí všechny)")
+    parser.add_argument('--repeat', type=int, default=5, help="Počet opakování měření rychlosti")
+    parser.add_argument('--output', help="Zapsat výsledky do souboru JSON")
+    parser.add_argument('--baseline', help="Porovnat se základním měřením a skončit chybou při zhoršení")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Povolený relativní pokles propustnosti")
+    parser.add_argument('--fuzz', action='store_true',
+                        help="Ověřit lineární čas vzorů na nepříznivých vstupech a skončit chybou při superlineárním")
+    parser.add_argument('--startup', action='store_true',
+                        help="Změřit pouze studený start jádra a skončit chybou při zhoršení")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        startup = measure_startup(args.repeat)
+        print_startup_summary(startup)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as handle:
+                json.dump({'startup': startup}, handle, ensure_ascii=False, indent=2)
+        previous = None
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as handle:
+                previous = json.load(handle).get('startup')
+        regressions = compare_startup(startup, previous, args.tolerance)
+        for regression in regressions:
+            sys.stdout.write(f"- {regression}\n")
+        return 1 if regressions else 0
+
+    if args.fuzz:
+        fuzz = fuzz_patterns(seed=args.seed)
+        print_fuzz_summary(fuzz)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as handle:
+                json.dump({'fuzz': fuzz}, handle, ensure_ascii=False, indent=2)
+        return 1 if any(r['superlinear'] for families in fuzz.values() for r in families.values()) else 0
+
+    selected_pii_types = list(PII_PATTERNS)
+    if args.types:
+        selected_pii_types = [t.strip() for t in args.types.split(',') if t.strip()]
+        unknown = [t for t in selected_pii_types if t not in PII_PATTERNS]
+        if unknown:
+            parser.error(f"Neznámé typy PII: {', '.join(unknown)}")
+    methods = ANONYMIZATION_METHODS
+    if args.methods:
+        methods = [m.strip() for m in args.methods.split(',') if m.strip()]
+        unknown = [m for m in methods if m not in ANONYMIZATION_METHODS]
+        if unknown:
+            parser.error(f"Neznámé metody anonymizace: {', '.join(unknown)}")
+    kinds = [k.strip() for k in args.kinds.split(',')] if args.kinds else None
+    if kinds and any(k not in TEMPLATES for k in kinds):
+        parser.error(f"Neznámé druhy dokumentů: {args.kinds}")
+
+    if args.corpus:
+        documents = read_corpus(args.corpus)
+    else:
+        documents = generate_corpus(args.documents, args.seed, kinds)
+    if args.save_corpus:
+        write_corpus(args.save_corpus, documents)
+
+    results = run_benchmark(documents, selected_pii_types, methods, args.repeat)
+    print_summary(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as handle:
+            regressions = compare_with_baseline(results, json.load(handle), args.tolerance)
+        if regressions:
+            sys.stdout.write("\nZhoršení oproti základnímu měření:\n")
+            for regression in regressions:
+                sys.stdout.write(f"- {regression}\n")
+            return 1
+        sys.stdout.write("\nBez zhoršení oproti základnímu měření.\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import bisect
+import collections
+import importlib
+import re
+import time
+
+from .core import DEFAULT_TIME_BUDGET, active_rules, anonymized_result, resolve_entity_spans
+from .engine import TimeBudgetExceeded
+
+# Detector cascade: the regex rules scan every document, and only the sentences that a
+# cheap heuristic finds suspicious go to a second, expensive recognizer such as a NER
+# model. Those sentences are collected across documents into batches of similar length,
+# so a model pads little and is called a few times per thousands of documents. The
+# spans of both stages are merged with the usual priorities. The time budget applies to
+# the first stage of each document as in detect_and_anonymize_pii; a document that runs
+# out of it is degraded and its unscanned rest gets no second stage. The second stage
+# works on batches of many documents and is measured in the counts instead.
+#
+# A recognizer is any object with:
+#   entity_types  the types it detects
+#   priorities    a dict of their priorities, see PII_PRIORITIES
+#   recognize(texts)  for a list of sentences a list of lists of {'start', 'end', 'type'}
+#                     relative to each sentence
+
+# Lines and sentences; a sentence ends with .!? followed by whitespace and a capital, so
+# dates and abbreviations such as "č. 5" do not end it
+SENTENCE_BREAK = re.compile(r'\n+|(?<=[.!?])\s+(?=[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ„"])')
+# Longer sentences are cut at whitespace, models have a limited input length
+MAX_SENTENCE_CHARS = 2000
+# Words after which a person or an organization is usually named, and legal forms of
+# Czech companies, whose names often consist of personal names
+CONTEXT_CUES = re.compile(
+    r'\b(?:pan|pana|panu|paní|jméno|jménem|příjmení|zastoupen[aáý]?|bytem|narozen[aáý]?|firma|firmy|'
+    r'společnost|společnosti|zaměstnavatel|klient|klienta|pacient|pacienta|dlužník|věřitel|syn|dcera|manžel|'
+    r'manželka)\b|\b(?:s\.\s?r\.\s?o|a\.\s?s|spol|v\.\s?o\.\s?s|k\.\s?s)\.', re.IGNORECASE
+)
+# A capitalized word that does not start a sentence or a line
+INNER_CAPITAL = re.compile(r'(?<=[^\s.!?:\n] )[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]+')
+# Types whose pattern also matches many ordinary words; a capitalized word covered only
+# by one of them still counts as unexplained
+LOW_CONFIDENCE_TYPES = frozenset({'DATOVÁ_SCHRÁNKA'})
+# Upper bounds of sentence lengths batched together; each bucket is sent to the
+# recognizer when it holds batch_size sentences
+BUCKET_BOUNDS = (128, 512, MAX_SENTENCE_CHARS)
+DEFAULT_BATCH_SIZE = 32
+NON_SPACE = re.compile(r'\S')
+
+def sentence_spans(text):
+    # (start, end) of every non-empty sentence or line, at most MAX_SENTENCE_CHARS long
+    position = 0
+    for match in [*SENTENCE_BREAK.finditer(text), None]:
+        end = match.start() if match is not None else len(text)
+        while end - position > MAX_SENTENCE_CHARS:
+            cut = text.rfind(' ', position + 1, position + MAX_SENTENCE_CHARS)
+            cut = cut if cut > position else position + MAX_SENTENCE_CHARS
+            yield position, cut
+            position = cut
+        if NON_SPACE.search(text, position, end):
+            yield position, end
+        if match is not None:
+            position = match.end()
+
+def suspicious_positions(text, entities):
+    # Ascending offsets of context cues and of capitalized words that no first-stage
+    # entity explains; entities are resolved, i.e. ordered and not overlapping. A
+    # sentence containing one of them goes to the second stage.
+    positions = [cue.start() for cue in CONTEXT_CUES.finditer(text)]
+    covered = (entity for entity in entities if entity['type'] not in LOW_CONFIDENCE_TYPES)
+    entity = next(covered, None)
+    for word in INNER_CAPITAL.finditer(text):
+        while entity is not None and entity['end'] <= word.start():
+            entity = next(covered, None)
+        if entity is None or word.start() < entity['start']:
+            positions.append(word.start())
+    positions.sort()
+    return positions
+
+class CascadeScheduler:
+    # Anonymizes documents with the cascade. run() returns the same results as
+    # detect_and_anonymize_pii; the counts tell how much text the second stage got.
+    def __init__(self, recognizer, selected_pii_types, anonymization_method, priorities=None,
+                 batch_size=DEFAULT_BATCH_SIZE, rules=None, time_budget=DEFAULT_TIME_BUDGET):
+        self.recognizer = recognizer
+        self.selected_pii_types = list(selected_pii_types)
+        self.anonymization_method = anonymization_method
+        self.rules = rules or active_rules()
+        self.priorities = dict(self.rules.priorities if priorities is None else priorities)
+        for entity_type, priority in recognizer.priorities.items():
+            self.priorities.setdefault(entity_type, priority)
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.counts = collections.Counter()
+
+    def run(self, texts):
+        engine = self.rules.engine(self.selected_pii_types)
+        detected = []
+        coarse = []
+        buckets = collections.defaultdict(list)
+        for index, text in enumerate(texts):
+            deadline = time.perf_counter() + self.time_budget if self.time_budget is not None else None
+            coarse_from = None
+            try:
+                found = engine.scan(text, deadline=deadline)
+            except TimeBudgetExceeded as exceeded:
+                found, coarse_from = exceeded.entities, exceeded.position
+            entities = resolve_entity_spans(text, found, self.priorities)
+            detected.append(entities)
+            coarse.append(coarse_from)
+            positions = suspicious_positions(text, entities)
+            self.counts['characters'] += len(text)
+            for start, end in sentence_spans(text):
+                if coarse_from is not None and end > coarse_from:
+                    break
+                self.counts['sentences'] += 1
+                first = bisect.bisect_left(positions, start)
+                if first == len(positions) or positions[first] >= end:
+                    continue
+                bucket = buckets[bisect.bisect_left(BUCKET_BOUNDS, end - start)]
+                bucket.append((index, start, end))
+                if len(bucket) >= self.batch_size:
+                    self._recognize(texts, bucket, detected)
+                    bucket.clear()
+        for bucket in buckets.values():
+            if bucket:
+                self._recognize(texts, bucket, detected)
+        return [anonymized_result(text, entities, coarse_from, self.anonymization_method, self.priorities, self.rules)
+                for text, entities, coarse_from in zip(texts, detected, coarse)]
+
+    def _recognize(self, texts, sentences, detected):
+        started = time.perf_counter()
+        found = self.recognizer.recognize([texts[index][start:end] for index, start, end in sentences])
+        self.counts['second_stage_seconds'] += time.perf_counter() - started
+        self.counts['batches'] += 1
+        for (index, start, end), entities in zip(sentences, found):
+            self.counts['second_stage_sentences'] += 1
+            self.counts['second_stage_characters'] += end - start
+            text = texts[index]
+            detected[index].extend(
+                {'start': start + entity['start'], 'end': start + entity['end'],
+                 'text': text[start + entity['start']:start + entity['end']], 'type': entity['type']}
+                for entity in entities
+            )
+
+    def drain_counts(self):
+        # Counts since the previous call, for merging counts of worker processes
+        counts, self.counts = self.counts, collections.Counter()
+        return counts
+
+def second_stage_share(counts):
+    # Summary of counts, also of counts merged from several processes
+    characters = counts['characters']
+    return {
+        'sentences': counts['sentences'],
+        'second_stage_sentences': counts['second_stage_sentences'],
+        'batches': counts['batches'],
+        'second_stage_seconds': round(counts['second_stage_seconds'], 3),
+        'share': counts['second_stage_characters'] / characters if characters else 0.0
+    }
+
+class StubRecognizer:
+    # Local stand-in for a NER model: patterns over the whole sentence and optionally a
+    # cost per character, so the cascade can be tested and measured without a model
+    DEFAULT_PATTERNS = {
+        'ORGANIZACE': r'\b(?:[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][\w&-]{1,30},? ){1,4}'
+                      r'(?:s\.\s?r\.\s?o\.|a\.\s?s\.|spol\. s r\.\s?o\.|v\.\s?o\.\s?s\.|k\.\s?s\.)',
+        'JMÉNO': r'(?:(?<=\bpan )|(?<=\bpaní )|(?<=\bpana )|(?<=\bpanu ))[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]{1,24}'
+                 r'(?: [A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]{1,24})?'
+    }
+    # Above JMÉNO, a company named after its owners is replaced as a whole
+    DEFAULT_PRIORITIES = {'ORGANIZACE': 25}
+
+    def __init__(self, patterns=None, priorities=None, seconds_per_char=0.0):
+        self.patterns = {t: re.compile(p) for t, p in (patterns or self.DEFAULT_PATTERNS).items()}
+        self.entity_types = list(self.patterns)
+        self.priorities = dict(self.DEFAULT_PRIORITIES if priorities is None else priorities)
+        self.seconds_per_char = seconds_per_char
+
+    def recognize(self, texts):
+        if self.seconds_per_char:
+            time.sleep(self.seconds_per_char * sum(len(text) for text in texts))
+        return [[{'start': match.start(), 'end': match.end(), 'type': entity_type}
+                 for entity_type, pattern in self.patterns.items() for match in pattern.finditer(text)]
+                for text in texts]
+
+RECOGNIZERS = {'stub': StubRecognizer}
+
+def load_recognizer(spec):
+    # 'stub' or 'module:factory' of a recognizer installed separately
+    if spec in RECOGNIZERS:
+        return RECOGNIZERS[spec]()
+    module, _, factory = spec.partition(':')
+    if not factory:
+        raise ValueError(f"Neznámý rozpoznávač: {spec} (použijte {', '.join(RECOGNIZERS)} nebo modul:třída)")
+    return getattr(importlib.import_module(module), factory)()
@@ -0,0 +1,749 @@
+import bisect
+import collections
+import contextlib
+import difflib
+import functools
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import re
+import time
+
+from .engine import DIGIT_RUN, TimeBudgetExceeded
+from .entities import EntityStore
+from .names import DEFAULT_GAZETTEER_PATH, NameRecognizer
+from .profiling import pipeline_profiler
+from .pseudonymization import DEFAULT_CAPACITY as DEFAULT_PSEUDONYM_CAPACITY, PseudonymStore, Pseudonymizer
+from .result_cache import pack_result, unpack_result
+from .rules import RuleSet
+
+# Detection and anonymization without any UI dependency. Faker, pandas and numpy are
+# imported only by the fake-data and tabular paths that need them, so a worker that
+# only masks text starts with the standard library and the regex engine.
+
+# Enhanced PII patterns (simplified for brevity). Every repetition that can fail after
+# consuming input is bounded, so a failed attempt at one position costs at most the
+# pattern's maximum width and a scan stays linear in the text length; `benchmark.py
+# --fuzz` checks this on adversarial inputs.
+PII_PATTERNS = {
+    'JMÉNO': r'\b(?:(?:Ing\.|Mgr\.|JUDr\.|MUDr\.|PhDr\.|RNDr\.|doc\.|prof\.|Dr\.) )?[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]{1,24}(?:[ -][A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]{1,24}){0,3}(?:(,? (?:CSc\.|DrSc\.|Ph\.D\.))?)\b',
+    'RODNÉ_ČÍSLO': r'\b\d{6}/\d{3,4}\b',
+    'DATUM_NAROZENÍ': r'\b(?:\d{1,2}\.? )?(?:\d{1,2}\.? )?(?:\d{4}|(?:led(?:na|en)|únor(?:a)?|břez(?:na|en)|dub(?:na|en)|květ(?:na|en)|červ(?:na|en(?:ec|ce)?)|srp(?:na|en)|září|říj(?:na|en)|listopa(?:du|d)|prosin(?:ec|ce)) ?\d{4})\b',
+    'TELEFON': r'\b(?:\+420 ?)?(?:(?:\d{3} ?){3}|\d{9})\b',
+    'EMAIL': r'\b[a-zA-Z0-9._%+-]{1,64}@[a-zA-Z0-9.-]{1,253}\.[a-zA-Z]{2,24}\b',
+    'ADRESA': r'\b[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]{1,24}(?:[ -][A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]{1,24}){0,4} \d{1,5}(?:/\d{1,5}[a-zA-Z]?)?,?\s{0,4}\d{3} ?\d{2} [A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]{1,24}(?:[ -][A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ][a-záčďéěíňóřšťúůýž]{1,24}){0,4}\b',
+    'ČÍSLO_OP': r'\b(?:\d{9}|\d{6} ?\d{3})\b',
+    'ČÍSLO_PASU': r'\b[A-Z]{2}\d{7}\b',
+    'BANKOVNÍ_ÚČET': r'\b\d{1,6}-?\d{2,10}/\d{4}\b',
+    'IČO': r'\b\d{8}\b',
+    'DIČ': r'\bCZ\d{8,10}\b',
+    'DATOVÁ_SCHRÁNKA': r'\b[a-zA-Z0-9]{7}\b'
+}
+
+# Cheap necessary conditions for a pattern to match: substrings every match contains,
+# the shortest digit run it contains and whether it needs an uppercase letter. Types
+# without an entry (DATOVÁ_SCHRÁNKA matches any 7-character word) are always scanned.
+PII_PREFILTERS = {
+    'JMÉNO': {'uppercase': True},
+    'RODNÉ_ČÍSLO': {'contains': ('/',), 'digits': 6},
+    'DATUM_NAROZENÍ': {'digits': 4},
+    'TELEFON': {'digits': 3},
+    'EMAIL': {'contains': ('@', '.')},
+    'ADRESA': {'uppercase': True, 'digits': 3},
+    'ČÍSLO_OP': {'digits': 6},
+    'ČÍSLO_PASU': {'uppercase': True, 'digits': 7},
+    'BANKOVNÍ_ÚČET': {'contains': ('/',), 'digits': 4},
+    'IČO': {'digits': 8},
+    'DIČ': {'contains': ('CZ',), 'digits': 8}
+}
+
+@functools.lru_cache(maxsize=None)
+def load_name_recognizer(binary=False):
+    return NameRecognizer.load(binary=binary)
+
+# Recognizers a rule set can name for a type instead of the type's regex
+RECOGNIZER_LOADERS = {
+    'gazetteer': load_name_recognizer
+}
+
+# Types detected by a dedicated recognizer instead of their regex in PII_PATTERNS. The
+# JMÉNO pattern takes every capitalized word; the gazetteer only takes known names.
+PII_RECOGNIZERS = {
+    'JMÉNO': 'gazetteer'
+}
+
+ANONYMIZATION_METHODS = ["Nahradit X", "Nahradit [TYP_ÚDAJE]", "Použít falešná data"]
+
+# When detected spans overlap, the type with the higher priority is kept; equal
+# priorities prefer the longer span and overlapping spans of one type are merged
+PII_PRIORITIES = {
+    'EMAIL': 120,
+    'RODNÉ_ČÍSLO': 110,
+    'BANKOVNÍ_ÚČET': 100,
+    'DIČ': 90,
+    'ADRESA': 80,
+    'ČÍSLO_PASU': 70,
+    'TELEFON': 60,
+    'ČÍSLO_OP': 50,
+    'DATUM_NAROZENÍ': 40,
+    'IČO': 30,
+    'JMÉNO': 20,
+    'DATOVÁ_SCHRÁNKA': 10
+}
+
+# Identical spans of different types are told apart by a word shortly before them on the
+# same line: every ID card number is also a valid phone number, which otherwise outranks
+# it. The cues are also compiled for UTF-8 bytes, which anonymize_file resolves.
+PII_CONTEXT_CUES = {
+    'ČÍSLO_OP': r'\bOP\b|[Oo]bčansk|průkaz'
+}
+CONTEXT_WINDOW = 32
+_CONTEXT_CUES = {t: (re.compile(p), re.compile(p.encode('utf-8'))) for t, p in PII_CONTEXT_CUES.items()}
+
+def _has_context_cue(text, entity):
+    cues = _CONTEXT_CUES.get(entity['type'])
+    if cues is None:
+        return False
+    cue, newline = (cues[0], '\n') if isinstance(text, str) else (cues[1], b'\n')
+    # Only the same line counts, form fields are usually one per line
+    start = max(entity['start'] - CONTEXT_WINDOW, text.rfind(newline, 0, entity['start']) + 1)
+    return cue.search(text, start, entity['start']) is not None
+
+# The rule set detection runs with. It is replaced as a whole, so a call that picked up
+# the active rule set finishes with it even when another one is activated meanwhile.
+DEFAULT_RULES = RuleSet('builtin', PII_PATTERNS, PII_PREFILTERS, PII_PRIORITIES, PII_RECOGNIZERS, RECOGNIZER_LOADERS)
+_rules = {'active': DEFAULT_RULES}
+
+def active_rules():
+    return _rules['active']
+
+def set_active_rules(rules):
+    # Returns the rule set that was active before
+    previous, _rules['active'] = _rules['active'], rules
+    return previous
+
+def load_rules(path):
+    # A loaded rule set uses a recognizer only for the types its "recognizers" name
+    return RuleSet.load(path, RECOGNIZER_LOADERS)
+
+def rules_from_config(config):
+    return RuleSet.from_config(config, RECOGNIZER_LOADERS)
+
+def get_detection_engine(selected_pii_types, binary=False, rules=None):
+    # A binary engine scans UTF-8 bytes, see anonymize_file
+    return (rules or active_rules()).engine(selected_pii_types, binary)
+
+def resolve_entity_spans(text, entities, priorities=None):
+    started = time.perf_counter() if pipeline_profiler.enabled else None
+    if priorities is None:
+        priorities = active_rules().priorities
+
+    def rank(entity):
+        return priorities.get(entity['type'], 0), entity['end'] - entity['start']
+
+    resolved = []
+    # One sweep over spans ordered by start; a kept span can only collide with the last one kept
+    for entity in sorted(entities, key=lambda e: (e['start'], -priorities.get(e['type'], 0), e['start'] - e['end'])):
+        if not resolved or entity['start'] >= resolved[-1]['end']:
+            resolved.append(entity)
+            continue
+        last = resolved[-1]
+        if entity['type'] == last['type']:
+            if entity['end'] > last['end']:
+                resolved[-1] = {'start': last['start'], 'end': entity['end'],
+                                'text': text[last['start']:entity['end']], 'type': last['type']}
+        elif rank(entity) > rank(last) or (
+                entity['start'] == last['start'] and entity['end'] == last['end']
+                and _has_context_cue(text, entity) and not _has_context_cue(text, last)):
+            resolved[-1] = entity
+    if started is not None:
+        pipeline_profiler.record('resolution', 'all', time.perf_counter() - started, calls=1, entities=len(entities))
+    return resolved
+
+def _anonymize_segments(text, entities, anonymization_method, start=0, end=None, replacements=None):
+    # Build the output from unchanged text segments and replacements in a single join;
+    # the replacements are also appended to the given list
+    started = time.perf_counter() if pipeline_profiler.enabled else None
+    segments = []
+    position = start
+    for entity in entities:
+        segments.append(text[position:entity['start']])
+        replacement = anonymize_entity(entity, anonymization_method)
+        segments.append(replacement)
+        if replacements is not None:
+            replacements.append(replacement)
+        position = entity['end']
+    segments.append(text[position:end])
+    if started is not None:
+        pipeline_profiler.record('anonymization', anonymization_method, time.perf_counter() - started, calls=1,
+                                 entities=len(entities))
+    return ''.join(segments)
+
+# Per-document time budget in seconds, None for no limit. A document that runs out of it
+# is finished in the coarse mode: every digit run not inside an already found entity is
+# masked, whatever the anonymization method.
+DEFAULT_TIME_BUDGET = float(os.environ['ANONYMIZER_TIME_BUDGET']) if os.environ.get('ANONYMIZER_TIME_BUDGET') else None
+COARSE_ENTITY_TYPE = 'ČÍSLO'
+
+def _coarse_entities(text, position, entities):
+    coarse = []
+    covered = iter(entities)
+    entity = next(covered, None)
+    for run in DIGIT_RUN.finditer(text, position):
+        while entity is not None and entity['end'] <= run.start():
+            entity = next(covered, None)
+        if entity is None or run.end() <= entity['start']:
+            coarse.append({'start': run.start(), 'end': run.end(), 'text': run.group(), 'type': COARSE_ENTITY_TYPE})
+    return coarse
+
+def detect_and_anonymize_pii(text, selected_pii_types, anonymization_method, priorities=None,
+                             time_budget=DEFAULT_TIME_BUDGET, rules=None):
+    rules = rules or active_rules()
+    deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    coarse_from = None
+    try:
+        detected = rules.engine(selected_pii_types).scan(text, deadline=deadline)
+    except TimeBudgetExceeded as exceeded:
+        detected, coarse_from = exceeded.entities, exceeded.position
+    return anonymized_result(text, detected, coarse_from, anonymization_method,
+                             rules.priorities if priorities is None else priorities, rules)
+
+def anonymized_result(text, detected, coarse_from, anonymization_method, priorities, rules):
+    # Resolves the detected spans, masks digit runs after coarse_from (where a scan ran
+    # out of time, or None) and builds the result of detect_and_anonymize_pii
+    entities = resolve_entity_spans(text, detected, priorities)
+    if coarse_from is not None:
+        entities = sorted(entities + _coarse_entities(text, coarse_from, entities),
+                          key=lambda entity: entity['start'])
+    replacements = []
+    anonymized_text = _anonymize_segments(text, entities, anonymization_method, replacements=replacements)
+    return {'original_text': text, 'anonymized_text': anonymized_text,
+            'entities': EntityStore.from_dicts(text, entities), 'degraded': coarse_from is not None,
+            'replacements': replacements, 'rules_version': rules.version,
+            'rules_digest': rules.digest}
+
+# Incremental re-anonymization of an edited document. Only the edited regions, widened
+# by the longest possible match, are scanned again; entities outside them keep their
+# previous replacement and are only shifted. Edits are found by comparing the common
+# prefix and suffix in blocks, and a longer changed middle is diffed line by line.
+DIFF_BLOCK_SIZE = 4096
+
+def _common_prefix(old, new, limit):
+    position = 0
+    while position < limit:
+        end = min(position + DIFF_BLOCK_SIZE, limit)
+        if old[position:end] != new[position:end]:
+            while old[position] == new[position]:
+                position += 1
+            return position
+        position = end
+    return limit
+
+def _common_suffix(old, new, limit):
+    length = 0
+    while length < limit:
+        end = min(length + DIFF_BLOCK_SIZE, limit)
+        if old[len(old) - end:len(old) - length] != new[len(new) - end:len(new) - length]:
+            while old[len(old) - length - 1] == new[len(new) - length - 1]:
+                length += 1
+            return length
+        length = end
+    return limit
+
+def text_edits(old, new):
+    # Returns the changed regions as (old_start, old_end, new_start, new_end)
+    if old == new:
+        return []
+    prefix = _common_prefix(old, new, min(len(old), len(new)))
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+    old_end, new_end = len(old) - suffix, len(new) - suffix
+    if max(old_end, new_end) - prefix <= DIFF_BLOCK_SIZE:
+        return [(prefix, old_end, prefix, new_end)]
+    old_lines = old[prefix:old_end].splitlines(keepends=True)
+    new_lines = new[prefix:new_end].splitlines(keepends=True)
+    old_offsets = list(itertools.accumulate(map(len, old_lines), initial=prefix))
+    new_offsets = list(itertools.accumulate(map(len, new_lines), initial=prefix))
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    return [(old_offsets[i1], old_offsets[i2], new_offsets[j1], new_offsets[j2])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+def _rescan_regions(starts, ends, edits, margin, old_length):
+    # Widens every edit by the margin and to the old entities it touches, and merges
+    # regions closer than the margin, so an entity found in one region cannot reach
+    # into the next one. Returns [old_start, old_end, new_start, new_end] lists.
+    regions = []
+    for old_start, old_end, new_start, new_end in edits:
+        start, end = max(old_start - margin, 0), min(old_end + margin, old_length)
+        index = bisect.bisect_right(ends, start)
+        if index < len(starts) and starts[index] < start:
+            start = starts[index]
+        index = bisect.bisect_left(starts, end) - 1
+        if index >= 0 and ends[index] > end:
+            end = ends[index]
+        region = [start, end, new_start - (old_start - start), new_end + (end - old_end)]
+        if regions and start < regions[-1][1] + margin:
+            regions[-1][1], regions[-1][3] = region[1], region[3]
+        else:
+            regions.append(region)
+    return regions
+
+def reanonymize_pii(previous, text, selected_pii_types, anonymization_method, priorities=None, rules=None):
+    # previous is the result for an earlier version of the text with the same types,
+    # method and priorities; the result is the same as detect_and_anonymize_pii(text)
+    # up to spans that a full scan would resolve differently across a region border.
+    # The anonymized text between the regions is copied from the previous result.
+    # A result of other rules is not reused at all; rules are compared by digest, as their
+    # version is a free-form label that may stay the same when patterns change.
+    rules = rules or active_rules()
+    replacements = previous.get('replacements')
+    if previous.get('degraded') or replacements is None or previous.get('rules_digest') != rules.digest:
+        return detect_and_anonymize_pii(text, selected_pii_types, anonymization_method, priorities, rules=rules)
+    old_text, old_entities, old_anonymized = previous['original_text'], previous['entities'], previous['anonymized_text']
+    edits = text_edits(old_text, text)
+    if not edits:
+        return previous
+    if priorities is None:
+        priorities = rules.priorities
+    engine = rules.engine(selected_pii_types)
+    # An edited context cue changes how the spans after it are resolved
+    margin = max(rules.max_match_length(selected_pii_types), CONTEXT_WINDOW) + 1
+    starts, ends = old_entities.starts, old_entities.ends
+    entities = EntityStore(text, old_entities.types)
+    new_replacements = []
+    pieces = []
+    index = 0             # first old entity not handled yet
+    old_position = 0      # old offset up to which the output is complete
+    anonymized_position = 0  # the same offset in the previous anonymized text
+    shift = 0
+
+    def length_change(begin, end):
+        # How much longer the previous replacements of old entities begin:end are
+        return sum(map(len, replacements[begin:end])) - old_entities.text_length(begin, end)
+
+    for old_start, old_end, new_start, new_end in _rescan_regions(starts, ends, edits, margin, len(old_text)):
+        first = bisect.bisect_left(starts, old_start)
+        entities.extend_from(old_entities, index, first, shift)
+        new_replacements.extend(replacements[index:first])
+        anonymized_start = anonymized_position + old_start - old_position + length_change(index, first)
+        pieces.append(old_anonymized[anonymized_position:anonymized_start])
+        detected = engine.scan(text, new_start, endpos=new_end)
+        shift = new_end - old_end
+        # Old entities the rescanned ones reach into are resolved together with them; the
+        # old entities of the region itself are always replaced, even if no rescanned span
+        # reaches its end
+        reach = max([new_end, *(entity['end'] for entity in detected)]) - shift
+        dropped = bisect.bisect_left(starts, old_end)
+        last = max(dropped, bisect.bisect_left(starts, reach))
+        neighbours = [{'start': starts[i] + shift, 'end': ends[i] + shift, 'text': old_entities.entity_text(i),
+                       'type': old_entities.entity_type(i)} for i in range(dropped, last)]
+        reused = {id(entity): replacement for entity, replacement in zip(neighbours, replacements[dropped:last])}
+        region_end = max(old_end, reach, ends[last - 1] if last > dropped else 0)
+        position = new_start
+        for entity in resolve_entity_spans(text, detected + neighbours, priorities):
+            replacement = reused.get(id(entity))
+            if replacement is None:
+                replacement = anonymize_entity(entity, anonymization_method)
+            pieces.append(text[position:entity['start']])
+            pieces.append(replacement)
+            position = entity['end']
+            entities.append(entity['start'], entity['end'], entity['type'])
+            new_replacements.append(replacement)
+        pieces.append(text[position:region_end + shift])
+        anonymized_position = anonymized_start + region_end - old_start + length_change(first, last)
+        index, old_position = last, region_end
+    entities.extend_from(old_entities, index, len(old_entities), shift)
+    new_replacements.extend(replacements[index:])
+    pieces.append(old_anonymized[anonymized_position:])
+    return {'original_text': text, 'anonymized_text': ''.join(pieces), 'entities': entities,
+            'degraded': False, 'replacements': new_replacements, 'rules_version': rules.version,
+            'rules_digest': rules.digest}
+
+def pattern_set_version(rules=None):
+    # Digest of everything that decides what is detected, part of every result cache key
+    return _pattern_set_version((rules or active_rules()).digest)
+
+@functools.lru_cache(maxsize=None)
+def _pattern_set_version(rules_digest):
+    digest = hashlib.sha256(rules_digest.encode('ascii'))
+    with open(DEFAULT_GAZETTEER_PATH, 'rb') as handle:
+        digest.update(handle.read())
+    return digest.hexdigest()[:16]
+
+def _settings_digest(selected_pii_types, anonymization_method, priorities, rules=None):
+    # Fake values depend on the pseudonymization secret and store as well
+    pseudonyms = get_pseudonymizer().fingerprint if anonymization_method == 'Použít falešná data' else ''
+    return hashlib.sha256('\0'.join([
+        pattern_set_version(rules), ','.join(sorted(set(selected_pii_types))), anonymization_method,
+        json.dumps(priorities, sort_keys=True, ensure_ascii=False) if priorities is not None else '', pseudonyms
+    ]).encode('utf-8'))
+
+def result_key(text, selected_pii_types, anonymization_method, priorities=None, settings=None, rules=None):
+    # settings is a _settings_digest to reuse for many texts with the same settings
+    digest = (settings or _settings_digest(selected_pii_types, anonymization_method, priorities, rules)).copy()
+    digest.update(text.encode('utf-8', errors='surrogatepass'))
+    return digest.digest()
+
+# Paragraphs are separated by a line with nothing but whitespace
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+def detect_and_anonymize_cached(text, selected_pii_types, anonymization_method, cache, priorities=None,
+                                time_budget=DEFAULT_TIME_BUDGET, paragraphs=False, rules=None):
+    # detect_and_anonymize_pii through a ResultCache. With paragraphs=True every paragraph
+    # is looked up and anonymized on its own, so a document repeating known paragraphs
+    # (quoted replies, signatures, templates) only scans the new ones; an entity can
+    # then not span a blank line. Results cut short by the time budget are not cached.
+    rules = rules or active_rules()
+    settings = _settings_digest(selected_pii_types, anonymization_method, priorities, rules)
+    if not paragraphs:
+        result = unpack_result(text, _cached_packed_result(text, selected_pii_types, anonymization_method, cache,
+                                                           priorities, time_budget, settings, rules))
+        return dict(result, rules_version=rules.version, rules_digest=rules.digest)
+    entities = EntityStore(text)
+    replacements = []
+    pieces = []
+    degraded = False
+    position = 0
+    bounds = [match.span() for match in PARAGRAPH_BREAK.finditer(text)] + [(len(text), len(text))]
+    for paragraph_end, next_start in bounds:
+        if paragraph_end > position:
+            anonymized_text, starts, ends, type_ids, types, part_replacements, part_degraded = _cached_packed_result(
+                text[position:paragraph_end], selected_pii_types, anonymization_method, cache, priorities,
+                time_budget, settings, rules)
+            pieces.append(anonymized_text)
+            entities.extend_columns(starts, ends, type_ids, types, position)
+            replacements.extend(part_replacements)
+            degraded = degraded or part_degraded
+        pieces.append(text[paragraph_end:next_start])
+        position = next_start
+    return {'original_text': text, 'anonymized_text': ''.join(pieces), 'entities': entities,
+            'degraded': degraded, 'replacements': replacements, 'rules_version': rules.version,
+            'rules_digest': rules.digest}
+
+def _cached_packed_result(text, selected_pii_types, anonymization_method, cache, priorities, time_budget,
+                          settings, rules):
+    key = result_key(text, selected_pii_types, anonymization_method, priorities, settings)
+    packed = cache.get(key)
+    if packed is not None:
+        return packed
+    packed = pack_result(detect_and_anonymize_pii(text, selected_pii_types, anonymization_method, priorities,
+                                                  time_budget, rules))
+    if not packed[-1]:
+        # Fake values are only the same in another process with a secret or a shared store
+        pseudonymizer = get_pseudonymizer() if anonymization_method == 'Použít falešná data' else None
+        shared = pseudonymizer is None or pseudonymizer.secret is not None or pseudonymizer.store is not None
+        cache.put(key, packed, shared=shared)
+    return packed
+
+STREAM_CHUNK_SIZE = 1 << 16
+
+def max_pii_match_length(selected_pii_types, rules=None):
+    return (rules or active_rules()).max_match_length(selected_pii_types)
+
+def _iter_chunks(source, chunk_size):
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from source
+
+def anonymize_stream(source, selected_pii_types, anonymization_method,
+                     chunk_size=STREAM_CHUNK_SIZE, priorities=None, rules=None):
+    # Yields (anonymized_chunk, entities) pairs for a file-like object or an iterable
+    # of text chunks; entity offsets are absolute positions in the whole input
+    rules = rules or active_rules()
+    if priorities is None:
+        priorities = rules.priorities
+    engine = rules.engine(selected_pii_types)
+    # Any match starting before the cut point lies fully inside the buffer, including
+    # the character after it needed by the trailing \b
+    window = rules.max_match_length(selected_pii_types) + 1
+    buffer = ''
+    context = 0  # leading characters of buffer already emitted, kept as \b and cue context
+    offset = 0   # absolute offset of buffer[context]
+    for chunk in itertools.chain(_iter_chunks(source, chunk_size), [None]):
+        final = chunk is None
+        if not final:
+            buffer += chunk
+            if len(buffer) - context <= window:
+                continue
+        detected = engine.scan(buffer, context)
+        cut = len(buffer) if final else len(buffer) - window
+        # Never cut through a detected span; moving the cut back can expose another one
+        for entity in reversed(detected):
+            if entity['start'] < cut < entity['end']:
+                cut = entity['start']
+        if cut <= context:
+            continue
+        entities = resolve_entity_spans(buffer, [e for e in detected if e['start'] < cut], priorities)
+        anonymized_chunk = _anonymize_segments(buffer, entities, anonymization_method, context, cut)
+        shift = offset - context
+        yield anonymized_chunk, [dict(e, start=e['start'] + shift, end=e['end'] + shift) for e in entities]
+        offset += cut - context
+        # The kept context also holds the cue words before a span, see PII_CONTEXT_CUES
+        keep = min(cut, CONTEXT_WINDOW)
+        buffer = buffer[cut - keep:]
+        context = keep
+
+# Large files are scanned in place as UTF-8 bytes: the file is memory-mapped, the byte
+# versions of the patterns run directly on the map and unchanged byte ranges are copied
+# from it to the output, so neither the input nor the output is ever held as a str.
+# The map is scanned in slices of this many bytes; only the entities of one slice are
+# kept in memory.
+FILE_SCAN_SIZE = 1 << 20
+
+@contextlib.contextmanager
+def _mapped_file(path):
+    with open(path, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            # An empty file cannot be mapped
+            yield b''
+            return
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+def max_pii_match_bytes(selected_pii_types, rules=None):
+    return (rules or active_rules()).max_match_length(selected_pii_types, binary=True)
+
+def _iter_file_entities(data, selected_pii_types, priorities, chunk_size, rules=None, on_progress=None):
+    # Same cutting as anonymize_stream, on positions in the map instead of a buffer.
+    # on_progress is called with the byte offset up to which the file is done after
+    # every slice, also when the slice had no entities.
+    rules = rules or active_rules()
+    if priorities is None:
+        priorities = rules.priorities
+    engine = rules.engine(selected_pii_types, binary=True)
+    window = rules.max_match_length(selected_pii_types, binary=True) + 1
+    start = 0
+    size = chunk_size
+    while start < len(data):
+        end = min(len(data), start + size)
+        final = end == len(data)
+        detected = engine.scan(data, start, endpos=None if final else end + window)
+        cut = end
+        for entity in reversed(detected):
+            if entity['start'] < cut < entity['end']:
+                cut = entity['start']
+        if cut <= start:
+            # One detected span covers the whole slice
+            size *= 2
+            continue
+        yield from resolve_entity_spans(data, [e for e in detected if e['start'] < cut], priorities)
+        start = cut
+        size = chunk_size
+        if on_progress is not None:
+            on_progress(start)
+
+def scan_file(path, selected_pii_types, priorities=None, chunk_size=FILE_SCAN_SIZE, rules=None):
+    # Yields the resolved entities of a UTF-8 text file; start and end are byte offsets
+    # and text is the decoded value
+    with _mapped_file(path) as data:
+        for entity in _iter_file_entities(data, selected_pii_types, priorities, chunk_size, rules):
+            yield dict(entity, text=entity['text'].decode('utf-8', errors='replace'))
+
+def anonymize_file(input_path, output_path, selected_pii_types, anonymization_method, priorities=None,
+                   chunk_size=FILE_SCAN_SIZE, on_entity=None, rules=None, on_progress=None):
+    # Writes the anonymized file and returns the number of entities per type; on_entity
+    # is called with every entity (byte offsets, decoded text) before it is replaced,
+    # on_progress with the byte offset scanned so far after every slice
+    counts = collections.Counter()
+    with _mapped_file(input_path) as data, open(output_path, 'wb') as output, memoryview(data) as view:
+        position = 0
+        for entity in _iter_file_entities(data, selected_pii_types, priorities, chunk_size, rules, on_progress):
+            entity = dict(entity, text=entity['text'].decode('utf-8', errors='replace'))
+            if on_entity is not None:
+                on_entity(entity)
+            output.write(view[position:entity['start']])
+            output.write(anonymize_entity(entity, anonymization_method).encode('utf-8'))
+            position = entity['end']
+            counts[entity['type']] += 1
+        output.write(view[position:])
+    return counts
+
+# Cells of a column are scanned as one text, joined by a character no pattern can
+# match, so a match never spans two cells
+CELL_SEPARATOR = '\x00'
+TABLE_SCAN_SIZE = 1 << 20
+COLUMN_SAMPLE_SIZE = 1000
+COLUMN_MIN_SHARE = 0.05
+
+def _value_slices(values, max_chars):
+    start = size = 0
+    for i, value in enumerate(values):
+        size += len(value) + 1
+        if size >= max_chars:
+            yield values[start:i + 1]
+            start, size = i + 1, 0
+    if start < len(values):
+        yield values[start:]
+
+def anonymize_values(values, selected_pii_types, anonymization_method, priorities=None, rules=None):
+    # One scan and one join per slice of values instead of a detection call per value
+    rules = rules or active_rules()
+    if priorities is None:
+        priorities = rules.priorities
+    engine = rules.engine(selected_pii_types)
+    anonymized = []
+    for part in _value_slices(values, TABLE_SCAN_SIZE):
+        text = CELL_SEPARATOR.join(part)
+        if text.count(CELL_SEPARATOR) != len(part) - 1:
+            # A value contains the separator itself
+            anonymized.extend(detect_and_anonymize_pii(value, selected_pii_types, anonymization_method,
+                                                       priorities, rules=rules)['anonymized_text'] for value in part)
+            continue
+        entities = resolve_entity_spans(text, engine.scan(text), priorities)
+        anonymized.extend(_anonymize_segments(text, entities, anonymization_method).split(CELL_SEPARATOR))
+    return anonymized
+
+def anonymize_series(series, selected_pii_types, anonymization_method, priorities=None):
+    # Every distinct value is anonymized once and spread back over the rows by its code.
+    # Missing values stay missing, categorical columns stay categorical and a column
+    # without any detected PII is returned unchanged with its original dtype.
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = pd.factorize(series)
+    originals = [str(value) for value in uniques]
+    anonymized = anonymize_values(originals, selected_pii_types, anonymization_method, priorities)
+    if anonymized == originals:
+        return series
+    new_codes, new_uniques = pd.factorize(np.array(anonymized, dtype=object))
+    codes = np.where(codes < 0, -1, new_codes[codes])
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.Series(pd.Categorical.from_codes(codes, new_uniques), index=series.index, name=series.name)
+    values = np.asarray(new_uniques, dtype=object).take(codes)
+    missing = codes < 0
+    values[missing] = series.to_numpy(dtype=object)[missing]
+    result = pd.Series(values, index=series.index, name=series.name)
+    return result.astype(series.dtype) if pd.api.types.is_string_dtype(series.dtype) else result
+
+def _column_pii_types(types):
+    patterns = active_rules().patterns
+    if types is None:
+        return list(patterns)
+    types = [types] if isinstance(types, str) else list(types)
+    unknown = [t for t in types if t not in patterns]
+    if unknown:
+        raise ValueError(f"Neznámé typy PII: {', '.join(unknown)}")
+    return types
+
+def detect_column_types(df, selected_pii_types=None, sample_size=COLUMN_SAMPLE_SIZE,
+                        min_share=COLUMN_MIN_SHARE):
+    # Maps each column to the PII types found in at least min_share of a sample of its
+    # non-empty cells; columns without any are left out
+    selected_pii_types = _column_pii_types(selected_pii_types)
+    engine = get_detection_engine(selected_pii_types)
+    column_types = {}
+    for column in df.columns:
+        sample = df[column].dropna()
+        if len(sample) > sample_size:
+            sample = sample.sample(sample_size, random_state=0)
+        values = [str(value) for value in sample if str(value).strip()]
+        text = CELL_SEPARATOR.join(values)
+        if not values or text.count(CELL_SEPARATOR) != len(values) - 1:
+            continue
+        starts = list(itertools.accumulate((len(value) + 1 for value in values[:-1]), initial=0))
+        cells = collections.defaultdict(set)
+        for entity in resolve_entity_spans(text, engine.scan(text)):
+            cells[entity['type']].add(bisect.bisect_right(starts, entity['start']))
+        types = [t for t in selected_pii_types if len(cells[t]) >= min_share * len(values)]
+        if types:
+            column_types[column] = types
+    return column_types
+
+def anonymize_dataframe(df, anonymization_method, column_types=None, priorities=None):
+    # column_types maps a column to the PII types looked for in it: a type, a list of
+    # types or None for all of them. Without a mapping it is detected from a sample.
+    # Returns a new DataFrame; columns that are not mapped are shared with the input.
+    if column_types is None:
+        column_types = detect_column_types(df)
+    result = df.copy(deep=False)
+    for column, types in column_types.items():
+        result[column] = anonymize_series(df[column], _column_pii_types(types), anonymization_method, priorities)
+    return result
+
+def anonymize_entity(entity, method):
+    if method == 'Nahradit X' or entity['type'] == COARSE_ENTITY_TYPE:
+        return 'X' * len(entity['text'])
+    elif method == 'Nahradit [TYP_ÚDAJE]':
+        return f"[{entity['type']}]"
+    elif method == 'Použít falešná data':
+        return get_pseudonymizer().pseudonymize(entity['type'], entity['text'])
+    return entity['text']
+
+@functools.lru_cache(maxsize=None)
+def _shared_faker():
+    from faker import Faker
+
+    return Faker('cs_CZ')
+
+@functools.lru_cache(maxsize=None)
+def _seeded_faker():
+    from faker import Faker
+
+    return Faker('cs_CZ')
+
+def _faker_generator(provider):
+    # Bulk generator for the pools; values Faker can only produce one by one are
+    # generated ahead of time instead of inside the anonymization loop
+    def generate(rng, size):
+        generator = _seeded_faker()
+        generator.seed_instance(int(rng.integers(2 ** 63)))
+        return [getattr(generator, provider)() for _ in range(size)]
+    return generate
+
+@functools.lru_cache(maxsize=None)
+def fake_value_pools():
+    from .generators import FakeValuePools
+
+    pools = FakeValuePools()
+    pools.register('JMÉNO', _faker_generator('name'))
+    pools.register('EMAIL', _faker_generator('email'))
+    pools.register('ADRESA', _faker_generator('address'))
+    return pools
+
+def generate_fake_value(entity_type, original=None, seed=None):
+    pools = fake_value_pools()
+    if entity_type in pools:
+        from .generators import follow_layout
+
+        return follow_layout(entity_type, original, pools.draw(entity_type, seed))
+    generator = _shared_faker()
+    if seed is not None:
+        # Deterministic pseudonyms use their own instance so the shared one stays random
+        generator = _seeded_faker()
+        generator.seed_instance(seed)
+    return generator.word()
+
+# Fake-data replacements are consistent per (type, normalized value). Setting
+# ANONYMIZER_PSEUDONYM_SECRET makes them deterministic across processes and runs,
+# ANONYMIZER_PSEUDONYM_STORE keeps them in a SQLite file.
+_pseudonymizer = {}
+
+def configure_pseudonymization(secret=None, store_path=None, capacity=DEFAULT_PSEUDONYM_CAPACITY):
+    previous = _pseudonymizer.get('instance')
+    if previous is not None and _pseudonymizer.get('pid') == os.getpid():
+        previous.close()
+    if store_path and not secret:
+        # Checked before the store file is created
+        raise ValueError("Úložiště pseudonymů vyžaduje tajný klíč (ANONYMIZER_PSEUDONYM_SECRET)")
+    store = PseudonymStore(store_path) if store_path else None
+    instance = Pseudonymizer(generate_fake_value, capacity=capacity, secret=secret, store=store)
+    _pseudonymizer.update(instance=instance, pid=os.getpid(),
+                          settings=(secret, store_path, capacity))
+    return instance
+
+def get_pseudonymizer():
+    # Created lazily and again after a fork, so worker processes never share a connection
+    if _pseudonymizer.get('pid') != os.getpid():
+        settings = _pseudonymizer.get('settings') or (
+            os.environ.get('ANONYMIZER_PSEUDONYM_SECRET'),
+            os.environ.get('ANONYMIZER_PSEUDONYM_STORE'),
+            DEFAULT_PSEUDONYM_CAPACITY
+        )
+        configure_pseudonymization(*settings)
+    return _pseudonymizer['instance']
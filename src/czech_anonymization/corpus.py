@@ -0,0 +1,238 @@
+import json
+import string
+
+import numpy as np
+from faker import Faker
+
+from .generators import GENERATORS
+
+# Document templates modelled on the samples in the test data page. A field named
+# after a PII type is filled with a fake value and labeled; "TYPE#role" gives a second
+# value of the same type in one document. Lowercase fields are unlabeled filler.
+TEMPLATES = {
+    'cv': """{JMÉNO}
+{ADRESA}
+Tel: {TELEFON}
+E-mail: {EMAIL}
+
+Datum narození: {DATUM_NAROZENÍ}
+Stav: {stav}
+
+Vzdělání:
+{rok_od}-{rok_do}: Vysoká škola v {mesto}, obor {obor}
+
+Pracovní zkušenosti:
+{rok_do}-současnost: {pozice}, {firma}
+  - Zpracování reportů a komunikace s klienty
+  - Vedení týmu {pocet} lidí
+
+Reference: {JMÉNO#reference}, tel. {TELEFON#reference}
+""",
+    'medical_report': """Lékařská zpráva
+
+Pacient: {JMÉNO}
+Rodné číslo: {RODNÉ_ČÍSLO}
+Datum narození: {DATUM_NAROZENÍ}
+Bydliště: {ADRESA}
+Číslo OP: {ČÍSLO_OP}
+
+Anamnéza: Pacient přichází pro bolesti v oblasti {oblast} trvající {pocet} dní.
+Objektivně: TK {tlak}/80, puls {puls}/min, afebrilní.
+
+Diagnóza: Suspektní {diagnoza}. Doporučeno kontrolní vyšetření za {pocet} týdny.
+
+Vypracoval: {JMÉNO#lékař}
+Kontakt na ordinaci: {TELEFON}, datová schránka {DATOVÁ_SCHRÁNKA}
+""",
+    'invoice': """Faktura č. {cislo_faktury}
+
+Dodavatel:
+{firma}
+{ADRESA}
+IČO: {IČO}
+DIČ: {DIČ}
+
+Odběratel:
+{JMÉNO}
+{ADRESA#odběratel}
+
+Datum splatnosti: {datum}
+Forma úhrady: bankovní převod
+
+Položka                     Množství    Cena/ks
+---------------------------------------------
+Servis zařízení                  1     {castka} Kč
+Náhradní díly                    {pocet}     {castka#dily} Kč
+
+Číslo účtu pro platbu: {BANKOVNÍ_ÚČET}
+""",
+    'email': """Od: {EMAIL}
+Komu: {EMAIL#příjemce}
+Předmět: Žádost o změnu osobních údajů
+
+Vážení,
+
+prosím o změnu mých kontaktních údajů ve Vašem systému. Nové údaje jsou následující:
+
+Jméno: {JMÉNO}
+Nová adresa: {ADRESA}
+Nový telefon: {TELEFON}
+
+Moje identifikační údaje:
+Rodné číslo: {RODNÉ_ČÍSLO}
+Číslo pasu: {ČÍSLO_PASU}
+Číslo účtu: {BANKOVNÍ_ÚČET}
+
+S pozdravem,
+{JMÉNO}
+"""
+}
+
+# Names for the JMÉNO labels. Faker's lists are part of the name gazetteer, so names drawn
+# from them would always be found; these are written down independently and include
+# names the gazetteer may not know
+BENCHMARK_FIRST_NAMES = {
+    'M': '''
+        Adam Aleš Alois Antonín Bedřich Bohumil Bohuslav Bořivoj Ctibor Čestmír Dalibor Dobroslav
+        Dominik Drahomír Eduard Emil Filip František Hynek Ivo Jakub Jan Jaromír Jaroslav Jindřich
+        Jiří Josef Kamil Karel Kryštof Ladislav Leoš Libor Lubomír Luboš Lukáš Marek Matěj Metoděj
+        Michal Milan Miloslav Miroslav Oldřich Ondřej Otakar Patrik Pavel Petr Přemysl Radek Radim
+        Radovan Richard Robert Rostislav Stanislav Svatopluk Šimon Štěpán Tadeáš Tomáš Vavřinec
+        Václav Vilém Vít Vítězslav Vladimír Vladislav Vlastimil Vojtěch Zbyněk Zdeněk Zikmund
+    '''.split(),
+    'Z': '''
+        Adéla Alena Alžběta Anežka Barbora Blanka Bohdana Božena Dagmar Dana Daniela Drahomíra Eliška
+        Eva Gabriela Hana Helena Irena Ivana Iveta Jana Jarmila Jaroslava Jindřiška Jiřina Jitka
+        Johana Kamila Karolína Kateřina Klára Kristýna Lenka Libuše Lucie Ludmila Magdaléna Markéta
+        Marie Marta Martina Miloslava Miroslava Monika Naděžda Nikola Olga Pavla Petra Radka Renata
+        Romana Růžena Simona Soňa Stanislava Šárka Taťána Tereza Vendula Věra Veronika Vlasta Zdeňka
+        Zuzana Žaneta
+    '''.split()
+}
+# Male and female form of each surname
+BENCHMARK_SURNAMES = [pair.split('/') for pair in '''
+    Bartoš/Bartošová Beneš/Benešová Bláha/Bláhová Brabec/Brabcová Bureš/Burešová Čermák/Čermáková
+    Černý/Černá Doležal/Doležalová Dušek/Dušková Dvořák/Dvořáková Fiala/Fialová Hájek/Hájková
+    Havlíček/Havlíčková Hlaváček/Hlaváčková Holub/Holubová Horák/Horáková Hrubý/Hrubá
+    Hruška/Hrušková Janda/Jandová Jelínek/Jelínková Ježek/Ježková Kadlec/Kadlecová Kolář/Kolářová
+    Konečný/Konečná Kopecký/Kopecká Kovář/Kovářová Kratochvíl/Kratochvílová Krejčí/Krejčí
+    Kříž/Křížová Kučera/Kučerová Kysela/Kyselová Langer/Langerová Machala/Machalová Malý/Malá
+    Mareš/Marešová Matoušek/Matoušková Moravec/Moravcová Musil/Musilová Navrátil/Navrátilová
+    Němec/Němcová Novotný/Novotná Pešek/Pešková Pokorný/Pokorná Pospíšil/Pospíšilová
+    Procházka/Procházková Říha/Říhová Růžička/Růžičková Sedláček/Sedláčková Skála/Skálová
+    Slabý/Slabá Soukup/Soukupová Stejskal/Stejskalová Sýkora/Sýkorová Šafránek/Šafránková
+    Šimek/Šimková Šindelář/Šindelářová Škoda/Škodová Šťastný/Šťastná Tichý/Tichá Tomášek/Tomášková
+    Trnka/Trnková Urban/Urbanová Vacek/Vacková Valenta/Valentová Vávra/Vávrová Veselý/Veselá
+    Vlček/Vlčková Vondráček/Vondráčková Vrba/Vrbová Zajíc/Zajícová Zbořil/Zbořilová
+    Zelenka/Zelenková Zeman/Zemanová Žák/Žáková Adámek/Adámková Bednář/Bednářová Brož/Brožová
+    Cibulka/Cibulková Dostál/Dostálová Franěk/Fraňková Gregor/Gregorová Hanzlík/Hanzlíková
+    Hejduk/Hejduková Hrdlička/Hrdličková Chalupa/Chalupová Jirásek/Jirásková Kafka/Kafková
+    Klíma/Klímová Kotrba/Kotrbová Lukeš/Lukešová Macháček/Macháčková Mach/Machová
+    Nedbal/Nedbalová Ondráček/Ondráčková Pavlík/Pavlíková Petrů/Petrů Plíšek/Plíšková
+    Rejchrt/Rejchrtová Smetana/Smetanová Stoklasa/Stoklasová Šebek/Šebková Švec/Švecová
+    Tůma/Tůmová Uhlíř/Uhlířová Vaňura/Vaňurová Voříšek/Voříšková Zikmund/Zikmundová
+    Ženíšek/Ženíšková Bečvář/Bečvářová Drbohlav/Drbohlavová Kočvara/Kočvarová Mrkvička/Mrkvičková
+    Pelikán/Pelikánová Rybář/Rybářová Střelec/Střelcová Šustr/Šustrová Vopička/Vopičková
+'''.split()]
+# Share of names written with a title before them or a degree after them
+NAME_TITLES = ['Ing.', 'Mgr.', 'MUDr.', 'JUDr.', 'Bc.', 'doc. MUDr.']
+NAME_DEGREES = [', Ph.D.', ', CSc.']
+NAME_TITLE_SHARE = 0.15
+NAME_DEGREE_SHARE = 0.05
+# Birth dates are written the way the DATUM_NAROZENÍ pattern expects Czech dates, with
+# spaces after the dots or with the month name
+MONTHS_GENITIVE = ['ledna', 'února', 'března', 'dubna', 'května', 'června', 'července', 'srpna', 'září',
+                   'října', 'listopadu', 'prosince']
+
+FILLERS = {
+    'stav': lambda fake, rng: str(rng.choice(['svobodný', 'ženatý', 'vdaná', 'rozvedený'])),
+    'obor': lambda fake, rng: str(rng.choice(['Finance', 'Informatika', 'Právo', 'Marketing'])),
+    'oblast': lambda fake, rng: str(rng.choice(['břicha', 'zad', 'hrudníku', 'kolene'])),
+    'diagnoza': lambda fake, rng: str(rng.choice(['cholecystitis', 'lumbago', 'gastritis', 'distorze kolene'])),
+    'rok_od': lambda fake, rng: str(rng.integers(1990, 2005)),
+    'rok_do': lambda fake, rng: str(rng.integers(2005, 2015)),
+    'pocet': lambda fake, rng: str(rng.integers(2, 10)),
+    'tlak': lambda fake, rng: str(rng.integers(110, 160)),
+    'puls': lambda fake, rng: str(rng.integers(55, 100)),
+    'castka': lambda fake, rng: str(rng.integers(100, 20000)),
+    'cislo_faktury': lambda fake, rng: f'FV{rng.integers(2020, 2025)}-{rng.integers(1, 999):03d}',
+    'datum': lambda fake, rng: fake.date(pattern='%d.%m.%Y'),
+    'mesto': lambda fake, rng: fake.city(),
+    'pozice': lambda fake, rng: fake.job(),
+    'firma': lambda fake, rng: fake.company()
+}
+
+def _person_name(rng):
+    gender = str(rng.choice(['M', 'Z']))
+    first = str(rng.choice(BENCHMARK_FIRST_NAMES[gender]))
+    surname = BENCHMARK_SURNAMES[int(rng.integers(len(BENCHMARK_SURNAMES)))][gender == 'Z']
+    name = f'{first} {surname}'
+    if rng.random() < NAME_TITLE_SHARE:
+        name = f'{rng.choice(NAME_TITLES)} {name}'
+    if rng.random() < NAME_DEGREE_SHARE:
+        name += str(rng.choice(NAME_DEGREES))
+    return name
+
+def _birth_date(rng):
+    day, month, year = GENERATORS['DATUM_NAROZENÍ'](rng, 1)[0].split('.')
+    if rng.random() < 0.5:
+        return f'{day}. {month}. {year}'
+    return f'{day}. {MONTHS_GENITIVE[int(month) - 1]} {year}'
+
+def _pii_value(entity_type, fake, rng):
+    if entity_type == 'JMÉNO':
+        return _person_name(rng)
+    if entity_type == 'DATUM_NAROZENÍ':
+        return _birth_date(rng)
+    if entity_type == 'EMAIL':
+        return fake.email()
+    if entity_type == 'ADRESA':
+        return fake.address().replace('\n', ', ')
+    return GENERATORS[entity_type](rng, 1)[0]
+
+_formatter = string.Formatter()
+
+def render(template, fake, rng):
+    # Returns the document text and the labeled spans of the PII fields in it
+    values = {}
+    parts = []
+    entities = []
+    position = 0
+    for literal, field, _, _ in _formatter.parse(template):
+        parts.append(literal)
+        position += len(literal)
+        if field is None:
+            continue
+        entity_type = field.split('#')[0]
+        if field not in values:
+            if entity_type in FILLERS:
+                values[field] = FILLERS[entity_type](fake, rng)
+            else:
+                values[field] = _pii_value(entity_type, fake, rng)
+        value = values[field]
+        if entity_type not in FILLERS:
+            entities.append({'start': position, 'end': position + len(value), 'text': value, 'type': entity_type})
+        parts.append(value)
+        position += len(value)
+    return ''.join(parts), entities
+
+def generate_corpus(size, seed=0, kinds=None):
+    # The same size, seed and kinds always give the same corpus
+    fake = Faker('cs_CZ')
+    fake.seed_instance(seed)
+    rng = np.random.default_rng(seed)
+    kinds = list(kinds or TEMPLATES)
+    documents = []
+    for kind in rng.choice(kinds, size=size).tolist():
+        text, entities = render(TEMPLATES[kind], fake, rng)
+        documents.append({'kind': kind, 'text': text, 'entities': entities})
+    return documents
+
+def write_corpus(path, documents):
+    with open(path, 'w', encoding='utf-8') as handle:
+        for document in documents:
+            handle.write(json.dumps(document, ensure_ascii=False) + '\n')
+
+def read_corpus(path):
+    with open(path, encoding='utf-8') as handle:
+        return [json.loads(line) for line in handle if line.strip()]
@@ -0,0 +1,275 @@
+import collections
+import heapq
+import itertools
+import re
+import time
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from .profiling import pipeline_profiler
+from .utf8 import NOT_AFTER_WORD, WORD_BOUNDARY, compile_pattern
+
+# Length assumed for patterns with unbounded repetition wherever the longest possible
+# match is needed
+MAX_UNBOUNDED_MATCH_LENGTH = 256
+
+def max_match_length(patterns):
+    longest = 0
+    for pattern in patterns:
+        width = sre_parse.parse(pattern).getwidth()[1]
+        longest = max(longest, width if width < sre_parse.MAXREPEAT else MAX_UNBOUNDED_MATCH_LENGTH)
+    return longest
+
+PREFILTER_BLOCK_SIZE = 2048
+# Both start with a character class, which lets re skip ahead to the first candidate
+DIGIT_RUN = re.compile(r'\d\d*')
+UPPERCASE_LETTER = re.compile(r'[A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ]')
+BINARY_DIGIT_RUN = compile_pattern(DIGIT_RUN.pattern, binary=True)
+BINARY_UPPERCASE_LETTER = compile_pattern(UPPERCASE_LETTER.pattern, binary=True)
+
+class TimeBudgetExceeded(Exception):
+    # The text before position has been scanned completely; entities are its matches
+    def __init__(self, position, *found):
+        super().__init__(position)
+        self.position = position
+        self.entities = sorted(itertools.chain.from_iterable(found), key=lambda entity: entity['start'])
+
+def _check_deadline(deadline, position, *found):
+    if deadline is not None and time.perf_counter() > deadline:
+        raise TimeBudgetExceeded(position, *found)
+
+def _recognizer_exceeded(exceeded, *found):
+    # A recognizer ran out of time at exceeded.position; matches of the other scans are
+    # cut there too, so everything before the position is complete
+    return TimeBudgetExceeded(exceeded.position, exceeded.entities,
+                              *([entity for entity in entities if entity['start'] < exceeded.position]
+                                for entities in found))
+
+class DetectionEngine:
+    # Staged single-pass matcher over all selected patterns. A combined alternation
+    # walks the text once and finds the regions where some pattern matches; only inside
+    # those regions a chain of optional named lookaheads reports every type matching at
+    # each candidate position, so overlapping matches of different types are kept.
+    # With prefilters the text is split into blocks at line ends and each block is
+    # scanned only for the types whose prefilter passes on it.
+    # A binary engine takes patterns already translated by utf8_pattern and scans UTF-8
+    # bytes (bytes or an mmap); entity offsets and texts are then in bytes too.
+    def __init__(self, patterns, prefilters=None, recognizers=None, binary=False):
+        # Types with a recognizer are found by it instead of by their pattern
+        self.recognizers = dict(recognizers or {})
+        self.patterns = {t: p for t, p in patterns.items() if t not in self.recognizers}
+        self.entity_types = list(self.patterns)
+        self.prefilters = {t: prefilters[t] for t in self.entity_types if t in (prefilters or {})}
+        self.binary = binary
+        if binary:
+            # Literals may already be encoded when passed on from a binary engine
+            self.prefilters = {t: dict(p, contains=tuple(c.encode('utf-8') if isinstance(c, str) else c
+                                                         for c in p.get('contains', ())))
+                               for t, p in self.prefilters.items()}
+        self.newline = b'\n' if binary else '\n'
+        self.digit_run = BINARY_DIGIT_RUN if binary else DIGIT_RUN
+        self.uppercase_letter = BINARY_UPPERCASE_LETTER if binary else UPPERCASE_LETTER
+        # Features are taken over the block plus the longest match that can start in it
+        self.window = max_match_length(self.patterns.values())
+        self.subengines = {}
+        self.profiling_engines = {}
+        self.stats = collections.Counter()
+        bodies = list(self.patterns.values())
+        # A shared leading \b is checked once instead of once per type, and word ends
+        # followed by whitespace are skipped before any of the patterns is tried
+        # A leading \b of a binary pattern followed by a word character is translated to
+        # NOT_AFTER_WORD alone; that implies the full boundary, so it shares the prefix
+        # and stays in its body
+        boundary = WORD_BOUNDARY if binary else r'\b'
+        shared_boundary = all(body.startswith(boundary) or binary and body.startswith(NOT_AFTER_WORD)
+                              for body in bodies)
+        if shared_boundary:
+            bodies = [body[len(boundary):] if body.startswith(boundary) else body for body in bodies]
+        prefix = boundary + r'(?=\S)' if shared_boundary else ''
+        self.candidates = self._compile(prefix)
+        self.regions = self._compile(prefix + '(?:' + ('|'.join(f'(?:{body})' for body in bodies) or '(?!)') + ')')
+        fallback = '(?!)'
+        for index in reversed(range(len(bodies))):
+            fallback = f'(?(_t{index})|{fallback})'
+        self.chain = self._compile(''.join(f'(?=(?P<_t{index}>{body}))?' for index, body in enumerate(bodies))
+                                   + fallback)
+        self.slots = [(self.chain.groupindex[f'_t{index}'], entity_type)
+                      for index, entity_type in enumerate(self.entity_types)]
+
+    def _compile(self, pattern):
+        return re.compile(pattern.encode('ascii') if self.binary else pattern)
+
+    def scan(self, text, pos=0, deadline=None, endpos=None):
+        # With a deadline (a time.perf_counter() value) the clock is checked before
+        # every block; TimeBudgetExceeded carries the matches found until then. With
+        # endpos only matches starting before it are reported, but they may end after it.
+        if endpos is None or endpos > len(text):
+            endpos = len(text)
+        if pipeline_profiler.enabled:
+            return self._profiled_scan(text, pos, deadline, endpos)
+        entities = self._scan_patterns(text, pos, deadline, endpos)
+        if not self.recognizers:
+            return entities
+        found = []
+        for recognizer in self.recognizers.values():
+            try:
+                found.append(recognizer.scan(text, pos, endpos, deadline))
+            except TimeBudgetExceeded as exceeded:
+                raise _recognizer_exceeded(exceeded, entities, *found)
+        return list(heapq.merge(entities, *found, key=lambda entity: entity['start']))
+
+    def _profiled_scan(self, text, pos, deadline=None, endpos=None):
+        # Every type is scanned on its own so its time can be attributed to it; stably
+        # sorted by start, the matches come out exactly as from the combined scan
+        found = []
+        for entity_type in self.entity_types:
+            engine = self.profiling_engines.get(entity_type)
+            if engine is None:
+                engine = self.profiling_engines[entity_type] = DetectionEngine(
+                    {entity_type: self.patterns[entity_type]}, self.prefilters, binary=self.binary)
+            scanned = engine.stats['scanned_pattern_characters']
+            started = time.perf_counter()
+            try:
+                entities = engine._scan_patterns(text, pos, deadline, endpos)
+            except TimeBudgetExceeded:
+                # Later types have not been scanned at all
+                raise TimeBudgetExceeded(pos, *found)
+            elapsed = time.perf_counter() - started
+            characters = engine.stats['scanned_pattern_characters'] - scanned if engine.prefilters else endpos - pos
+            pipeline_profiler.record('detection', entity_type, elapsed, scans=1, matches=len(entities),
+                                     characters=characters)
+            found.append(entities)
+        for entity_type, recognizer in self.recognizers.items():
+            started = time.perf_counter()
+            try:
+                entities = recognizer.scan(text, pos, endpos, deadline)
+            except TimeBudgetExceeded as exceeded:
+                raise _recognizer_exceeded(exceeded, *found)
+            pipeline_profiler.record('detection', entity_type, time.perf_counter() - started, scans=1,
+                                     matches=len(entities), characters=endpos - pos)
+            found.append(entities)
+        return sorted(itertools.chain.from_iterable(found), key=lambda entity: entity['start'])
+
+    def _scan_patterns(self, text, pos, deadline=None, endpos=None):
+        entities = []
+        endpos = len(text) if endpos is None else endpos
+        # Matches of one type must not overlap, as with a separate re.finditer per type
+        type_end = dict.fromkeys(self.entity_types, pos)
+        if not self.prefilters and deadline is None:
+            self._scan_range(text, pos, endpos, type_end, entities)
+            return entities
+        for block_start, block_end in self._blocks(text, pos, endpos):
+            _check_deadline(deadline, block_start, entities)
+            entity_types = self._plausible_types(text, block_start, block_end)
+            length = block_end - block_start
+            self.stats['blocks'] += 1
+            self.stats['characters'] += length
+            self.stats['pattern_characters'] += length * len(self.entity_types)
+            self.stats['scanned_pattern_characters'] += length * len(entity_types)
+            if not entity_types:
+                self.stats['skipped_blocks'] += 1
+                continue
+            self._subengine(entity_types)._scan_range(text, block_start, block_end, type_end, entities)
+        return entities
+
+    def prefilter_report(self):
+        total = self.stats['pattern_characters']
+        return {
+            'blocks': self.stats['blocks'],
+            'skipped_blocks': self.stats['skipped_blocks'],
+            'characters': self.stats['characters'],
+            'skipped_fraction': 1 - self.stats['scanned_pattern_characters'] / total if total else 0.0
+        }
+
+    def _blocks(self, text, pos, length):
+        while pos < length:
+            end = min(pos + PREFILTER_BLOCK_SIZE, length)
+            if end < length:
+                newline = text.rfind(self.newline, pos, end)
+                if newline > pos:
+                    end = newline + 1
+            yield pos, end
+            pos = end
+
+    def _plausible_types(self, text, start, end):
+        feature_end = min(end + self.window, len(text))
+        longest_digits = None
+        uppercase = None
+        plausible = []
+        for entity_type in self.entity_types:
+            prefilter = self.prefilters.get(entity_type)
+            if prefilter is not None:
+                if any(text.find(literal, start, feature_end) < 0 for literal in prefilter.get('contains', ())):
+                    continue
+                if 'digits' in prefilter:
+                    if longest_digits is None:
+                        longest_digits = self._longest_digit_run(text, start, feature_end)
+                    if longest_digits < prefilter['digits']:
+                        continue
+                if prefilter.get('uppercase'):
+                    if uppercase is None:
+                        uppercase = self.uppercase_letter.search(text, start, feature_end) is not None
+                    if not uppercase:
+                        continue
+            plausible.append(entity_type)
+        return tuple(plausible)
+
+    def _longest_digit_run(self, text, start, end):
+        # Stops as soon as a run long enough for every prefilter has been seen
+        needed = max((p.get('digits', 0) for p in self.prefilters.values()), default=0)
+        longest = 0
+        for run in self.digit_run.finditer(text, start, end):
+            longest = max(longest, run.end() - run.start())
+            if longest >= needed:
+                break
+        return longest
+
+    def _subengine(self, entity_types):
+        if len(entity_types) == len(self.entity_types):
+            return self
+        engine = self.subengines.get(entity_types)
+        if engine is None:
+            engine = self.subengines[entity_types] = DetectionEngine({t: self.patterns[t] for t in entity_types},
+                                                                     binary=self.binary)
+        return engine
+
+    def _scan_range(self, text, pos, endpos, type_end, entities):
+        # Matches starting before endpos are reported; they may extend past it by less than
+        # the window. The search stops there instead of running on through the rest of
+        # the text when the block has no more matches; the extra character keeps the
+        # context a trailing \b or lookahead needs.
+        limit = min(len(text), endpos + self.window + 1)
+        if len(self.slots) == 1:
+            # With a single type every region is a match and the chain is not needed
+            entity_type = self.entity_types[0]
+            for match in self.regions.finditer(text, max(pos, type_end[entity_type]), limit):
+                start, end = match.span()
+                if start >= endpos:
+                    break
+                type_end[entity_type] = end
+                entities.append({'start': start, 'end': end, 'text': text[start:end], 'type': entity_type})
+            return
+        for region in self.regions.finditer(text, pos, limit):
+            region_start, region_end = region.span()
+            if region_start >= endpos:
+                break
+            for candidate in self.candidates.finditer(text, region_start, region_end):
+                position = candidate.start()
+                if position >= region_end or position >= endpos:
+                    break
+                match = self.chain.match(text, position)
+                if match is None:
+                    continue
+                spans = match.regs
+                for group, entity_type in self.slots:
+                    start, end = spans[group]
+                    if end != -1 and start >= type_end[entity_type]:
+                        type_end[entity_type] = end
+                        entities.append({
+                            'start': start,
+                            'end': end,
+                            'text': text[start:end],
+                            'type': entity_type
+                        })
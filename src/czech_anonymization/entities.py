@@ -0,0 +1,118 @@
+import array
+import collections
+import collections.abc
+import json
+import operator
+
+# Entities of one document kept as columns: start and end offsets in integer arrays and
+# the type as an index into a short list of type names. An entity costs 18 bytes instead
+# of a dict with a copied substring, and the matched text is sliced from the document
+# only when asked for. Indexing and iteration still give the usual
+# {'start', 'end', 'text', 'type'} dicts for code that expects a list of them.
+
+class EntityStore(collections.abc.Sequence):
+    def __init__(self, text, types=()):
+        self.text = text
+        self.starts = array.array('q')
+        self.ends = array.array('q')
+        self.type_ids = array.array('H')
+        self.types = list(types)
+        self._type_ids = {entity_type: index for index, entity_type in enumerate(self.types)}
+
+    @classmethod
+    def from_dicts(cls, text, entities):
+        store = cls(text)
+        store.extend(entities)
+        return store
+
+    def type_id(self, entity_type):
+        if entity_type not in self._type_ids:
+            self._type_ids[entity_type] = len(self.types)
+            self.types.append(entity_type)
+        return self._type_ids[entity_type]
+
+    def append(self, start, end, entity_type):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.type_ids.append(self.type_id(entity_type))
+
+    def extend(self, entities):
+        entities = list(entities)
+        self.starts.extend(map(operator.itemgetter('start'), entities))
+        self.ends.extend(map(operator.itemgetter('end'), entities))
+        self.type_ids.extend(map(self.type_id, map(operator.itemgetter('type'), entities)))
+
+    def extend_from(self, other, begin, end, shift=0):
+        # Copies entities begin:end of another store, moved by shift
+        self.extend_columns(other.starts[begin:end], other.ends[begin:end], other.type_ids[begin:end],
+                            other.types, shift)
+
+    def extend_columns(self, starts, ends, type_ids, types, shift=0):
+        # Appends entities given as columns whose type ids index types
+        if shift:
+            self.starts.extend(map(shift.__add__, starts))
+            self.ends.extend(map(shift.__add__, ends))
+        else:
+            self.starts.extend(starts)
+            self.ends.extend(ends)
+        if types == self.types:
+            self.type_ids.extend(type_ids)
+        else:
+            self.type_ids.extend(map([self.type_id(entity_type) for entity_type in types].__getitem__, type_ids))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        start, end = self.starts[index], self.ends[index]
+        return {'start': start, 'end': end, 'text': self.text[start:end], 'type': self.types[self.type_ids[index]]}
+
+    def __iter__(self):
+        text, types = self.text, self.types
+        for start, end, type_id in zip(self.starts, self.ends, self.type_ids):
+            yield {'start': start, 'end': end, 'text': text[start:end], 'type': types[type_id]}
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.abc.Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'EntityStore({len(self)} entities)'
+
+    def entity_text(self, index):
+        return self.text[self.starts[index]:self.ends[index]]
+
+    def entity_type(self, index):
+        return self.types[self.type_ids[index]]
+
+    def text_length(self, begin=0, end=None):
+        # Total length of the matched text of entities begin:end
+        return sum(self.ends[begin:end]) - sum(self.starts[begin:end])
+
+    def counts(self):
+        # Entities per type; counted over the type id column without building any entity
+        return {self.types[type_id]: count for type_id, count in collections.Counter(self.type_ids).items()}
+
+    def to_dicts(self):
+        return list(self)
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dicts(), ensure_ascii=False, **kwargs)
+
+    def to_dataframe(self, with_text=True):
+        import numpy as np
+        import pandas as pd
+
+        columns = {
+            'start': np.frombuffer(self.starts, dtype=np.int64),
+            'end': np.frombuffer(self.ends, dtype=np.int64),
+            'type': pd.Categorical.from_codes(np.frombuffer(self.type_ids, dtype=np.uint16), categories=self.types)
+        }
+        if with_text:
+            columns['text'] = [self.text[start:end] for start, end in zip(self.starts, self.ends)]
+        return pd.DataFrame(columns, columns=['start', 'end', 'text', 'type'] if with_text else list(columns))
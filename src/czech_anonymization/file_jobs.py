@@ -0,0 +1,141 @@
+import collections
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+
+from .core import anonymize_file
+
+# Anonymization of an uploaded file in a background thread, for the UI. The input, the
+# output and the detected entities are kept in a temporary directory and the UI reads
+# one page of them at a time, so neither the session nor the browser ever holds the
+# whole document. The directory is removed when the job is dropped from the session.
+PAGE_BYTES = 64 * 1024
+ENTITY_PAGE_ROWS = 500
+COPY_CHUNK_SIZE = 1 << 20
+
+class JobCancelled(Exception):
+    pass
+
+def _char_start(data, index):
+    # First UTF-8 character boundary at or after index
+    while index < len(data) and data[index] & 0xC0 == 0x80:
+        index += 1
+    return index
+
+def read_page(path, page, page_bytes=PAGE_BYTES):
+    # One page of a UTF-8 file; a character cut by a page boundary belongs to the page
+    # it starts on
+    with open(path, 'rb') as handle:
+        handle.seek(page * page_bytes)
+        data = handle.read(page_bytes + 3)
+    start = _char_start(data, 0) if page else 0
+    end = _char_start(data, page_bytes) if len(data) > page_bytes else len(data)
+    return data[start:end].decode('utf-8', errors='replace')
+
+def page_count(path, page_bytes=PAGE_BYTES):
+    return max(1, -(-os.path.getsize(path) // page_bytes))
+
+class FileJob:
+    def __init__(self, source, name, selected_pii_types, anonymization_method):
+        # source is a binary file-like object, e.g. a Streamlit UploadedFile
+        self.name = name
+        self.selected_pii_types = list(selected_pii_types)
+        self.anonymization_method = anonymization_method
+        self.directory = tempfile.mkdtemp(prefix='anonymizace-')
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, ignore_errors=True)
+        self.input_path = os.path.join(self.directory, 'vstup.txt')
+        self.output_path = os.path.join(self.directory, 'vystup.txt')
+        self.entities_path = os.path.join(self.directory, 'entity.jsonl')
+        self.report_path = os.path.join(self.directory, 'zprava.json')
+        with open(self.input_path, 'wb') as handle:
+            shutil.copyfileobj(source, handle, COPY_CHUNK_SIZE)
+        self.size = os.path.getsize(self.input_path)
+        self.status = 'running'
+        self.error = None
+        self.position = 0  # byte offset of the input processed so far
+        self.counts = collections.Counter()
+        self.entities = 0
+        # Offsets in the entity file of every ENTITY_PAGE_ROWS-th entity
+        self.entity_pages = [0]
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            with open(self.entities_path, 'w', encoding='utf-8') as entities:
+                def on_entity(entity):
+                    self._check_cancelled()
+                    entities.write(json.dumps(entity, ensure_ascii=False) + '\n')
+                    self.entities += 1
+                    self.counts[entity['type']] += 1
+                    self.position = entity['end']
+                    if self.entities % ENTITY_PAGE_ROWS == 0:
+                        self.entity_pages.append(entities.tell())
+
+                def on_progress(position):
+                    # Called after every scanned slice, so a file with few entities
+                    # still reports progress and can be cancelled
+                    self._check_cancelled()
+                    self.position = position
+
+                anonymize_file(self.input_path, self.output_path, self.selected_pii_types,
+                               self.anonymization_method, on_entity=on_entity, on_progress=on_progress)
+            self.position = self.size
+            self.status = 'done'
+        except JobCancelled:
+            self.status = 'cancelled'
+        except Exception as error:
+            self.error = error
+            self.status = 'failed'
+        finally:
+            self.elapsed = time.perf_counter() - self.started
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def progress(self):
+        return 1.0 if self.status == 'done' or not self.size else min(self.position / self.size, 1.0)
+
+    def cancel(self, timeout=5.0):
+        self._cancelled.set()
+        self._thread.join(timeout)
+
+    def cleanup(self):
+        self.cancel()
+        self._finalizer()
+
+    def text_page_count(self, anonymized=False):
+        return page_count(self.output_path if anonymized else self.input_path)
+
+    def read_text_page(self, page, anonymized=False):
+        return read_page(self.output_path if anonymized else self.input_path, page)
+
+    def entity_page_count(self):
+        return max(1, -(-self.entities // ENTITY_PAGE_ROWS))
+
+    def read_entity_page(self, page):
+        # Entities of one page, with byte offsets; only complete once the job is done
+        with open(self.entities_path, encoding='utf-8') as handle:
+            handle.seek(self.entity_pages[page])
+            return [json.loads(line) for _, line in zip(range(ENTITY_PAGE_ROWS), handle)]
+
+    def write_report(self):
+        # The JSON report is written entity by entity from the entity file
+        if not os.path.exists(self.report_path):
+            with open(self.report_path, 'w', encoding='utf-8') as report, \
+                    open(self.entities_path, encoding='utf-8') as entities:
+                header = {'file_name': self.name, 'size_bytes': self.size, 'offsets': 'bytes',
+                          'pii_summary': dict(self.counts)}
+                report.write(json.dumps(header, ensure_ascii=False, indent=2)[:-2] + ',\n  "entities": [')
+                for index, line in enumerate(entities):
+                    report.write((',\n    ' if index else '\n    ') + line.rstrip('\n'))
+                report.write('\n  ]\n}\n')
+        return self.report_path
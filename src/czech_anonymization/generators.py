@@ -0,0 +1,194 @@
+import datetime
+
+import numpy as np
+
+# Every generator takes a numpy Generator and a count and returns an array of strings
+# in the same format the corresponding PII pattern detects.
+
+BANK_CODES = np.array(['0100', '0300', '0600', '0710', '0800', '2010', '2060', '2700',
+                       '3030', '3500', '5500', '6100', '6210', '6800', '8040'])
+PASSPORT_LETTERS = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+DATA_BOX_CHARACTERS = np.array(list('abcdefghijkmnpqrstuvwxyz23456789'))
+
+# Weights of the modulo 11 checks, most significant digit first
+ICO_WEIGHTS = np.array([8, 7, 6, 5, 4, 3, 2])
+ACCOUNT_PREFIX_WEIGHTS = np.array([10, 5, 8, 4, 2, 1])
+ACCOUNT_NUMBER_WEIGHTS = np.array([6, 3, 7, 9, 10, 5, 8, 4, 2, 1])
+
+BIRTH_DATE_FIRST = datetime.date(1954, 1, 1)
+BIRTH_DATE_LAST = datetime.date(2005, 12, 31)
+
+def _digits(rng, size, count, low=0):
+    return rng.integers(low, 10, size=(size, count))
+
+def _join_digits(digits):
+    return np.array([''.join(map(str, row)) for row in digits.tolist()], dtype=object)
+
+def _random_dates(rng, size, first=BIRTH_DATE_FIRST, last=BIRTH_DATE_LAST):
+    offsets = rng.integers(0, (last - first).days + 1, size=size)
+    days = np.datetime64(first, 'D') + offsets
+    years = days.astype('datetime64[Y]').astype(int) + 1970
+    months = days.astype('datetime64[M]').astype(int) % 12 + 1
+    day_of_month = (days - days.astype('datetime64[M]')).astype(int) + 1
+    return years, months, day_of_month
+
+def _mod11_completion(rng, weights, size, low_first=0):
+    # Random leading digits plus the last digit (weight 1) that makes the weighted sum
+    # divisible by 11; rows where it would have to be 10 are drawn again
+    digits = np.empty((size, len(weights)), dtype=np.int64)
+    todo = np.arange(size)
+    while todo.size:
+        leading = rng.integers(0, 10, size=(todo.size, len(weights) - 1))
+        if low_first:
+            leading[:, 0] = rng.integers(low_first, 10, size=todo.size)
+        last = -(leading @ weights[:-1]) % 11
+        valid = last < 10
+        digits[todo[valid], :-1] = leading[valid]
+        digits[todo[valid], -1] = last[valid]
+        todo = todo[~valid]
+    return digits
+
+def birth_numbers(rng, size):
+    # Ten-digit rodné číslo YYMMDD/SSSC: women have 50 added to the month and the whole
+    # number is divisible by 11
+    years, months, days = _random_dates(rng, size)
+    months = months + 50 * rng.integers(0, 2, size=size)
+    dates = (years % 100) * 10000 + months * 100 + days
+    serials = rng.integers(0, 1000, size=size)
+    base = dates * 1000 + serials
+    # A remainder of 10 would need check digit 0, only allowed before 1986; move the serial on
+    while True:
+        invalid = base % 11 == 10
+        if not invalid.any():
+            break
+        base[invalid] = dates[invalid] * 1000 + (base[invalid] % 1000 + 1) % 1000
+    numbers = base * 10 + base % 11
+    return np.array([f'{n // 10000:06d}/{n % 10000:04d}' for n in numbers.tolist()], dtype=object)
+
+def birth_dates(rng, size):
+    years, months, days = _random_dates(rng, size)
+    return np.array([f'{d}.{m}.{y}' for y, m, d in zip(years.tolist(), months.tolist(), days.tolist())],
+                    dtype=object)
+
+def ico_numbers(rng, size):
+    digits = _digits(rng, size, 7)
+    check = (11 - (digits @ ICO_WEIGHTS) % 11) % 10
+    return _join_digits(np.column_stack([digits, check]))
+
+def dic_numbers(rng, size):
+    # DIČ of a legal person is CZ followed by its IČO
+    return np.array(['CZ' + ico for ico in ico_numbers(rng, size).tolist()], dtype=object)
+
+def bank_accounts(rng, size):
+    numbers = _mod11_completion(rng, ACCOUNT_NUMBER_WEIGHTS, size, low_first=1)
+    prefixes = _mod11_completion(rng, ACCOUNT_PREFIX_WEIGHTS, size)
+    # Roughly a third of accounts carry a prefix, leading zeros are not written
+    with_prefix = rng.random(size) < 0.3
+    codes = rng.choice(BANK_CODES, size=size)
+    accounts = []
+    for prefix, number, has_prefix, code in zip(_join_digits(prefixes).tolist(), _join_digits(numbers).tolist(),
+                                                with_prefix.tolist(), codes.tolist()):
+        prefix = prefix.lstrip('0')
+        if has_prefix and prefix:
+            accounts.append(f'{prefix}-{number}/{code}')
+        else:
+            accounts.append(f'{number}/{code}')
+    return np.array(accounts, dtype=object)
+
+def phone_numbers(rng, size):
+    # Czech mobile numbers start with 6 or 7
+    digits = _digits(rng, size, 9)
+    digits[:, 0] = rng.choice([6, 7], size=size)
+    return np.array([f'{n[:3]} {n[3:6]} {n[6:]}' for n in _join_digits(digits).tolist()], dtype=object)
+
+def id_card_numbers(rng, size):
+    return _join_digits(_digits(rng, size, 9, low=1))
+
+def passport_numbers(rng, size):
+    letters = rng.choice(PASSPORT_LETTERS, size=(size, 2))
+    numbers = _join_digits(_digits(rng, size, 7))
+    return np.array([a + b + n for (a, b), n in zip(letters.tolist(), numbers.tolist())], dtype=object)
+
+def data_box_ids(rng, size):
+    characters = rng.choice(DATA_BOX_CHARACTERS, size=(size, 7))
+    return np.array([''.join(row) for row in characters.tolist()], dtype=object)
+
+GENERATORS = {
+    'RODNÉ_ČÍSLO': birth_numbers,
+    'DATUM_NAROZENÍ': birth_dates,
+    'TELEFON': phone_numbers,
+    'ČÍSLO_OP': id_card_numbers,
+    'ČÍSLO_PASU': passport_numbers,
+    'BANKOVNÍ_ÚČET': bank_accounts,
+    'IČO': ico_numbers,
+    'DIČ': dic_numbers,
+    'DATOVÁ_SCHRÁNKA': data_box_ids
+}
+
+def follow_layout(entity_type, original, value):
+    # Keep the written form of the replaced value: a bare year stays a year, the +420
+    # prefix and the spacing of numbers are kept as they were
+    if not original:
+        return value
+    if entity_type == 'DATUM_NAROZENÍ' and original.isdigit():
+        return value[-4:]
+    if entity_type == 'TELEFON' and original.startswith('+420'):
+        value = '+420 ' + value
+    if entity_type in ('TELEFON', 'ČÍSLO_OP') and not any(c.isspace() for c in original.strip()):
+        value = ''.join(value.split())
+    # Patterns such as TELEFON may take the space after the number into the match
+    return value + original[len(original.rstrip()):]
+
+DEFAULT_POOL_SIZE = 4096
+FIRST_REFILL_SIZE = 64
+
+class FakeValuePools:
+    # Fake values are generated in bulk and handed out one by one, so the per-entity
+    # cost is a list pop. Refills start small and double up to pool_size, so rarely used
+    # types stay cheap. A seeded draw generates its value from that seed alone, which
+    # keeps deterministic pseudonyms independent of the pool state.
+    def __init__(self, generators=None, pool_size=DEFAULT_POOL_SIZE, seed=None):
+        self.generators = dict(GENERATORS if generators is None else generators)
+        self.pool_size = pool_size
+        self.rng = np.random.default_rng(seed)
+        self.pools = {}
+        self.refill_sizes = {}
+
+    def register(self, entity_type, generator):
+        self.generators[entity_type] = generator
+        self.pools.pop(entity_type, None)
+
+    def __contains__(self, entity_type):
+        return entity_type in self.generators
+
+    def draw(self, entity_type, seed=None):
+        generator = self.generators[entity_type]
+        if seed is not None:
+            return generator(np.random.default_rng(seed), 1)[0]
+        pool = self.pools.get(entity_type)
+        if not pool:
+            size = min(self.refill_sizes.get(entity_type, FIRST_REFILL_SIZE), self.pool_size)
+            self.refill_sizes[entity_type] = size * 2
+            pool = self.pools[entity_type] = list(generator(self.rng, size))
+        return pool.pop()
+
+def is_valid_birth_number(value):
+    digits = value.replace('/', '')
+    return len(digits) == 10 and digits.isdigit() and int(digits) % 11 == 0
+
+def is_valid_ico(value):
+    if len(value) != 8 or not value.isdigit():
+        return False
+    digits = [int(c) for c in value]
+    return (11 - sum(w * d for w, d in zip(ICO_WEIGHTS.tolist(), digits)) % 11) % 10 == digits[-1]
+
+def is_valid_bank_account(value):
+    account, _, code = value.partition('/')
+    prefix, _, number = account.rpartition('-')
+
+    def weighted_ok(part, weights):
+        part = part.zfill(len(weights))
+        return sum(w * int(d) for w, d in zip(weights.tolist(), part)) % 11 == 0
+
+    return (len(code) == 4 and number.isdigit() and weighted_ok(number, ACCOUNT_NUMBER_WEIGHTS)
+            and (not prefix or weighted_ok(prefix, ACCOUNT_PREFIX_WEIGHTS)))
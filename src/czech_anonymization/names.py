@@ -0,0 +1,249 @@
+import gzip
+import heapq
+import os
+import re
+import sys
+import time
+
+from .engine import TimeBudgetExceeded
+from .utf8 import compile_pattern
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), 'data', 'czech_names.tsv.gz')
+# Source list of the gazetteer, "F<TAB>name" and "S<TAB>surname" lines; see export_name_list
+DEFAULT_NAME_LIST_PATH = os.path.join(os.path.dirname(__file__), 'data', 'czech_name_list.tsv.gz')
+
+FIRST_NAME = 'F'
+SURNAME = 'S'
+
+UPPER = 'A-ZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ'
+LOWER = 'a-záčďéěíňóřšťúůýž'
+TITLE = r'(?:Ing|Mgr|JUDr|MUDr|MVDr|PhDr|RNDr|PaedDr|Bc|doc|prof|Dr)\.'
+TITLES_BEFORE = re.compile(rf'(?:{TITLE} )+$')
+DEGREES_AFTER = re.compile(r',? (?:CSc\.|DrSc\.|Ph\.D\.|DiS\.|MBA)')
+CAPITALIZED_WORD = re.compile(rf'[{UPPER}][{LOWER}]+\b')
+# A title or a form of address is followed by a name even when the name is not in the
+# gazetteer, so up to two capitalized words after one are taken as a name as well
+MAX_UNKNOWN_WORD = 24
+UNKNOWN_WORD = rf'(?!{TITLE})[{UPPER}][{LOWER}]{{1,{MAX_UNKNOWN_WORD}}}\b'
+NAME_CUE = re.compile(
+    rf'\b(?:{TITLE}'
+    r'|[Pp]an(?:a|u|em|í)?|[Ss]leč(?:na|ny|ně|nu|nou)|[Pp]acient(?:a|ovi|em|ka|ky|ce|kou)?'
+    r'|[Pp]odepsán[aoi]?:?) '
+    rf'(?P<name>{UNKNOWN_WORD}(?:[ -]{UNKNOWN_WORD})?)'
+)
+NAME_CUE_LENGTH = 16 + 2 * (MAX_UNKNOWN_WORD + 2)
+# Titles are at most a few words long, so the context rule looks only this far back
+TITLE_CONTEXT = 40
+# A run of names is one entity of at most this many words, so every match is short and
+# a scan stays linear
+MAX_NAME_WORDS = 4
+# With a deadline the text is scanned in blocks of this many characters and the clock
+# is checked before each
+SCAN_BLOCK_SIZE = 16384
+# Words the name dataset ranks among names, or declined forms of names, that are common
+# Czech words, greetings, places, business names or fragments rather than names of
+# people; real surnames that are also words (Svoboda, Liška, Hora...) are kept
+NOT_NAMES = frozenset('''
+    Acs Ahoj Autodoprava Autoservis Babička Chose Cz Cze Dobrý Doktor Draha Dědeček Hasiči Hodina
+    Horní Hostinec Just Kadeřnictví Kniha Kokos Kolik Kraj Lka Milá Mistr Moc Moje Morava Nka Nov
+    Opava Osoba Ová Poledne Pošta Praha Prodej Prostě Práce Písek Rodina Servis Smrt Správce Sro
+    Stav Strejda Tka Truhlářství Zde Ček Čka Částka Šek Ška Škola
+'''.split())
+
+def decline(word, kind):
+    # Nominative plus the common case forms of Czech first names and surnames; enough
+    # to find the names in running text, not a full morphological model
+    forms = {word}
+    if word.endswith('ová') or (kind == SURNAME and word.endswith('á')):
+        forms.update({word[:-1] + 'é', word[:-1] + 'ou'})
+    elif word.endswith(('ý', 'í')) and kind == SURNAME:
+        forms.update({word[:-1] + ending for ending in ('ého', 'ému', 'ým')})
+        if word.endswith('í'):
+            forms.update({word + 'ho', word + 'mu', word + 'm'})
+    elif word.endswith('í'):
+        forms.update({word + 'ho', word + 'mu', word + 'm'})
+    elif word.endswith(('ie', 'ce')):
+        forms.update({word[:-1] + 'i', word[:-1] + 'í'})
+    elif word.endswith('a'):
+        stem = word[:-1]
+        forms.update({stem + 'y', stem + 'u', stem + 'o', stem + 'ou'})
+        if stem.endswith(('k', 'h', 'g', 'ch', 'r', 'c', 'j', 'š', 'ž', 'č', 'ř')):
+            forms.add(stem + 'i')
+        else:
+            forms.add(stem + 'ě')
+        if kind == SURNAME:
+            forms.add(stem + 'ovi')
+    elif word.endswith('e') or word.endswith('o'):
+        forms.update({word[:-1] + 'a', word[:-1] + 'ovi', word[:-1] + 'em'})
+    elif word[-1].isalpha():
+        stem = word
+        # Mobile e: Pavel -> Pavla, Beránek -> Beránka, Němec -> Němce
+        if re.search(r'[^aeiouyáéíóúůý](?:el|ek|ec)$', word):
+            stem = word[:-2] + word[-1]
+        genitive = stem + ('e' if stem.endswith('c') else 'a')
+        forms.update({genitive, stem + 'ovi', stem + 'u', stem + 'em', stem + 'e'})
+    return forms
+
+def _is_name_word(word):
+    # One capitalized word of Latin letters, as the byte patterns' \b knows them
+    return (len(word) > 2 and word[0].isupper() and word[1:].islower() and word.isalpha()
+            and all(ord(character) < 0x180 for character in word) and word not in NOT_NAMES)
+
+def export_name_list(path=DEFAULT_NAME_LIST_PATH, first_names=600, surnames=None):
+    # Writes the source list of the gazetteer from the names-dataset package, which ranks
+    # the names of its Czech users. Below the first few hundred first names the lists are
+    # mostly nicknames and business names, so only the top ones are taken; a word ranked
+    # higher as a surname than as a first name is a surname. Needs names-dataset installed.
+    from names_dataset import NameDataset
+
+    dataset = NameDataset()
+    first = dataset.get_top_names(n=first_names, country_alpha2='CZ')['CZ']
+    last = dataset.get_top_names(n=surnames or 10 ** 6, use_first_names=False, country_alpha2='CZ')['CZ']
+    surname_rank = {name: rank for rank, name in enumerate(last)}
+    entries = set()
+    for names in first.values():
+        entries.update((FIRST_NAME, name) for rank, name in enumerate(names)
+                       if _is_name_word(name) and surname_rank.get(name, rank) >= rank)
+    entries.update((SURNAME, name) for name in last if _is_name_word(name) and (FIRST_NAME, name) not in entries)
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=9) as handle:
+        for kind, name in sorted(entries):
+            handle.write(f'{kind}\t{name}\n')
+    return len(entries)
+
+def _read_name_list(source):
+    opener = gzip.open if source.endswith('.gz') else open
+    with opener(source, 'rt', encoding='utf-8') as handle:
+        return [tuple(line.rstrip('\n').split('\t', 1)) for line in handle if '\t' in line]
+
+def build_gazetteer(path=DEFAULT_GAZETTEER_PATH, extra_sources=(), name_list=DEFAULT_NAME_LIST_PATH):
+    # The word lists are the bundled name list (see export_name_list) and Faker's cs_CZ
+    # person provider; extra sources are text files with one "F<TAB>name" or
+    # "S<TAB>surname" line each
+    from faker.providers.person.cs_CZ import Provider
+
+    entries = {}
+    base = [(FIRST_NAME, name) for name in list(Provider.first_names_male) + list(Provider.first_names_female)]
+    base += [(SURNAME, name) for name in list(Provider.last_names_male) + list(Provider.last_names_female)]
+    for source in ([name_list] if name_list else []) + list(extra_sources):
+        base += _read_name_list(source)
+    for kind, name in base:
+        for form in decline(name, kind) - NOT_NAMES:
+            # A word that is both a first name and a surname form is kept as a first name
+            if entries.get(form) != FIRST_NAME:
+                entries[form] = kind
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=9) as handle:
+        for form in sorted(entries):
+            handle.write(f'{entries[form]}\t{form}\n')
+    return len(entries)
+
+class NameRecognizer:
+    # Finds runs of known Czech first names and surnames, including declined forms: one
+    # regex pass finds the words that may start a name, which are looked up in the
+    # gazetteer. A word list this large would take seconds to compile into a regex. Titles
+    # before and degrees after a hit, an unknown surname right after a known first name
+    # and unknown names after a title or a form of address are added by small context
+    # rules. A binary recognizer scans UTF-8 bytes and reports byte offsets.
+    entity_type = 'JMÉNO'
+
+    def __init__(self, entries, binary=False):
+        entries = dict(entries)
+        self.binary = binary
+        # Keys are UTF-8 bytes when binary, so words are looked up without decoding them
+        self.kinds = {word.encode('utf-8') if binary else word: kind for word, kind in entries.items()}
+        initials = ''.join(sorted({word[0] for word in entries}))
+        self.word = compile_pattern(rf'\b[{re.escape(initials)}]\w*' if initials else '(?!)', binary)
+        self.cue = compile_pattern(NAME_CUE.pattern, binary)
+        # Longest possible match, in UTF-8 bytes when binary
+        longest = max(map(len, self.kinds), default=0)
+        self.window = max(MAX_NAME_WORDS * (longest + 1), NAME_CUE_LENGTH * (2 if binary else 1))
+        self.separators = (b' ', b'-') if binary else (' ', '-')
+        self.separator = compile_pattern('[ -]', binary)
+        self.titles_before = compile_pattern(TITLES_BEFORE.pattern, binary)
+        self.degrees_after = compile_pattern(DEGREES_AFTER.pattern, binary)
+        self.capitalized_word = compile_pattern(CAPITALIZED_WORD.pattern, binary)
+        self.space = b' ' if binary else ' '
+
+    def _runs(self, text, start, stop):
+        # (start, end, last word) of every run of up to MAX_NAME_WORDS known words joined
+        # by a space or a hyphen, in text order
+        run = None
+        for match in self.word.finditer(text, start, stop):
+            word = match.group()
+            if word not in self.kinds:
+                continue
+            word_start, word_end = match.span()
+            if (run and run[3] < MAX_NAME_WORDS and word_start == run[1] + 1
+                    and text[run[1]:word_start] in self.separators):
+                run = (run[0], word_end, word, run[3] + 1)
+                continue
+            if run:
+                yield run
+            run = (word_start, word_end, word, 1)
+        if run:
+            yield run
+
+    @classmethod
+    def load(cls, path=DEFAULT_GAZETTEER_PATH, binary=False):
+        with gzip.open(path, 'rt', encoding='utf-8') as handle:
+            entries = [line.rstrip('\n').split('\t', 1)[::-1] for line in handle if '\t' in line]
+        return cls(entries, binary)
+
+    def scan(self, text, pos=0, endpos=None, deadline=None):
+        # With endpos only names starting before it are reported. With a deadline (a
+        # time.perf_counter() value) the clock is checked before every block, and
+        # TimeBudgetExceeded carries the names found until then.
+        if endpos is None or endpos > len(text):
+            endpos = len(text)
+        if deadline is None:
+            return self._scan_block(text, pos, pos, endpos, [])[0]
+        entities = []
+        resume = pos
+        for block_start in range(pos, endpos, SCAN_BLOCK_SIZE):
+            if time.perf_counter() > deadline:
+                raise TimeBudgetExceeded(block_start, entities)
+            entities, resume = self._scan_block(text, pos, max(block_start, resume),
+                                                min(block_start + SCAN_BLOCK_SIZE, endpos), entities)
+        return entities
+
+    def _scan_block(self, text, pos, start, block_end, entities):
+        # Names starting in start:block_end; a block sees the text up to the longest match
+        # after its end, so its matches are those of one continuous pass. Returns them
+        # with the offset the pass continues from.
+        last_end = entities[-1]['end'] if entities else pos
+        resume = start
+        stop = min(len(text), block_end + self.window)
+        # Gazetteer runs and names after a cue as (match start, match end, name start,
+        # name end, last word), by the start of the match; a gazetteer run comes first
+        # when both find the same name
+        runs = ((run_start, run_end, run_start, run_end, word)
+                for run_start, run_end, word, _ in self._runs(text, start, stop))
+        cues = ((match.start(), match.end(), *match.span('name'), self.separator.split(match.group('name'))[-1])
+                for match in self.cue.finditer(text, start, stop))
+        for match_start, match_end, start, end, last_word in heapq.merge(runs, cues, key=lambda match: match[0]):
+            if match_start >= block_end:
+                break
+            resume = max(resume, match_end)
+            if start < last_end:
+                continue
+            if self.kinds.get(last_word) == FIRST_NAME:
+                surname = self.capitalized_word.match(text, end + 1) if text[end:end + 1] == self.space else None
+                if surname:
+                    end = surname.end()
+            title = self.titles_before.search(text, max(pos, start - TITLE_CONTEXT), start)
+            if title:
+                start = title.start()
+            degree = self.degrees_after.match(text, end)
+            if degree:
+                end = degree.end()
+            last_end = end
+            entities.append({'start': start, 'end': end, 'text': text[start:end], 'type': self.entity_type})
+        return entities, resume
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--export-name-list']:
+        target = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_NAME_LIST_PATH
+        print(f"Uloženo {export_name_list(target)} jmen a příjmení do {target}")
+    else:
+        target = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_GAZETTEER_PATH
+        print(f"Uloženo {build_gazetteer(target, sys.argv[2:])} tvarů jmen do {target}")
@@ -0,0 +1,98 @@
+import collections
+import contextlib
+import os
+import threading
+
+# family: (label name, counters); all counters are totals since the last reset
+METRICS = {
+    'detection': ('type', ('seconds', 'scans', 'matches', 'characters')),
+    'resolution': (None, ('seconds', 'calls', 'entities')),
+    'anonymization': ('method', ('seconds', 'calls', 'entities'))
+}
+
+HELP = {
+    'detection': "Matching of one PII type",
+    'resolution': "Resolution of overlapping spans",
+    'anonymization': "Replacement of detected spans"
+}
+
+class PipelineProfiler:
+    # Totals of time and work per stage of the pipeline. The pipeline checks enabled
+    # before measuring anything, so a disabled profiler costs one property lookup per
+    # scanned text.
+    def __init__(self, enabled=False):
+        self._enabled = enabled
+        # Profiler of the capture block the current thread is in, see capture
+        self._local = threading.local()
+        self.reset()
+
+    @property
+    def enabled(self):
+        return self._enabled or getattr(self._local, 'capture', None) is not None
+
+    @enabled.setter
+    def enabled(self, enabled):
+        self._enabled = enabled
+
+    def reset(self):
+        self.data = {family: collections.defaultdict(collections.Counter) for family in METRICS}
+
+    def record(self, family, label, seconds, **counts):
+        capture = getattr(self._local, 'capture', None)
+        counter = (capture or self).data[family][label]
+        counter['seconds'] += seconds
+        counter.update(counts)
+
+    def snapshot(self):
+        return {family: {label: dict(counter) for label, counter in labels.items()}
+                for family, labels in self.data.items()}
+
+    def drain(self):
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot):
+        # Adds a snapshot taken in another process
+        for family, labels in snapshot.items():
+            for label, counts in labels.items():
+                self.data[family][label].update(counts)
+
+    @contextlib.contextmanager
+    def capture(self):
+        # Profiles only the code inside the block and only in this thread, e.g. one run in
+        # the UI: runs of other threads, such as other Streamlit sessions, are neither
+        # recorded in the profile nor taken from the totals, which stay as they were
+        outer = getattr(self._local, 'capture', None)
+        capture = self._local.capture = PipelineProfiler()
+        profile = {}
+        try:
+            yield profile
+        finally:
+            self._local.capture = outer
+            profile.update(capture.snapshot())
+            if outer is not None:
+                outer.merge(profile)
+
+    def prometheus_text(self, prefix='anonymizer'):
+        lines = []
+        for family, (label_name, counters) in METRICS.items():
+            labels = self.data[family]
+            for counter in counters:
+                name = f'{prefix}_{family}_{counter}_total'
+                lines.append(f'# HELP {name} {HELP[family]}: {counter}.')
+                lines.append(f'# TYPE {name} counter')
+                for label, counts in sorted(labels.items(), key=lambda item: str(item[0])):
+                    selector = f'{{{label_name}="{_escape(label)}"}}' if label_name else ''
+                    lines.append(f'{name}{selector} {_number(counts.get(counter, 0))}')
+        return '\n'.join(lines) + '\n'
+
+def _number(value):
+    return str(value) if isinstance(value, int) else f'{value:.6f}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Per-type and per-stage timing of the pipeline; off unless ANONYMIZER_PROFILE=1 or
+# enabled at runtime
+pipeline_profiler = PipelineProfiler(enabled=os.environ.get('ANONYMIZER_PROFILE') == '1')
@@ -0,0 +1,118 @@
+import collections
+import hashlib
+import hmac
+import os
+import re
+import sqlite3
+import threading
+
+DEFAULT_CAPACITY = 100000
+
+def normalize_value(value):
+    # Case and whitespace differences do not make a different person; values without
+    # letters (phone numbers, account numbers...) also ignore spacing altogether
+    normalized = ' '.join(value.split()).casefold()
+    if not re.search(r'[^\W\d_]', normalized):
+        normalized = normalized.replace(' ', '')
+    return normalized
+
+class PseudonymStore:
+    # Persistent mapping shared between runs and processes. Originals are never written,
+    # rows are keyed by a keyed hash of (entity type, normalized value); see Pseudonymizer.
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL keeps the per-insert commits cheap and lets worker processes read concurrently
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS pseudonyms (key TEXT PRIMARY KEY, replacement TEXT NOT NULL)'
+        )
+        self.connection.commit()
+
+    def get(self, key):
+        row = self.connection.execute('SELECT replacement FROM pseudonyms WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, replacement):
+        # Another process may have stored the key meanwhile; its replacement wins.
+        # Pool workers exit without running atexit hooks, so every insert is committed.
+        self.connection.execute('INSERT OR IGNORE INTO pseudonyms (key, replacement) VALUES (?, ?)',
+                                (key, replacement))
+        self.connection.commit()
+        return self.get(key)
+
+    def close(self):
+        self.connection.close()
+
+class Pseudonymizer:
+    # Maps (entity type, normalized original) to one replacement, so repeated PII stays
+    # coherent. generate(entity_type, original, seed) produces new values; with a secret
+    # the seed is a keyed hash of the value, so every process and every run derives the
+    # same replacement without sharing state, otherwise seed is None. A store needs the
+    # secret: phone numbers, IČO or birth numbers are few enough that plain hashes of
+    # them could be reversed by trying every value.
+    def __init__(self, generate, capacity=DEFAULT_CAPACITY, secret=None, store=None):
+        self.generate = generate
+        self.capacity = capacity
+        self.secret = (secret.encode('utf-8') if isinstance(secret, str) else secret) or None
+        if store is not None and self.secret is None:
+            raise ValueError("Úložiště pseudonymů vyžaduje tajný klíč (ANONYMIZER_PSEUDONYM_SECRET)")
+        self.store = store
+        # Identifies the replacements this instance produces, for result cache keys. Without
+        # a secret they are random, so every instance has a fingerprint of its own.
+        if self.secret is None:
+            self.fingerprint = os.urandom(16).hex()
+        else:
+            message = b'result-cache\0' + (store.path.encode('utf-8') if store is not None else b'')
+            self.fingerprint = hmac.new(self.secret, message, hashlib.sha256).hexdigest()
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, entity_type, normalized):
+        message = f'{entity_type}\0{normalized}'.encode('utf-8')
+        return hmac.new(self.secret, message, hashlib.sha256).digest()
+
+    def pseudonymize(self, entity_type, original):
+        key = (entity_type, normalize_value(original))
+        with self.lock:
+            replacement = self.cache.get(key)
+            if replacement is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return replacement
+            self.misses += 1
+            replacement = self._resolve(key, original)
+            self.cache[key] = replacement
+            if len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+            return replacement
+
+    def _resolve(self, key, original):
+        digest = self._digest(*key) if self.secret is not None else None
+        store_key = None
+        if self.store is not None:
+            store_key = digest.hex()
+            replacement = self.store.get(store_key)
+            if replacement is not None:
+                return replacement
+        seed = int.from_bytes(digest[:8], 'big') if self.secret is not None else None
+        replacement = self.generate(key[0], original, seed)
+        if self.store is not None:
+            replacement = self.store.put(store_key, replacement)
+        return replacement
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
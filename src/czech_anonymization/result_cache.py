@@ -0,0 +1,157 @@
+import array
+import collections
+import json
+import sqlite3
+import threading
+import time
+
+from .entities import EntityStore
+
+# Cache of anonymization results keyed by a digest of the text and the settings. Results
+# are stored without the original text, which is known whenever the key matches: the
+# anonymized text, the entity columns and the replacements.
+
+DEFAULT_CAPACITY = 4096
+DEFAULT_MAX_BYTES = 256 << 20
+# The shared tier is trimmed after this many bytes were written since the last trim,
+# down to this share of max_bytes, so trimming runs rarely and in bulk
+TRIM_EVERY_BYTES = 4 << 20
+TRIM_TARGET = 0.9
+
+def pack_result(result):
+    entities = result['entities']
+    return (result['anonymized_text'], entities.starts[:], entities.ends[:], entities.type_ids[:],
+            tuple(entities.types), tuple(result['replacements']), result['degraded'])
+
+def unpack_result(text, packed):
+    anonymized_text, starts, ends, type_ids, types, replacements, degraded = packed
+    entities = EntityStore(text, types)
+    entities.extend_columns(starts, ends, type_ids, entities.types)
+    return {'original_text': text, 'anonymized_text': anonymized_text, 'entities': entities,
+            'degraded': degraded, 'replacements': list(replacements)}
+
+# The shared tier is a file other processes write, so its values are plain data: a JSON
+# header followed by the raw entity columns. A value that does not decode is a miss.
+def encode_packed(packed):
+    anonymized_text, starts, ends, type_ids, types, replacements, degraded = packed
+    header = json.dumps({'anonymized_text': anonymized_text, 'count': len(starts), 'types': list(types),
+                         'replacements': list(replacements), 'degraded': degraded})
+    # json.dumps escapes every newline, so the first one ends the header
+    return b''.join([header.encode('utf-8'), b'\n', starts.tobytes(), ends.tobytes(), type_ids.tobytes()])
+
+def decode_packed(value):
+    header, _, columns = bytes(value).partition(b'\n')
+    header = json.loads(header)
+    count = header['count']
+    starts, ends, type_ids = array.array('q'), array.array('q'), array.array('H')
+    offset = 0
+    for column in (starts, ends, type_ids):
+        size = count * column.itemsize
+        column.frombytes(columns[offset:offset + size])
+        offset += size
+    if len(type_ids) != count or offset != len(columns) or len(header['replacements']) != count:
+        raise ValueError("Poškozený výsledek v mezipaměti")
+    return (str(header['anonymized_text']), starts, ends, type_ids, tuple(map(str, header['types'])),
+            tuple(map(str, header['replacements'])), bool(header['degraded']))
+
+def hit_rates(counts):
+    # Summary of lookup counts, also of counts merged from several processes
+    lookups = counts['memory_hits'] + counts['disk_hits'] + counts['misses']
+    hits = counts['memory_hits'] + counts['disk_hits']
+    return {
+        'memory_hits': counts['memory_hits'],
+        'disk_hits': counts['disk_hits'],
+        'misses': counts['misses'],
+        'hit_rate': hits / lookups if lookups else 0.0
+    }
+
+class ResultCache:
+    # Two tiers: an LRU of recent results in this process and optionally a SQLite file
+    # shared by all processes using the same path, kept under max_bytes by dropping the
+    # least recently used results.
+    def __init__(self, path=None, capacity=DEFAULT_CAPACITY, max_bytes=DEFAULT_MAX_BYTES):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.memory = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.written = 0
+        self.connection = None
+        if path:
+            self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, value BLOB NOT NULL, '
+                'size INTEGER NOT NULL, used REAL NOT NULL) WITHOUT ROWID'
+            )
+            self.connection.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+            self.connection.commit()
+
+    def get(self, key):
+        with self.lock:
+            packed = self.memory.get(key)
+            if packed is not None:
+                self.memory.move_to_end(key)
+                self.counts['memory_hits'] += 1
+                return packed
+            if self.connection is not None:
+                row = self.connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                try:
+                    packed = decode_packed(row[0]) if row is not None else None
+                except (ValueError, KeyError, TypeError):
+                    packed = None
+                if packed is not None:
+                    with self.connection:
+                        self.connection.execute('UPDATE results SET used = ? WHERE key = ?', (time.time(), key))
+                    self._remember(key, packed)
+                    self.counts['disk_hits'] += 1
+                    return packed
+            self.counts['misses'] += 1
+            return None
+
+    def put(self, key, packed, shared=True):
+        # shared=False keeps the result in this process only, for replacements another
+        # process would not produce
+        with self.lock:
+            self._remember(key, packed)
+            if self.connection is None or not shared:
+                return
+            value = encode_packed(packed)
+            with self.connection:
+                self.connection.execute('INSERT OR REPLACE INTO results (key, value, size, used) VALUES (?, ?, ?, ?)',
+                                        (key, value, len(value), time.time()))
+            self.written += len(value)
+            if self.written >= min(TRIM_EVERY_BYTES, self.max_bytes // 10 or 1):
+                self._trim()
+
+    def _remember(self, key, packed):
+        self.memory[key] = packed
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def _trim(self):
+        self.written = 0
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * TRIM_TARGET
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM results WHERE key IN (SELECT key FROM (SELECT key, '
+                'SUM(size) OVER (ORDER BY used DESC) AS kept FROM results) WHERE kept > ?)', (target,)
+            )
+
+    def stats(self):
+        return dict(hit_rates(self.counts), size=len(self.memory))
+
+    def drain_counts(self):
+        # Lookup counts since the previous call, for merging counts of worker processes
+        with self.lock:
+            counts, self.counts = self.counts, collections.Counter()
+        return counts
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import timeit
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from .engine import DetectionEngine, max_match_length
+from .utf8 import utf8_pattern
+
+# Versioned rule sets: the patterns, prefilters and priorities detection runs with. A
+# rule set compiles its engines lazily and keeps them, so swapping the active rule set
+# is one assignment: scans that already hold the old one finish on its engines, while
+# new ones start on the new set. Rule sets are loaded from JSON files like
+#
+#   {"version": "2024-05-02", "patterns": {"IČO": "\\b\\d{8}\\b", ...},
+#    "prefilters": {"IČO": {"digits": 8}}, "priorities": {"IČO": 30},
+#    "recognizers": {"JMÉNO": "gazetteer"}}
+#
+# A type listed in "recognizers" is detected by the named recognizer (e.g. the name
+# gazetteer) instead of its pattern, which then only bounds the match length; every
+# other type is detected by its pattern.
+
+FUZZ_SIZES = (4000, 16000, 64000)
+# Growth exponent of the scan time above which a target counts as superlinear; times
+# below the noise floor are not judged
+FUZZ_MAX_SLOPE = 1.4
+FUZZ_NOISE_SECONDS = 0.005
+FUZZ_TOKENS = ['Novák', 'a', '1', '123', ' ', '.', '-', '/', '@', ',', '\n', 'CZ', 'Ing. ', ', Ph.D.']
+
+def _repeat_to(unit, size):
+    return (unit * (size // len(unit) + 1))[:size]
+
+# Inputs that make backtracking regex engines retry long partial matches at every
+# position: runs of capitalized words, digit soup from OCR, e-mail-like strings
+# without a valid ending, long whitespace inside an address
+FUZZ_FAMILIES = {
+    'capitalized_words': lambda size, rng: _repeat_to('Novák Svoboda ', size),
+    'hyphenated_words': lambda size, rng: _repeat_to('Nová-Praha-', size),
+    'address_like': lambda size, rng: _repeat_to('Hlavní Nová 12, ', size),
+    'address_whitespace': lambda size, rng: 'Hlavní 12,' + ' ' * size,
+    'digit_soup': lambda size, rng: _repeat_to('1 12 123 1.2. 12/ 123-', size),
+    'digit_run': lambda size, rng: '1' * size,
+    'letter_run': lambda size, rng: 'a' * size,
+    'capital_run': lambda size, rng: 'A' * size,
+    'email_like': lambda size, rng: _repeat_to('a.b-c.', size) + '@',
+    'at_soup': lambda size, rng: _repeat_to('a@a.a@', size),
+    'random_tokens': lambda size, rng: ''.join(rng.choices(FUZZ_TOKENS, k=size))[:size]
+}
+
+def fuzz_inputs(sizes=FUZZ_SIZES, seed=0):
+    rng = random.Random(seed)
+    return {family: [generate(size, rng) for size in sizes] for family, generate in FUZZ_FAMILIES.items()}
+
+def fuzz_scan(scan, inputs, sizes=FUZZ_SIZES, repeat=3):
+    # Times scan on growing adversarial inputs; the slope of log(time) over log(size)
+    # is 1 for a linear scan
+    results = {}
+    for family, texts in inputs.items():
+        times = [min(timeit.repeat(lambda: list(scan(text)), number=1, repeat=repeat)) for text in texts]
+        slope = math.log(max(times[-1], 1e-9) / max(times[0], 1e-9)) / math.log(sizes[-1] / sizes[0])
+        results[family] = {
+            'slope': round(slope, 2),
+            'seconds': round(times[-1], 5),
+            'superlinear': slope > FUZZ_MAX_SLOPE and times[-1] > FUZZ_NOISE_SECONDS
+        }
+    return results
+
+class RuleSet:
+    def __init__(self, version, patterns, prefilters=None, priorities=None, recognizers=None, loaders=None):
+        self.version = str(version)
+        self.patterns = dict(patterns)
+        self.prefilters = {t: dict(p) for t, p in (prefilters or {}).items()}
+        self.priorities = dict(priorities or {})
+        # type: name of the recognizer used instead of the pattern; loaders maps the
+        # names to load(binary) functions returning the recognizer
+        self.recognizers = dict(recognizers or {})
+        self.loaders = {t: loaders[name] for t, name in self.recognizers.items()}
+        self.digest = hashlib.sha256(json.dumps(
+            [self.version, self.patterns, self.prefilters, self.priorities, self.recognizers],
+            sort_keys=True, ensure_ascii=False
+        ).encode('utf-8')).hexdigest()[:16]
+        self.engines = {}
+        self.match_lengths = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, loaders=None):
+        if not isinstance(config, dict):
+            raise ValueError("Pravidla musí být objekt JSON")
+        version = config.get('version')
+        patterns = config.get('patterns')
+        if not isinstance(version, (str, int)) or not str(version).strip():
+            raise ValueError("Pravidla nemají verzi ('version')")
+        if not isinstance(patterns, dict) or not patterns:
+            raise ValueError("Pravidla neobsahují žádné vzory ('patterns')")
+        if not all(isinstance(t, str) and isinstance(p, str) for t, p in patterns.items()):
+            raise ValueError("Vzory musí být řetězce pojmenované typem PII")
+        prefilters = config.get('prefilters') or {}
+        priorities = config.get('priorities') or {}
+        unknown = [t for t in list(prefilters) + list(priorities) if t not in patterns]
+        if unknown:
+            raise ValueError(f"Prefiltry nebo priority pro neznámé typy: {', '.join(sorted(set(unknown)))}")
+        if not all(isinstance(p, int) for p in priorities.values()):
+            raise ValueError("Priority musí být celá čísla")
+        recognizers = config.get('recognizers') or {}
+        if not isinstance(recognizers, dict):
+            raise ValueError("Rozpoznávače ('recognizers') musí být objekt typ: název")
+        for entity_type, name in recognizers.items():
+            if entity_type not in patterns:
+                raise ValueError(f"Rozpoznávač pro typ bez vzoru: {entity_type}")
+            if not isinstance(name, str) or name not in (loaders or {}):
+                raise ValueError(f"Neznámý rozpoznávač {name} pro {entity_type} "
+                                 f"(dostupné: {', '.join(loaders or {}) or 'žádné'})")
+        return cls(version, patterns, prefilters, priorities, recognizers, loaders)
+
+    @classmethod
+    def load(cls, path, loaders=None):
+        with open(path, encoding='utf-8') as handle:
+            return cls.from_config(json.load(handle), loaders)
+
+    def to_config(self):
+        return {'version': self.version, 'patterns': self.patterns, 'prefilters': self.prefilters,
+                'priorities': self.priorities, 'recognizers': self.recognizers}
+
+    def engine(self, selected_pii_types, binary=False):
+        # A binary engine scans UTF-8 bytes, see anonymize_file
+        key = (tuple(sorted(set(selected_pii_types))), binary)
+        engine = self.engines.get(key)
+        if engine is None:
+            with self.lock:
+                engine = self.engines.get(key)
+                if engine is None:
+                    recognizers = {t: load(binary) for t, load in self.loaders.items() if t in key[0]}
+                    patterns = {t: utf8_pattern(p) if binary else p for t, p in self.patterns.items() if t in key[0]}
+                    engine = self.engines[key] = DetectionEngine(patterns, self.prefilters, recognizers, binary)
+        return engine
+
+    def max_match_length(self, selected_pii_types, binary=False):
+        # Longest possible match in characters, or in UTF-8 bytes when binary
+        key = (tuple(sorted(set(selected_pii_types) & set(self.patterns))), binary)
+        if key not in self.match_lengths:
+            self.match_lengths[key] = max_match_length(
+                utf8_pattern(self.patterns[t]) if binary else self.patterns[t] for t in key[0])
+        return self.match_lengths[key]
+
+# A new rule set may scan the sample at most this many times slower than the active one.
+# Nested bounded repetitions stay linear but can still cost thousands of steps per
+# position, so every pattern must also scan the adversarial inputs at a minimum speed.
+MAX_SLOWDOWN = 2.0
+FUZZ_MIN_MB_S = 0.1
+ENGINE_TARGET = 'všechny typy'
+
+def validate_rules(rules, sample_texts, baseline=None, max_slowdown=MAX_SLOWDOWN, sizes=FUZZ_SIZES):
+    # Compiles every pattern in both the str and the byte form, rejects unbounded and
+    # backtracking-prone patterns (fuzz_scan of the new and changed ones) and times the
+    # combined engine on the sample against the baseline rule set. Raises ValueError
+    # listing every problem; returns a report. The engines stay compiled, so the rule
+    # set is warm when it is swapped in.
+    errors = []
+    for entity_type, pattern in rules.patterns.items():
+        try:
+            re.compile(pattern)
+            utf8_pattern(pattern).encode('ascii')
+            if sre_parse.parse(pattern).getwidth()[1] >= sre_parse.MAXREPEAT:
+                errors.append(f"{entity_type}: délka shody není omezená")
+        except (re.error, ValueError) as error:
+            errors.append(f"{entity_type}: {error}")
+    if errors:
+        raise ValueError("; ".join(errors))
+    types = list(rules.patterns)
+    try:
+        engine = rules.engine(types)
+        rules.engine(types, binary=True)
+    except (re.error, ValueError) as error:
+        raise ValueError(f"Nelze sestavit detekci: {error}") from error
+
+    # Patterns the baseline already detected with were checked when it was activated
+    targets = {t: re.compile(p).finditer for t, p in rules.patterns.items()
+               if t not in rules.recognizers and (baseline is None or baseline.patterns.get(t) != p
+                                                  or t in baseline.recognizers)}
+    if targets:
+        targets[ENGINE_TARGET] = engine.scan
+    inputs = fuzz_inputs(sizes)
+    max_seconds = sizes[-1] / (FUZZ_MIN_MB_S * 1e6)
+    for target, scan in targets.items():
+        # A superlinear pattern shows on its own; the combined engine is only held to the
+        # speed, its small times are too noisy for the slope
+        def failed(result):
+            return (result['superlinear'] and target != ENGINE_TARGET) or result['seconds'] > max_seconds
+
+        families = fuzz_scan(scan, inputs, sizes)
+        # Timing noise of a loaded machine can look like a failure; failed inputs are timed again
+        retry = {family: inputs[family] for family, result in families.items() if failed(result)}
+        if retry:
+            families.update(fuzz_scan(scan, retry, sizes))
+        superlinear = [family for family, result in families.items() if failed(result) and result['superlinear']]
+        slow = [family for family, result in families.items() if failed(result)]
+        if superlinear:
+            errors.append(f"{target}: superlineární čas na vstupech {', '.join(superlinear)}")
+        elif slow:
+            errors.append(f"{target}: pod {FUZZ_MIN_MB_S} MB/s na vstupech {', '.join(slow)}")
+
+    characters = sum(len(text) for text in sample_texts)
+    report = {'version': rules.version, 'digest': rules.digest, 'types': len(types),
+              'throughput_mb_s': _throughput(engine, sample_texts, characters), 'baseline_mb_s': None}
+    if baseline is not None:
+        shared = [t for t in types if t in baseline.patterns]
+        if shared:
+            report['baseline_mb_s'] = _throughput(baseline.engine(shared), sample_texts, characters)
+            if report['throughput_mb_s'] * max_slowdown < report['baseline_mb_s']:
+                errors.append(f"Detekce je {report['baseline_mb_s'] / report['throughput_mb_s']:.1f}x pomalejší "
+                              f"než u verze {baseline.version}")
+    if errors:
+        raise ValueError("; ".join(errors))
+    return report
+
+def _throughput(engine, texts, characters, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in texts:
+            engine.scan(text)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(characters / max(best, 1e-9) / 1e6, 3)
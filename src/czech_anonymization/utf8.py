@@ -0,0 +1,169 @@
+import re
+
+# Translation of the str patterns into patterns over UTF-8 encoded bytes, so large files
+# can be scanned in place without decoding them. The result is an ASCII str in which
+# every non-ASCII byte is written as a \xNN escape; compile it with .encode('ascii').
+# Character classes stay exact for any code point. \b and \w treat ASCII letters, digits,
+# the underscore and the letters U+00C0-U+017F (all Czech and most Latin diacritics) as
+# word characters, which is narrower than the Unicode \w of str patterns.
+
+_ASCII_WORD = r'[0-9A-Z_a-z]'
+# Two-byte sequences of U+00C0-U+017F without the multiplication and division signs
+_LATIN_LETTER = r'(?:\xc3[\x80-\x96\x98-\xb6\xb8-\xbf]|[\xc4\xc5][\x80-\xbf])'
+WORD_CHARACTER = rf'(?:{_ASCII_WORD}|{_LATIN_LETTER})'
+_AFTER_WORD = rf'(?:(?<={_ASCII_WORD})|(?<={_LATIN_LETTER}))'
+NOT_AFTER_WORD = rf'(?<!{_ASCII_WORD})(?<!{_LATIN_LETTER})'
+NOT_BEFORE_WORD = rf'(?!{WORD_CHARACTER})'
+WORD_BOUNDARY = rf'(?:{_AFTER_WORD}{NOT_BEFORE_WORD}|{NOT_AFTER_WORD}(?={WORD_CHARACTER}))'
+# Any single UTF-8 encoded character except a newline, like . without DOTALL
+ANY_CHARACTER = r'(?:[\x00-\x09\x0b-\x7f]|[\xc2-\xdf][\x80-\xbf]|[\xe0-\xef][\x80-\xbf]{2}|[\xf0-\xf4][\x80-\xbf]{3})'
+
+# Escapes whose bytes meaning would silently differ from the str one
+UNSUPPORTED_ESCAPES = 'BWN'
+QUANTIFIER = re.compile(r'(?:[*+?]|\{(\d*)(?:,\d*)?\})\??')
+
+def _is_word(code_point):
+    # The same characters WORD_CHARACTER matches
+    if code_point < 0x80:
+        return chr(code_point).isalnum() or chr(code_point) == '_'
+    return 0xc0 <= code_point <= 0x17f and code_point not in (0xd7, 0xf7)
+
+def _byte_escape(data):
+    return ''.join(f'\\x{byte:02x}' for byte in data)
+
+def _literal(character):
+    if ord(character) < 0x80:
+        return re.escape(character)
+    return f'(?:{_byte_escape(character.encode("utf-8"))})'
+
+def _class_item(pattern, index):
+    # Returns (code point or None for a class escape, source, next index)
+    if pattern[index] == '\\':
+        escape = pattern[index + 1]
+        if escape in 'dDsS':
+            return None, pattern[index:index + 2], index + 2
+        if escape in 'wW' + UNSUPPORTED_ESCAPES:
+            raise ValueError(f"Nepodporovaná sekvence \\{escape} ve třídě znaků: {pattern}")
+        return ord(re.sub(r'\\(.)', r'\1', pattern[index:index + 2])), pattern[index:index + 2], index + 2
+    return ord(pattern[index]), pattern[index], index + 1
+
+def _character_class(pattern, index):
+    # index points just after "["; returns the translated class, whether it matches
+    # word characters only and the index after "]"
+    negated = pattern.startswith('^', index)
+    index += negated
+    ascii_parts = []
+    code_points = []
+    word = not negated
+    first = True
+    while first or pattern[index] != ']':
+        first = False
+        start, source, index = _class_item(pattern, index)
+        if start is None:
+            ascii_parts.append(source)
+            word = word and source == r'\d'
+            continue
+        end = start
+        if pattern[index] == '-' and pattern[index + 1] != ']':
+            end, _, index = _class_item(pattern, index + 1)
+        word = word and all(_is_word(code_point) for code_point in range(start, end + 1))
+        if start < 0x80:
+            ascii_end = min(end, 0x7f)
+            ascii_parts.append(re.escape(chr(start)) + (f'-{re.escape(chr(ascii_end))}' if ascii_end > start else ''))
+            start = 0x80
+        code_points.extend(range(start, end + 1))
+    index += 1
+    if not code_points:
+        return '[' + '^' * negated + ''.join(ascii_parts) + ']', word, index
+    if negated:
+        raise ValueError(f"Negovaná třída s diakritikou není podporována: {pattern}")
+    # Sequences sharing all bytes but the last become one class over the last byte
+    tails = {}
+    for code_point in sorted(set(code_points)):
+        encoded = chr(code_point).encode('utf-8')
+        tails.setdefault(encoded[:-1], []).append(encoded[-1])
+    alternatives = [f'[{"".join(ascii_parts)}]'] if ascii_parts else []
+    for lead, last_bytes in tails.items():
+        alternatives.append(_byte_escape(lead) + '[' + _byte_escape(bytes(last_bytes)) + ']')
+    return '(?:' + '|'.join(alternatives) + ')', word, index
+
+def _tokens(pattern):
+    # Yields (kind, source, word): kind is 'atom' for anything matching one character,
+    # 'quantifier' with the minimum count as word, 'boundary' for \b and 'other' for
+    # groups and everything else; word tells whether an atom matches word characters only
+    index = 0
+    while index < len(pattern):
+        character = pattern[index]
+        quantifier = QUANTIFIER.match(pattern, index)
+        if quantifier and index > 0:
+            minimum = quantifier.group(1)
+            yield 'quantifier', quantifier.group(), int(minimum or 0) if character == '{' else int(character == '+')
+            index = quantifier.end()
+        elif character == '\\':
+            escape = pattern[index + 1]
+            if escape == 'b':
+                yield 'boundary', None, False
+            elif escape == 'w':
+                yield 'atom', WORD_CHARACTER, True
+            elif escape in UNSUPPORTED_ESCAPES:
+                raise ValueError(f"Nepodporovaná sekvence \\{escape}: {pattern}")
+            elif escape in 'dDsS':
+                yield 'atom', pattern[index:index + 2], escape == 'd'
+            elif escape.isalnum() and ord(escape) < 0x80:
+                # \A, \Z and the like
+                yield 'other', pattern[index:index + 2], False
+            else:
+                yield 'atom', _literal(escape), _is_word(ord(escape))
+            index += 2
+        elif character == '[':
+            translated, word, index = _character_class(pattern, index + 1)
+            yield 'atom', translated, word
+        elif character == '.':
+            yield 'atom', ANY_CHARACTER, False
+            index += 1
+        elif character == '(':
+            # The group prefix ((?:, (?P<name>, (?=, ...) is ASCII and copied as is
+            prefix = re.match(r'\((?:\?(?:P<\w+>|P=\w+\)|[:=!]|<[=!]|#[^)]*\)|\(\w+\)))?', pattern[index:]).group()
+            yield 'other', prefix, False
+            index += len(prefix)
+        elif character in ')|^$':
+            yield 'other', character, False
+            index += 1
+        else:
+            yield 'atom', _literal(character), _is_word(ord(character))
+            index += 1
+
+def _word_at(tokens, index, step):
+    # Whether the character just before (step -1) or after (step 1) tokens[index] is
+    # certainly a word character; an optional atom or a group makes it unknown
+    if step < 0:
+        index -= 1
+        if index >= 0 and tokens[index][0] == 'quantifier':
+            if tokens[index][2] == 0:
+                return False
+            index -= 1
+        return index >= 0 and tokens[index][0] == 'atom' and tokens[index][2]
+    index += 1
+    if index >= len(tokens) or tokens[index][0] != 'atom' or not tokens[index][2]:
+        return False
+    following = tokens[index + 1] if index + 1 < len(tokens) else None
+    return following is None or following[0] != 'quantifier' or following[2] > 0
+
+def utf8_pattern(pattern):
+    # A \b next to an atom that can only match a word character needs only one of its
+    # two lookaround halves; the full emulation is several times slower to match
+    tokens = list(_tokens(pattern))
+    parts = []
+    for index, (kind, source, _) in enumerate(tokens):
+        if kind != 'boundary':
+            parts.append(source)
+        elif _word_at(tokens, index, 1):
+            parts.append(NOT_AFTER_WORD)
+        elif _word_at(tokens, index, -1):
+            parts.append(NOT_BEFORE_WORD)
+        else:
+            parts.append(WORD_BOUNDARY)
+    return ''.join(parts)
+
+def compile_pattern(pattern, binary=False):
+    return re.compile(utf8_pattern(pattern).encode('ascii')) if binary else re.compile(pattern)
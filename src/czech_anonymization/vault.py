@@ -0,0 +1,209 @@
+import collections
+import re
+import sqlite3
+import threading
+import time
+
+from .pseudonymization import normalize_value
+
+# Re-identification vault: the original behind every replacement, kept per session, so
+# the real values can be put back into text written from the anonymized one, e.g. the
+# answer of a language model. Unlike PseudonymStore this database holds the originals;
+# keep it local and let sessions expire. Only replacements that identify one original
+# can be reversed, in practice those of the fake-data method.
+
+DEFAULT_TTL = 24 * 3600
+# Writes are buffered and committed together once this many are pending or the oldest
+# waits this many seconds; reads are always served from memory
+FLUSH_SIZE = 1000
+FLUSH_INTERVAL = 1.0
+# Sessions whose mappings are kept in memory
+SESSION_CAPACITY = 64
+
+WORD = re.compile(r'\w+')
+
+def _is_word_character(character):
+    return character.isalnum() or character == '_'
+
+def result_pairs(result):
+    # (replacement, original, entity type) of every entity of a detect_and_anonymize_pii result
+    entities = result['entities']
+    return [(replacement, entities.entity_text(index), entities.entity_type(index))
+            for index, replacement in enumerate(result['replacements'])]
+
+class SessionMappings:
+    # Replacements of one session indexed by their first word. Restoring looks every word
+    # of the text up once and checks the few replacements starting with it, so one pass
+    # costs the same for ten or ten thousand mappings and adding one never rebuilds
+    # anything, unlike an automaton compiled from all of them.
+    def __init__(self, expires):
+        self.expires = expires
+        self.originals = {}
+        self.index = collections.defaultdict(list)
+
+    def add(self, replacement, original):
+        # Returns the original to store, None when the replacement became ambiguous, or
+        # False when nothing changed
+        if replacement in self.originals:
+            known = self.originals[replacement]
+            if known is None or normalize_value(known) == normalize_value(original):
+                return False
+            self.originals[replacement] = None
+            return None
+        self.originals[replacement] = original
+        first_word = WORD.search(replacement)
+        if first_word is not None:
+            candidates = self.index[first_word.group()]
+            candidates.append((first_word.start(), replacement))
+            # Longest first, so "Jan Novák" wins over "Jan"
+            candidates.sort(key=lambda candidate: -len(candidate[1]))
+        return original
+
+    def load(self, replacement, original):
+        self.add(replacement, original)
+        self.originals[replacement] = original
+
+    def restore(self, text):
+        pieces = []
+        position = 0
+        restored = 0
+        for word in WORD.finditer(text):
+            candidates = self.index.get(word.group())
+            if not candidates:
+                continue
+            for offset, replacement in candidates:
+                start = word.start() - offset
+                end = start + len(replacement)
+                original = self.originals[replacement]
+                if (start < position or original is None or not text.startswith(replacement, start)
+                        or (start > 0 and _is_word_character(replacement[0]) and _is_word_character(text[start - 1]))
+                        or (end < len(text) and _is_word_character(replacement[-1]) and _is_word_character(text[end]))):
+                    continue
+                pieces.append(text[position:start])
+                pieces.append(original)
+                position = end
+                restored += 1
+                break
+        pieces.append(text[position:])
+        return ''.join(pieces), restored
+
+class ReidentificationVault:
+    # Sessions expire ttl seconds after their last recorded mapping. Meant for one
+    # process: the memory copy of a session is not refreshed from the database.
+    def __init__(self, path=':memory:', ttl=DEFAULT_TTL, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 capacity=SESSION_CAPACITY):
+        self.ttl = ttl
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS vault_sessions (session TEXT PRIMARY KEY, expires REAL NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS vault_sessions_expires ON vault_sessions (expires)')
+        # A NULL original marks a replacement shared by several originals
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS vault_mappings (session TEXT NOT NULL, replacement TEXT NOT NULL, '
+            'original TEXT, type TEXT, PRIMARY KEY (session, replacement)) WITHOUT ROWID'
+        )
+        self.connection.commit()
+        self.sessions = collections.OrderedDict()
+        self.pending = []
+        self.expiries = {}
+        self.oldest_pending = None
+        self.lock = threading.RLock()
+
+    def _session(self, session, now):
+        mappings = self.sessions.get(session)
+        if mappings is not None and mappings.expires > now:
+            self.sessions.move_to_end(session)
+            return mappings
+        if session in self.expiries:
+            # Rows of this session are still pending
+            self._flush()
+        row = self.connection.execute('SELECT expires FROM vault_sessions WHERE session = ?', (session,)).fetchone()
+        if row and row[0] <= now:
+            # An expired session starts empty, its old rows must not come back with it
+            with self.connection:
+                self.connection.execute('DELETE FROM vault_mappings WHERE session = ?', (session,))
+                self.connection.execute('DELETE FROM vault_sessions WHERE session = ?', (session,))
+            row = None
+        mappings = SessionMappings(row[0] if row else now)
+        if row:
+            for replacement, original in self.connection.execute(
+                    'SELECT replacement, original FROM vault_mappings WHERE session = ?', (session,)):
+                mappings.load(replacement, original)
+        self.sessions[session] = mappings
+        if len(self.sessions) > self.capacity:
+            self.sessions.popitem(last=False)
+        return mappings
+
+    def record(self, session, pairs):
+        # pairs of (replacement, original, entity type), e.g. result_pairs(result)
+        now = time.time()
+        with self.lock:
+            mappings = self._session(session, now)
+            for replacement, original, entity_type in pairs:
+                stored = mappings.add(replacement, original)
+                if stored is not False:
+                    self.pending.append((session, replacement, stored, entity_type))
+            mappings.expires = now + self.ttl
+            self.expiries[session] = mappings.expires
+            if self.oldest_pending is None:
+                self.oldest_pending = time.monotonic()
+            if (len(self.pending) >= self.flush_size
+                    or time.monotonic() - self.oldest_pending >= self.flush_interval):
+                self._flush()
+
+    def restore(self, session, text):
+        # Returns the text with every known replacement of the session put back and the
+        # number of restored values
+        with self.lock:
+            mappings = self._session(session, time.time())
+            return mappings.restore(text)
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending and not self.expiries:
+            return
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO vault_sessions (session, expires) VALUES (?, ?) '
+                'ON CONFLICT (session) DO UPDATE SET expires = excluded.expires',
+                self.expiries.items()
+            )
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO vault_mappings (session, replacement, original, type) VALUES (?, ?, ?, ?)',
+                self.pending
+            )
+            self._evict(time.time())
+        self.pending = []
+        self.expiries = {}
+        self.oldest_pending = None
+
+    def _evict(self, now):
+        expired = [row[0] for row in self.connection.execute(
+            'SELECT session FROM vault_sessions WHERE expires <= ?', (now,))]
+        if expired:
+            self.connection.executemany('DELETE FROM vault_mappings WHERE session = ?', ((s,) for s in expired))
+            self.connection.executemany('DELETE FROM vault_sessions WHERE session = ?', ((s,) for s in expired))
+        for session in expired:
+            self.sessions.pop(session, None)
+
+    def forget(self, session):
+        with self.lock:
+            self._flush()
+            self.sessions.pop(session, None)
+            with self.connection:
+                self.connection.execute('DELETE FROM vault_mappings WHERE session = ?', (session,))
+                self.connection.execute('DELETE FROM vault_sessions WHERE session = ?', (session,))
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.connection.close()
@@ -0,0 +1,23 @@
+import io
+
+from src.czech_anonymization.core import PII_PATTERNS, anonymize_file
+from src.czech_anonymization.file_jobs import FileJob
+
+METHOD = "Nahradit [TYP_ÚDAJE]"
+TEXT_WITHOUT_PII = b'bez osobnich udaju a bez cisel, jen obycejny text. ' * 100000
+
+def test_progress_is_reported_for_every_slice(tmp_path):
+    input_path, output_path = tmp_path / 'vstup.txt', tmp_path / 'vystup.txt'
+    input_path.write_bytes(TEXT_WITHOUT_PII)
+    positions = []
+    anonymize_file(str(input_path), str(output_path), list(PII_PATTERNS), METHOD, chunk_size=1 << 18,
+                   on_progress=positions.append)
+    assert len(positions) > 10 and positions == sorted(positions) and positions[-1] == len(TEXT_WITHOUT_PII)
+
+def test_job_without_entities_can_be_cancelled():
+    job = FileJob(io.BytesIO(TEXT_WITHOUT_PII * 4), 'vstup.txt', list(PII_PATTERNS), METHOD)
+    try:
+        job.cancel()
+        assert job.status == 'cancelled'
+    finally:
+        job.cleanup()
@@ -0,0 +1,34 @@
+from faker.providers.person.cs_CZ import Provider
+
+from src.czech_anonymization.core import PII_PATTERNS, detect_and_anonymize_pii
+from src.czech_anonymization.names import NameRecognizer
+
+METHOD = "Nahradit [TYP_ÚDAJE]"
+FAKER_NAMES = set(Provider.first_names_male + Provider.first_names_female
+                  + Provider.last_names_male + Provider.last_names_female)
+
+def anonymize(text):
+    return detect_and_anonymize_pii(text, list(PII_PATTERNS), METHOD)['anonymized_text']
+
+def test_names_outside_faker_lists():
+    assert not {'Hlaváček', 'Skála', 'Zbořil', 'Zelenka', 'Vondrášková'} & FAKER_NAMES
+    assert anonymize("Podepsáno: Hlaváček") == "Podepsáno: [JMÉNO]"
+    assert anonymize("Ošetřil MUDr. Skála.") == "Ošetřil [JMÉNO]."
+    assert anonymize("Hospitalizován Zbořil Vojtěch.") == "Hospitalizován [JMÉNO]."
+    assert anonymize("Volal pan Zelenka.") == "Volal pan [JMÉNO]."
+    assert anonymize("Dopis pro Vondráškovou.") == "Dopis pro [JMÉNO]."
+
+def test_unknown_names_after_title_or_address():
+    assert anonymize("Přijala ji MUDr. Qwertzová.") == "Přijala ji [JMÉNO]."
+    assert anonymize("Ing. Mgr. Xyzabc, Ph.D. přišel.") == "[JMÉNO] přišel."
+    assert anonymize("Zavolejte paní Qwertzové a panu Xyzabc Bordovi.") == \
+        "Zavolejte paní [JMÉNO] a panu [JMÉNO]."
+    assert anonymize("Dnes přišel pan.") == "Dnes přišel pan."
+
+def test_binary_scan_matches_text_scan():
+    text = "Podepsáno: Hlaváček. MUDr. Qwertzová přijala paní Nováková-Dvořáková, CSc."
+    data = text.encode('utf-8')
+    found = NameRecognizer.load().scan(text)
+    found_bytes = NameRecognizer.load(binary=True).scan(data)
+    assert [entity['text'] for entity in found] == \
+        [data[entity['start']:entity['end']].decode('utf-8') for entity in found_bytes]
@@ -0,0 +1,30 @@
+import threading
+
+from src.czech_anonymization.core import detect_and_anonymize_pii
+from src.czech_anonymization.profiling import pipeline_profiler
+
+METHOD = "Nahradit [TYP_ÚDAJE]"
+
+def test_capture_is_scoped_to_its_thread():
+    barrier = threading.Barrier(2)
+    profiles = {}
+
+    def run(entity_type, text):
+        with pipeline_profiler.capture() as profile:
+            barrier.wait()
+            for _ in range(20):
+                detect_and_anonymize_pii(text, [entity_type], METHOD)
+            barrier.wait()
+        profiles[entity_type] = profile
+
+    threads = [threading.Thread(target=run, args=('TELEFON', "Tel. 777 123 456")),
+               threading.Thread(target=run, args=('EMAIL', "jan.novak@email.cz"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert set(profiles['TELEFON']['detection']) == {'TELEFON'}
+    assert set(profiles['EMAIL']['detection']) == {'EMAIL'}
+    assert profiles['TELEFON']['detection']['TELEFON']['scans'] == 20
+    assert not pipeline_profiler.enabled
+    assert not pipeline_profiler.snapshot()['detection']
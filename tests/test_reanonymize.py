@@ -0,0 +1,54 @@
+import random
+
+from src.czech_anonymization.core import (
+    DEFAULT_RULES, PII_PATTERNS, detect_and_anonymize_pii, reanonymize_pii, rules_from_config
+)
+
+METHOD = "Nahradit [TYP_ÚDAJE]"
+FRAGMENTS = [
+    "Jana ", "Petr Svoboda ", "pan Novák ", "tel. 777 123 456 ", "+420 601 234 567 ", "123 ",
+    "jan.novak@email.cz ", "rodné číslo 850315/1234 ", "IČO: 12345678 ", "Hlavní 123, 110 00 Praha ",
+    "dne 15.3.1985 ", "Číslo OP: 123456789 ", "účet 123456789/0800 ", "a ", "smlouva ", ".\n", ", ",
+]
+
+def random_document(rng):
+    return ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 12)))
+
+def random_edit(rng, text):
+    start = rng.randint(0, len(text))
+    end = min(len(text), start + rng.choice([0, 0, 1, 3, 10]))
+    insert = rng.choice(["", rng.choice(FRAGMENTS), rng.choice("a1 .-/")])
+    return text[:start] + insert + text[end:]
+
+def test_reanonymize_matches_full_run():
+    rng = random.Random(0)
+    types = list(PII_PATTERNS)
+    for _ in range(400):
+        previous = detect_and_anonymize_pii(random_document(rng), types, METHOD)
+        for _ in range(3):
+            text = random_edit(rng, previous['original_text'])
+            result = reanonymize_pii(previous, text, types, METHOD)
+            expected = detect_and_anonymize_pii(text, types, METHOD)
+            assert result['anonymized_text'] == expected['anonymized_text'], (previous['original_text'], text)
+            assert result['entities'].to_dicts() == expected['entities'].to_dicts(), (previous['original_text'], text)
+            previous = result
+
+def test_reanonymize_edit_after_last_entity():
+    types = list(PII_PATTERNS)
+    previous = detect_and_anonymize_pii("Jana ", types, METHOD)
+    result = reanonymize_pii(previous, "Jana 123 ", types, METHOD)
+    assert result['anonymized_text'] == detect_and_anonymize_pii("Jana 123 ", types, METHOD)['anonymized_text']
+    assert len(result['entities']) == len(previous['entities'])
+
+def test_reanonymize_rescans_after_pattern_change_with_same_version():
+    config = DEFAULT_RULES.to_config()
+    config['patterns'] = dict(config['patterns'], TELEFON=r'\b\d{3} \d{3} \d{3} \d{3}\b')
+    changed = rules_from_config(config)
+    assert changed.version == DEFAULT_RULES.version and changed.digest != DEFAULT_RULES.digest
+    types = list(PII_PATTERNS)
+    old_text = "Tel. 777 123 456." + " a dále" * 100
+    previous = detect_and_anonymize_pii(old_text, types, METHOD, rules=DEFAULT_RULES)
+    text = old_text + " Díky"
+    result = reanonymize_pii(previous, text, types, METHOD, rules=changed)
+    assert result['anonymized_text'] == detect_and_anonymize_pii(text, types, METHOD, rules=changed)['anonymized_text']
+    assert result['rules_digest'] == changed.digest
@@ -0,0 +1,13 @@
+from src.czech_anonymization.core import PII_PATTERNS, detect_and_anonymize_pii, scan_file
+
+METHOD = "Nahradit [TYP_ÚDAJE]"
+
+def test_id_card_number_with_cue_outranks_phone():
+    types = list(PII_PATTERNS)
+    assert detect_and_anonymize_pii("Číslo OP: 123456789", types, METHOD)['anonymized_text'] == "Číslo OP: [ČÍSLO_OP]"
+    assert detect_and_anonymize_pii("Tel: 123456789", types, METHOD)['anonymized_text'] == "Tel: [TELEFON]"
+
+def test_context_cue_in_file_scan_stays_on_its_line(tmp_path):
+    path = tmp_path / 'vstup.txt'
+    path.write_text("Číslo OP: 123456789\nTel: 123456789\n", encoding='utf-8')
+    assert [entity['type'] for entity in scan_file(str(path), list(PII_PATTERNS))] == ['ČÍSLO_OP', 'TELEFON']
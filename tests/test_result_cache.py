@@ -0,0 +1,23 @@
+from src.czech_anonymization.core import (
+    configure_pseudonymization, detect_and_anonymize_cached, detect_and_anonymize_pii
+)
+from src.czech_anonymization.result_cache import ResultCache
+
+METHOD = "Použít falešná data"
+TEXT = "Smlouvu podepsal Jan Novák, tel. 777 123 456."
+
+def test_fake_results_are_not_shared_between_secrets(tmp_path):
+    path = str(tmp_path / 'vysledky.sqlite')
+    try:
+        results = {}
+        for secret in ('s1', 's2'):
+            configure_pseudonymization(secret=secret)
+            cache = ResultCache(path)
+            cached = detect_and_anonymize_cached(TEXT, ['JMÉNO', 'TELEFON'], METHOD, cache)['anonymized_text']
+            cache.close()
+            configure_pseudonymization(secret=secret)
+            assert cached == detect_and_anonymize_pii(TEXT, ['JMÉNO', 'TELEFON'], METHOD)['anonymized_text']
+            results[secret] = cached
+        assert results['s1'] != results['s2']
+    finally:
+        configure_pseudonymization()